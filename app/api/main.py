@@ -1,7 +1,8 @@
 from fastapi import FastAPI, HTTPException, Request, File, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
 import logging
 import json
@@ -9,49 +10,75 @@ import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 import time
-from collections import defaultdict
-import PyPDF2
-import io
 
-from app.core.database import db
-from app.core.llm import ollama_service
-from app.core.init_db import initialize_database
+from app.core.database import db, async_db
+from app.core.llm import ollama_service, GenerationOverloaded
+from app.core.init_db import initialize_database, VECTOR_INDEX_NAME
+from app.core.vector_index import vector_index, search_chunks_async, SEARCH_MODES, LOCAL_INDEX_MODES
+from app.core.jobs import job_manager, save_upload
+from app.core.retention import delete_documents, apply_retention, run_retention
+from app.core.answer_cache import answer_cache
+from app.core.conversations import conversation_store
+from app.core.batch_query import answer_batch
+from app.core.context import assemble_context
+from app.core.streaming import SSEEncoder, coalesce_tokens
+from app.core.metrics import registry, HTTP_REQUEST_SECONDS, QUERY_SECONDS, QUERY_STAGE_SECONDS, RATE_LIMITED
+from app.core.rate_limit import rate_limiter, client_key
+from app.core.graph_summary import get_graph_summary, get_document_neighborhood
+from app.core.extraction import shutdown_process_pool
+from app.core.config import get_settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 app = FastAPI()
 executor = ThreadPoolExecutor(max_workers=4)  # Adjust based on your CPU cores
 
-# Rate limiting configuration
-RATE_LIMIT_WINDOW = 60  # 1 minute window
-RATE_LIMIT_MAX_REQUESTS = 100  # Maximum requests per window
-rate_limit_store = defaultdict(list)
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    start = time.perf_counter()
+    # Stages record their durations here when timing headers are on
+    request.state.timings = {} if settings.METRICS_TIMING_HEADERS else None
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed, method=request.method, route=route.path if route else "unmatched", status=response.status_code
+    )
+    if request.state.timings is not None:
+        timings = {**request.state.timings, "app": elapsed}
+        response.headers["Server-Timing"] = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+    return response
+
+def record_stage(request: Request, stage: str, start: float) -> float:
+    """Observe a /query stage that began at `start`; returns the time it ended."""
+    now = time.perf_counter()
+    QUERY_STAGE_SECONDS.observe(now - start, stage=stage)
+    timings = getattr(request.state, "timings", None)
+    if timings is not None:
+        timings[stage] = now - start
+    return now
 
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
-    client_ip = request.client.host
-    current_time = time.time()
-    
-    # Clean up old requests
-    rate_limit_store[client_ip] = [
-        req_time for req_time in rate_limit_store[client_ip]
-        if current_time - req_time < RATE_LIMIT_WINDOW
-    ]
-    
-    # Check if rate limit exceeded
-    if len(rate_limit_store[client_ip]) >= RATE_LIMIT_MAX_REQUESTS:
-        raise HTTPException(
+    if rate_limiter is None:
+        return await call_next(request)
+    client = client_key(request.client.host if request.client else None, request.headers.get("x-forwarded-for"))
+    decision = await rate_limiter.check_async(client, request.method, request.url.path)
+    if decision is None:
+        return await call_next(request)
+    if not decision.allowed:
+        RATE_LIMITED.inc(rule=decision.rule.name)
+        # Returned rather than raised: exceptions in middleware bypass FastAPI's handlers
+        return JSONResponse(
             status_code=429,
-            detail="Too many requests. Please try again later."
+            content={"detail": "Too many requests. Please try again later."},
+            headers=decision.headers()
         )
-    
-    # Add current request
-    rate_limit_store[client_ip].append(current_time)
-    
-    # Process request
     response = await call_next(request)
+    response.headers.update(decision.headers())
     return response
 
 class Document(BaseModel):
@@ -60,105 +87,172 @@ class Document(BaseModel):
 
 class Query(BaseModel):
     text: str
+    format: Optional[Literal["json", "compact"]] = None  # Stream format; defaults to STREAM_FORMAT
+    conversation_id: Optional[str] = None  # Continue a conversation started with POST /conversations
 
-async def process_chunk(chunk: str, doc_id: str, chunk_index: int):
-    chunk_id = f"{doc_id}_chunk_{chunk_index}"
-    try:
-        embedding = await asyncio.get_event_loop().run_in_executor(
-            executor,
-            ollama_service.generate_embedding,
-            chunk
-        )
-        await asyncio.get_event_loop().run_in_executor(
-            executor,
-            db.create_chunk,
-            chunk_id,
-            chunk,
-            embedding,
-            doc_id
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Error processing chunk {chunk_index}: {str(e)}", exc_info=True)
-        return False
+class BatchQuestion(BaseModel):
+    id: Optional[str] = None
+    text: str
 
-@app.post("/documents")
-async def ingest_document(file: UploadFile = File(...)):
+class BatchQuery(BaseModel):
+    questions: List[BatchQuestion]
+    limit: int = 5
+    retrieval_only: bool = False
+    stream: bool = False
+
+@app.post("/documents", status_code=202)
+async def ingest_document(file: UploadFile = File(...), doc_id: Optional[str] = None, expires_in: Optional[float] = None):
+    """Accept a document for background ingestion.
+
+    Passing the `doc_id` of an existing document re-ingests it in update
+    mode: only chunks that changed since the last upload are embedded and
+    written, and chunks the new revision no longer contains are removed.
+    With `expires_in`, retention deletes the document that many seconds
+    after this upload.
+    """
+    if expires_in is not None and expires_in <= 0:
+        raise HTTPException(status_code=400, detail="expires_in must be a positive number of seconds")
     try:
         logger.info(f"Received file upload: {file.filename}")
         
-        # Read file content based on file type
-        if file.content_type == "application/pdf":
-            content = await file.read()
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-            text_content = ""
-            for page in pdf_reader.pages:
-                text_content += page.extract_text()
-        else:
-            # For text files
-            content = await file.read()
-            text_content = content.decode('utf-8')
-        
-        if not text_content.strip():
-            raise HTTPException(status_code=400, detail="No text content could be extracted from the file")
-        
-        logger.info(f"Extracted {len(text_content)} characters from file")
+        # Spool the upload to disk so ingestion can outlive the request
+        path = await asyncio.get_event_loop().run_in_executor(
+            executor,
+            save_upload,
+            file.file
+        )
         
         # Create document metadata
         metadata = {
             "filename": file.filename,
             "content_type": file.content_type,
-            "file_size": len(content)
+            "file_size": file.size
         }
+        if expires_in is not None:
+            metadata["expires_at"] = time.time() + expires_in
         
-        doc_id = str(uuid.uuid4())
-        logger.info(f"Created document ID: {doc_id}")
-        
-        # Store document in database
-        await asyncio.get_event_loop().run_in_executor(
-            executor,
-            db.create_document,
-            doc_id,
-            text_content,
-            metadata
-        )
-        
-        # Chunk the document
-        chunks = ollama_service.chunk_text(text_content)
-        logger.info(f"Created {len(chunks)} chunks from document")
-        
-        # Process chunks in parallel
-        tasks = [
-            process_chunk(chunk, doc_id, i)
-            for i, chunk in enumerate(chunks)
-        ]
-        results = await asyncio.gather(*tasks)
+        update = doc_id is not None
+        if update:
+            logger.info(f"Updating document ID: {doc_id}")
+        else:
+            doc_id = str(uuid.uuid4())
+            logger.info(f"Created document ID: {doc_id}")
         
-        if not all(results):
-            raise Exception("Some chunks failed to process")
+        # Extract, chunk, embed and write in a background job
+        job = job_manager.submit(doc_id, path, file.content_type, metadata, executor, update=update)
         
-        logger.info("Document ingestion completed successfully")
-        return {"message": "Document ingested successfully", "doc_id": doc_id}
+        return {
+            "message": "Document accepted for update" if update else "Document accepted for ingestion",
+            "doc_id": doc_id,
+            "job_id": job.id,
+            "status_url": f"/documents/jobs/{job.id}"
+        }
+    except Exception as e:
+        logger.error(f"Error accepting document: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    """Delete a document, its NEXT edges and the chunks no other document contains."""
+    if job_manager.is_ingesting(doc_id):
+        raise HTTPException(status_code=409, detail=f"Document {doc_id} is being ingested")
+    try:
+        report = await asyncio.get_event_loop().run_in_executor(executor, delete_documents, [doc_id])
+    except Exception as e:
+        logger.error(f"Error deleting document {doc_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if not report["documents_deleted"]:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    return {"message": "Document deleted", "doc_id": doc_id, **report}
+
+@app.post("/documents/retention")
+async def run_document_retention(max_age: Optional[float] = None):
+    """Delete expired documents now; `max_age` overrides RETENTION_MAX_AGE (seconds)."""
+    try:
+        return await asyncio.get_event_loop().run_in_executor(executor, apply_retention, max_age)
     except Exception as e:
-        logger.error(f"Error ingesting document: {str(e)}", exc_info=True)
+        logger.error(f"Error applying retention: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job.to_dict()
+
+@app.post("/conversations", status_code=201)
+async def create_conversation():
+    """Start a conversation; pass its id as `conversation_id` to /query."""
+    conversation = conversation_store.create(ollama_service.llm_model)
+    return {"conversation_id": conversation.id, "expires_in": settings.CONVERSATION_TTL}
+
+@app.get("/conversations/{conversation_id}")
+async def get_conversation(conversation_id: str):
+    conversation = conversation_store.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail=f"Unknown conversation: {conversation_id}")
+    return conversation.to_dict()
+
+@app.delete("/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str):
+    if not conversation_store.delete(conversation_id):
+        raise HTTPException(status_code=404, detail=f"Unknown conversation: {conversation_id}")
+    return {"message": "Conversation deleted", "conversation_id": conversation_id}
+
 @app.post("/query")
-async def query_documents(query: Query):
+async def query_documents(query: Query, request: Request):
+    """Answer a question as an SSE stream.
+
+    With a `conversation_id` the answer continues from the model state of
+    the conversation's previous turn. Chunks the conversation has already
+    seen are left out of the prompt, and the answer cache is bypassed.
+    """
+    conversation = None
+    if query.conversation_id is not None:
+        conversation = conversation_store.get(query.conversation_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail=f"Unknown conversation: {query.conversation_id}")
     try:
-        logger.info(f"Received query: {query.text}")
+        query_start = time.perf_counter()
+        logger.debug(f"Received query: {query.text}")
         
         # Generate embedding for the query
-        query_embedding = ollama_service.generate_embedding(query.text)
-        logger.info("Generated query embedding")
+        query_embedding = await ollama_service.generate_embedding_async(query.text)
+        stage_start = record_stage(request, "embed", query_start)
+        logger.debug("Generated query embedding")
         
         # Search for similar chunks
-        similar_chunks = db.search_similar_chunks(query_embedding)
-        logger.info(f"Found {len(similar_chunks) if similar_chunks else 0} similar chunks")
+        similar_chunks = await search_chunks_async(query_embedding, settings.CONTEXT_CANDIDATES)
+        stage_start = record_stage(request, "search", stage_start)
+        logger.debug(f"Found {len(similar_chunks) if similar_chunks else 0} similar chunks")
+        
+        token_budget = None
+        if conversation is not None:
+            # The kept model state shares num_ctx with the new prompt; past it Ollama truncates silently
+            token_budget = settings.CONTEXT_TOKEN_BUDGET - len(conversation.context or ())
+            if token_budget < settings.CONVERSATION_MIN_CONTEXT_BUDGET:
+                logger.info(
+                    f"Resetting conversation {conversation.id}: {len(conversation.context)} kept tokens leave "
+                    f"{token_budget} of {settings.CONTEXT_TOKEN_BUDGET} for context"
+                )
+                conversation.reset_context()
+                token_budget = settings.CONTEXT_TOKEN_BUDGET
+            # The model already holds these from earlier turns
+            similar_chunks = [chunk for chunk in similar_chunks or [] if chunk["id"] not in conversation.chunk_ids]
+        
+        # Dedupe, merge and pack the chunks into the prompt's token budget
+        context, chunk_ids, context_stats = assemble_context(similar_chunks or [], token_budget=token_budget)
+        stage_start = record_stage(request, "context", stage_start)
+        logger.debug(
+            f"Assembled context of {context_stats.tokens} tokens from {context_stats.used} of "
+            f"{context_stats.retrieved} chunks ({context_stats.retrieved_tokens - context_stats.tokens} tokens saved)"
+        )
         
-        if not similar_chunks:
+        encoder = SSEEncoder(query.format)
+        if not chunk_ids and (conversation is None or not conversation.turns):
             return StreamingResponse(
-                iter([f"data: {json.dumps({'chunk': 'No relevant information found.'})}\n\n"]),
+                iter([encoder.text("No relevant information found.")]),
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
@@ -167,35 +261,108 @@ async def query_documents(query: Query):
                 }
             )
         
-        # Combine context from similar chunks
-        context = "\n".join([chunk["content"] for chunk in similar_chunks])
-        logger.info("Combined context from chunks")
+        # Sent first so the client can show sources while the answer streams
+        retrieved = {chunk["id"]: chunk for chunk in similar_chunks}
+        sources = [
+            {
+                "id": chunk_id,
+                "score": round(retrieved[chunk_id]["score"], 4),
+                # Where the chunk sits in each document: page and character offsets
+                "locations": [
+                    {key: location.get(key) for key in ("doc_id", "page", "start", "end")}
+                    for location in retrieved[chunk_id].get("locations") or []
+                ]
+            }
+            for chunk_id in chunk_ids
+        ]
+        
+        # Without kept model state, as in a conversation's first turn, the prompt stands alone and is cacheable
+        use_cache = settings.ANSWER_CACHE_ENABLED and (conversation is None or not conversation.context)
+        cached = answer_cache.get(query_embedding, chunk_ids) if use_cache else None
         
-        async def generate_stream():
-            try:
-                # Stream the response using Ollama's streaming capability
-                async for chunk in ollama_service.generate_streaming_response(query.text, context):
+        async def replay_stream():
+            # Replay a cached answer in the same event format as a generation
+            yield encoder.sources(sources)
+            yield encoder.text(cached.answer)
+            if conversation is not None:
+                conversation.add_turn(query.text, cached.answer, chunk_ids, replayed=True)
+            yield encoder.context(cached.context, context_stats.to_dict())
+            QUERY_SECONDS.observe(time.perf_counter() - query_start, cached="true")
+        
+        slot = None
+        if conversation is not None and not conversation.begin_turn():
+            return JSONResponse(status_code=409, content={"detail": "This conversation is already answering a question"})
+        try:
+            if cached is None:
+                # Admit the generation before committing to a 200, so overload gets an early 503
+                # The same client the rate limiter counts, so users behind the proxy get separate queues
+                client_id = client_key(request.client.host if request.client else None, request.headers.get("x-forwarded-for"))
+                try:
+                    slot = await ollama_service.scheduler().acquire(client_id)
+                    record_stage(request, "queue", stage_start)
+                except GenerationOverloaded as e:
+                    if conversation is not None:
+                        conversation.end_turn()
+                    logger.warning(f"Rejecting query: {str(e)}")
+                    return JSONResponse(
+                        status_code=503,
+                        content={"detail": str(e)},
+                        headers={"Retry-After": str(e.retry_after)}
+                    )
+        
+            async def answer_tokens():
+                async for chunk in ollama_service.generate_streaming_response(query.text, context, slot=slot, conversation=conversation):
                     if chunk and chunk.strip():  # Only send non-empty chunks
-                        message = json.dumps({'chunk': chunk})
-                        yield f"data: {message}\n\n"
+                        yield chunk
+        
+            async def generate_stream():
+                try:
+                    yield encoder.sources(sources)
+                    answer = []
+                    # Stream the response, coalescing tokens into fewer, larger frames
+                    async for text in coalesce_tokens(answer_tokens()):
+                        answer.append(text)
+                        yield encoder.text(text)
+                
+                    if use_cache and answer:
+                        answer_cache.put(query_embedding, chunk_ids, "".join(answer), context)
+                    if conversation is not None:
+                        conversation.add_turn(query.text, "".join(answer), chunk_ids)
                 
-                # Send the context at the end
-                context_message = json.dumps({'context': context})
-                yield f"data: {context_message}\n\n"
-            except Exception as e:
-                logger.error(f"Error in stream generation: {str(e)}")
-                error_message = json.dumps({'chunk': 'Error generating response.'})
-                yield f"data: {error_message}\n\n"
+                    # Send the context at the end
+                    yield encoder.context(context, context_stats.to_dict())
+                    QUERY_SECONDS.observe(time.perf_counter() - query_start, cached="false")
+                except Exception as e:
+                    logger.error(f"Error in stream generation: {str(e)}")
+                    yield encoder.text("Error generating response.")
         
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
-        )
+            if cached is not None:
+                logger.debug("Answering query from the answer cache")
+        
+            def finish():
+                if slot is not None:
+                    slot.release()
+                if conversation is not None:
+                    conversation.end_turn()
+        
+            return StreamingResponse(
+                replay_stream() if cached is not None else generate_stream(),
+                media_type="text/event-stream",
+                headers={
+                    "Cache-Control": "no-cache",
+                    "Connection": "keep-alive",
+                    "X-Accel-Buffering": "no"
+                },
+                # Frees the slot and the conversation even if the client disconnects before the stream starts
+                background=BackgroundTask(finish)
+            )
+        except BaseException:
+            # Nothing owns the slot or the turn until the response is handed off
+            if slot is not None:
+                slot.release()
+            if conversation is not None:
+                conversation.end_turn()
+            raise
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}", exc_info=True)
         return StreamingResponse(
@@ -208,93 +375,104 @@ async def query_documents(query: Query):
             }
         )
 
+@app.post("/query/batch")
+async def query_batch(batch: BatchQuery):
+    """Answer many questions with one embedding and retrieval pass.
+
+    Results carry each question's `id` (its index if none was given). With
+    `stream` they are sent as NDJSON lines as soon as each one completes;
+    otherwise they are returned together in input order. `retrieval_only`
+    skips generation and returns just the retrieved chunks.
+    """
+    if not batch.questions:
+        raise HTTPException(status_code=400, detail="questions must not be empty")
+    if len(batch.questions) > settings.QUERY_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.QUERY_BATCH_MAX_QUESTIONS} questions per batch")
+    questions = [
+        {"id": question.id if question.id is not None else str(i), "text": question.text}
+        for i, question in enumerate(batch.questions)
+    ]
+    if len({question["id"] for question in questions}) != len(questions):
+        raise HTTPException(status_code=400, detail="Question ids must be unique")
+    limit = max(1, min(batch.limit, 50))
+    logger.info(f"Received batch of {len(questions)} questions")
+    results = answer_batch(questions, limit, batch.retrieval_only)
+    try:
+        # Retrieval runs before the first result, so its failures surface as errors
+        first = await results.__anext__()
+    except Exception as e:
+        logger.error(f"Error processing query batch: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if batch.stream:
+        async def stream_results():
+            yield json.dumps(first) + "\n"
+            async for result in results:
+                yield json.dumps(result) + "\n"
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+    collected = {first["id"]: first}
+    async for result in results:
+        collected[result["id"]] = result
+    return {"results": [collected[question["id"]] for question in questions]}
+
+@app.get("/query/cache")
+async def get_answer_cache_stats():
+    return answer_cache.stats()
+
+@app.get("/query/scheduler")
+async def get_scheduler_stats():
+    """Queue depth, admissions, rejections and wait times of the generation scheduler."""
+    return ollama_service.scheduler().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for the query, ingestion, Ollama and Neo4j paths."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
+    """Readiness check: 503 while the vector index Neo4j search needs is not ONLINE."""
     try:
         # Test Neo4j connection
-        with db.get_session() as session:
-            session.run("RETURN 1")
-        return {"status": "healthy", "neo4j": "connected"}
+        async with await async_db.get_session() as session:
+            await session.run("RETURN 1")
+        index = await async_db.get_index_status(VECTOR_INDEX_NAME) or {"state": "MISSING", "population_percent": 0.0}
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    ready = index["state"] == "ONLINE" or settings.VECTOR_SEARCH_MODE == "local"
+    body = {"status": "healthy" if ready else "starting", "neo4j": "connected", "vector_index": index}
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
 
 @app.get("/graph")
-async def get_graph_data():
+async def get_graph_data(limit: int = None, cursor: Optional[str] = None, skip: int = 0,
+                         format: str = "json", include_embeddings: bool = False,
+                         include_content: bool = False):
+    """Return one page of graph data.
+
+    `format=json` returns `{"nodes", "relationships", "next_cursor"}`;
+    `format=ndjson` streams one JSON object per line tagged with a `kind`
+    of node, relationship or page.
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    limit = max(1, min(limit or settings.GRAPH_PAGE_SIZE, settings.GRAPH_MAX_PAGE_SIZE))
+    pages = db.iter_graph(
+        limit,
+        cursor=cursor,
+        skip=max(0, skip),
+        include_embeddings=include_embeddings,
+        include_content=include_content,
+        preview_chars=settings.GRAPH_PREVIEW_CHARS
+    )
     try:
-        with db.get_session() as session:
-            # Query to get all nodes and their properties, and all relationships
-            query = """
-            MATCH (n)
-            OPTIONAL MATCH (n)-[r]->(m)
-            WITH n, r, m,
-                 [label in labels(n) | label] as nodeLabels,
-                 [prop in keys(n) | {key: prop, value: n[prop]}] as nodeProps,
-                 CASE WHEN r IS NOT NULL THEN [prop in keys(r) | {key: prop, value: r[prop]}] ELSE [] END as relProps
-            RETURN n, r, m, nodeLabels, nodeProps, relProps
-            ORDER BY n.id
-            """
-            result = session.run(query)
-            
-            # Process the results
-            nodes = []
-            relationships = []
-            node_ids = set()  # Keep track of processed nodes to avoid duplicates
-            
-            for record in result:
-                try:
-                    # Process source node
-                    source_node = record['n']
-                    if source_node.id not in node_ids:
-                        node_ids.add(source_node.id)
-                        node_label = source_node.get('name') or source_node.get('title') or source_node.get('label') or 'Unnamed'
-                        node_type = record['nodeLabels'][0] if record['nodeLabels'] else 'Unknown'
-                        nodes.append({
-                            'id': str(source_node.id),
-                            'label': str(node_label),
-                            'type': node_type,
-                            'properties': {str(prop['key']): prop['value'] for prop in record['nodeProps'] if prop['value'] is not None}
-                        })
-                    
-                    # Process target node and relationship if they exist
-                    if record['m'] is not None:
-                        target_node = record['m']
-                        if target_node.id not in node_ids:
-                            node_ids.add(target_node.id)
-                            node_label = target_node.get('name') or target_node.get('title') or target_node.get('label') or 'Unnamed'
-                            node_type = record['nodeLabels'][0] if record['nodeLabels'] else 'Unknown'
-                            nodes.append({
-                                'id': str(target_node.id),
-                                'label': str(node_label),
-                                'type': node_type,
-                                'properties': {str(prop['key']): prop['value'] for prop in record['nodeProps'] if prop['value'] is not None}
-                            })
-                        
-                        # Add relationship
-                        if record['r'] is not None:
-                            rel_type = type(record['r']).__name__
-                            relationships.append({
-                                'startNode': str(source_node.id),
-                                'endNode': str(target_node.id),
-                                'type': rel_type,
-                                'properties': {str(prop['key']): prop['value'] for prop in record['relProps'] if prop['value'] is not None}
-                            })
-                except Exception as e:
-                    logger.warning(f"Error processing record: {str(e)}")
-                    continue
-            
-            if not nodes:
-                logger.warning("No nodes found in the graph")
-                return {
-                    'nodes': [],
-                    'relationships': []
-                }
-            
-            logger.info(f"Retrieved {len(nodes)} nodes and {len(relationships)} relationships")
-            return {
-                'nodes': nodes,
-                'relationships': relationships
-            }
+        # Run the query before committing to a 200 so failures still surface as errors
+        first = await asyncio.get_event_loop().run_in_executor(executor, next, pages)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching graph data: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -302,6 +480,85 @@ async def get_graph_data():
             detail=f"Failed to fetch graph data: {str(e)}"
         )
 
+    async def events():
+        yield first
+        loop = asyncio.get_running_loop()
+        pending = None
+        try:
+            while True:
+                # Shielded, so a disconnect doesn't abandon a read still running on the executor
+                pending = loop.run_in_executor(executor, next, pages, None)
+                event = await asyncio.shield(pending)
+                if event is None:
+                    return
+                yield event
+        finally:
+            # Closes the Neo4j session when the client disconnects mid-page, once no read is in flight
+            if pending is not None and not pending.done():
+                pending.add_done_callback(lambda _: executor.submit(pages.close))
+            else:
+                executor.submit(pages.close)
+
+    async def stream_ndjson():
+        async for kind, item in events():
+            yield json.dumps({"kind": kind, **item}, default=str) + "\n"
+
+    async def stream_json():
+        yield '{"nodes": ['
+        section = "nodes"
+        separator = ""
+        async for kind, item in events():
+            if kind == "relationship" and section == "nodes":
+                yield '], "relationships": ['
+                section, separator = "relationships", ""
+            if kind == "page":
+                if section == "nodes":
+                    yield '], "relationships": ['
+                yield f'], "next_cursor": {json.dumps(item["next_cursor"])}}}'
+                return
+            yield separator + json.dumps(item, default=str)
+            separator = ","
+
+    if format == "ndjson":
+        return StreamingResponse(stream_ndjson(), media_type="application/x-ndjson")
+    return StreamingResponse(stream_json(), media_type="application/json")
+
+@app.get("/graph/summary")
+async def get_graph_summary_data(top_n: int = None):
+    """Return a level-of-detail view of the graph.
+
+    Chunks are collapsed into their documents; the top documents by degree
+    are returned with chunk counts, along with aggregated document links and
+    overall label, relationship and degree statistics.
+    """
+    top_n = max(1, min(top_n or settings.GRAPH_SUMMARY_TOP_N, settings.GRAPH_MAX_PAGE_SIZE))
+    try:
+        return await asyncio.get_event_loop().run_in_executor(executor, get_graph_summary, top_n)
+    except Exception as e:
+        logger.error(f"Error fetching graph summary: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch graph summary: {str(e)}"
+        )
+
+@app.get("/graph/documents/{doc_id}")
+async def get_document_graph(doc_id: str, limit: int = None):
+    """Expand one document into its chunks for on-demand drill-down."""
+    limit = max(1, min(limit or settings.GRAPH_DOCUMENT_CHUNK_LIMIT, settings.GRAPH_MAX_PAGE_SIZE))
+    try:
+        neighborhood = await asyncio.get_event_loop().run_in_executor(
+            executor, get_document_neighborhood, doc_id, limit
+        )
+    except Exception as e:
+        logger.error(f"Error fetching document graph: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch document graph: {str(e)}"
+        )
+    if neighborhood is None:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    return neighborhood
+
 @app.get("/")
 async def root():
     """Root endpoint that returns API information."""
@@ -309,15 +566,52 @@ async def root():
         "message": "Welcome to the Document Query API",
         "endpoints": {
             "/documents": "POST - Ingest a new document",
+            "/documents/{doc_id}": "DELETE - Delete a document and the chunks only it contains",
+            "/documents/retention": "POST - Delete expired documents now",
+            "/documents/jobs/{job_id}": "GET - Get ingestion job progress",
             "/query": "POST - Query documents",
+            "/query/batch": "POST - Answer or retrieve for many questions at once",
+            "/query/cache": "GET - Answer cache statistics",
+            "/query/scheduler": "GET - Generation queue statistics",
+            "/conversations": "POST - Start a conversation for follow-up questions",
+            "/conversations/{conversation_id}": "GET - Conversation turns; DELETE - End a conversation",
             "/health": "GET - Check API health",
-            "/graph": "GET - Get graph data"
+            "/metrics": "GET - Prometheus metrics",
+            "/graph": "GET - Get a page of graph data (json or ndjson)",
+            "/graph/summary": "GET - Get an aggregated overview of the graph",
+            "/graph/documents/{doc_id}": "GET - Expand one document into its chunks"
         }
     }
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting up API service")
-    db.create_constraints()
-    initialize_database()
-    logger.info("API service startup complete") 
\ No newline at end of file
+    await asyncio.get_event_loop().run_in_executor(executor, initialize_database)
+    await async_db.connect_with_retry()
+    if settings.LLM_WARMUP_ENABLED:
+        await ollama_service.warm_up()
+    if settings.VECTOR_SEARCH_MODE not in SEARCH_MODES:
+        raise ValueError(f"VECTOR_SEARCH_MODE must be one of {SEARCH_MODES}, got {settings.VECTOR_SEARCH_MODE!r}")
+    if settings.VECTOR_SEARCH_MODE in LOCAL_INDEX_MODES:
+        await asyncio.get_event_loop().run_in_executor(
+            executor,
+            vector_index.load_or_warm,
+            settings.VECTOR_INDEX_PATH
+        )
+    if settings.RETENTION_INTERVAL > 0:
+        app.state.retention_task = asyncio.create_task(run_retention(executor))
+    logger.info("API service startup complete")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("Shutting down API service")
+    if getattr(app.state, "retention_task", None) is not None:
+        app.state.retention_task.cancel()
+    await job_manager.shutdown()
+    shutdown_process_pool()
+    await ollama_service.close()
+    await async_db.close()
+    if settings.VECTOR_SEARCH_MODE in LOCAL_INDEX_MODES:
+        vector_index.save(settings.VECTOR_INDEX_PATH)
+    executor.shutdown(wait=False)
+    db.close() 
\ No newline at end of file
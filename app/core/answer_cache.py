@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from .config import get_settings
+from .metrics import ANSWER_CACHE_LOOKUPS
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class CachedAnswer:
+    def __init__(self, embedding: np.ndarray, chunk_ids: List[str], answer: str, context: str):
+        self.embedding = embedding
+        self.chunk_ids = frozenset(chunk_ids)
+        self.answer = answer
+        self.context = context
+        self.created_at = time.time()
+
+
+class AnswerCache:
+    """Semantic cache of generated answers keyed by query-embedding similarity.
+
+    A lookup hits when a cached query's embedding is within the cosine
+    threshold of the new one and retrieval returned the same chunk set, so a
+    reworded question can replay the stored answer instead of running a
+    generation. Entries expire after a TTL, the least recently used entry is
+    evicted when full, and the whole cache is dropped when new chunks are
+    ingested.
+    """
+
+    def __init__(self, threshold: float, ttl: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+        # Stacked embeddings of the current entries, rebuilt lazily after changes
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[int] = []
+
+    @staticmethod
+    def _normalize(embedding: list) -> np.ndarray:
+        vector = np.array(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [key for key, entry in self._entries.items() if entry.created_at < cutoff]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def get(self, embedding: list, chunk_ids: List[str]) -> Optional[CachedAnswer]:
+        query = self._normalize(embedding)
+        wanted = frozenset(chunk_ids)
+        with self._lock:
+            self._expire()
+            if self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[key].embedding for key in self._keys])
+                scores = self._matrix @ query
+                for i in np.argsort(scores)[::-1]:
+                    if scores[i] < self.threshold:
+                        break
+                    key = self._keys[i]
+                    entry = self._entries[key]
+                    if entry.chunk_ids == wanted:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        ANSWER_CACHE_LOOKUPS.inc(result="hit")
+                        return entry
+            self.misses += 1
+            ANSWER_CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+    def put(self, embedding: list, chunk_ids: List[str], answer: str, context: str):
+        entry = CachedAnswer(self._normalize(embedding), chunk_ids, answer, context)
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        with self._lock:
+            if self._entries:
+                self._entries.clear()
+                self._matrix = None
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+
+answer_cache = AnswerCache(
+    settings.ANSWER_CACHE_THRESHOLD,
+    settings.ANSWER_CACHE_TTL,
+    settings.ANSWER_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+from .answer_cache import answer_cache
+from .config import get_settings
+from .context import assemble_context
+from .llm import GenerationOverloaded, ollama_service
+from .vector_index import search_chunks_batch_async
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+async def retrieve_batch(questions: List[str], limit: int = 5) -> Tuple[List[List[dict]], List[list]]:
+    """Embed all questions in batched requests and retrieve chunks for each in one search pass.
+
+    Returns the chunks and the embedding of every question, in input order.
+    """
+    embeddings = await ollama_service.embed_many(questions)
+    return await search_chunks_batch_async(embeddings, limit), embeddings
+
+
+async def answer_batch(questions: List[dict], limit: int = 5, retrieval_only: bool = False,
+                       concurrency: Optional[int] = None) -> AsyncIterator[dict]:
+    """Answer {"id", "text"} questions, yielding each result as it completes.
+
+    Retrieval runs once for the whole batch; generations then run with at
+    most `concurrency` in flight and go through the answer cache like
+    `/query`. A generation the scheduler turns away is retried after its
+    `retry_after`, up to QUERY_BATCH_OVERLOAD_RETRIES times. With `retrieval_only` no generation runs and results come back
+    in input order.
+    """
+    start = time.perf_counter()
+    chunk_lists, embeddings = await retrieve_batch([question["text"] for question in questions], limit)
+    logger.info(f"Retrieved chunks for {len(questions)} questions in {time.perf_counter() - start:.2f}s")
+
+    def result(question: dict, chunks: List[dict]) -> dict:
+        return {
+            "id": question["id"],
+            "question": question["text"],
+            "chunks": [{"id": chunk["id"], "score": chunk["score"], "content": chunk["content"]} for chunk in chunks],
+            "answer": None,
+            "context_stats": None,
+            "cached": False,
+            "error": None
+        }
+
+    if retrieval_only:
+        for question, chunks in zip(questions, chunk_lists):
+            yield result(question, chunks)
+        return
+
+    semaphore = asyncio.Semaphore(concurrency or settings.QUERY_BATCH_CONCURRENCY)
+
+    async def answer(question: dict, chunks: List[dict], embedding: list) -> dict:
+        item = result(question, chunks)
+        context, chunk_ids, context_stats = assemble_context(chunks)
+        item["context_stats"] = context_stats.to_dict()
+        if not chunk_ids:
+            item["answer"] = "No relevant information found."
+            return item
+        cached = answer_cache.get(embedding, chunk_ids) if settings.ANSWER_CACHE_ENABLED else None
+        if cached is not None:
+            item["answer"], item["cached"] = cached.answer, True
+            return item
+        try:
+            for attempt in range(settings.QUERY_BATCH_OVERLOAD_RETRIES + 1):
+                try:
+                    async with semaphore:
+                        # One scheduler client for the whole batch, so interactive queries keep their fair share
+                        item["answer"] = await ollama_service.generate_response_async(question["text"], context, client_id="batch")
+                    break
+                except GenerationOverloaded as e:
+                    # A batch can wait; back off instead of failing the question under interactive load
+                    if attempt == settings.QUERY_BATCH_OVERLOAD_RETRIES:
+                        raise
+                    logger.info(f"Batch question {question['id']} not admitted, retrying in {e.retry_after}s: {str(e)}")
+                    await asyncio.sleep(e.retry_after)
+            if settings.ANSWER_CACHE_ENABLED and item["answer"]:
+                answer_cache.put(embedding, chunk_ids, item["answer"], context)
+        except Exception as e:
+            logger.error(f"Error answering batch question {question['id']}: {str(e)}")
+            item["error"] = str(e)
+        return item
+
+    tasks = [
+        asyncio.ensure_future(answer(question, chunks, embedding))
+        for question, chunks, embedding in zip(questions, chunk_lists, embeddings)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
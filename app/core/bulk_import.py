@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Executor
+from typing import Iterator, List, Optional, Set
+
+from .config import get_settings
+from .database import document_expiry
+from .embedding_cache import content_hash
+from .extraction import extract_chunks, get_process_pool, shutdown_process_pool
+from .llm import ollama_service
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {".pdf": "application/pdf", ".txt": "text/plain", ".md": "text/markdown"}
+
+# Namespace for deterministic document ids, so a resumed run assigns the same ids
+IMPORT_NAMESPACE = uuid.UUID("6f1c3c2e-8a55-4d2e-9a7b-2f0f6c1d9e41")
+
+
+class ImportSource:
+    def __init__(self, doc_id: str, metadata: dict, source: str, is_pdf: bool = False, is_text: bool = False):
+        self.doc_id = doc_id
+        self.metadata = metadata
+        self.source = source
+        self.is_pdf = is_pdf
+        self.is_text = is_text
+
+
+def iter_directory(root: str) -> Iterator[ImportSource]:
+    """Yield the supported files under `root` in a stable order."""
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            content_type = SUPPORTED_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+            if content_type is None:
+                continue
+            path = os.path.join(directory, filename)
+            relative = os.path.relpath(path, root)
+            yield ImportSource(
+                str(uuid.uuid5(IMPORT_NAMESPACE, f"file:{relative}")),
+                {"filename": filename, "content_type": content_type, "file_size": os.path.getsize(path), "path": relative},
+                path,
+                is_pdf=content_type == "application/pdf"
+            )
+
+
+def iter_jsonl(path: str) -> Iterator[ImportSource]:
+    """Yield one document per line of `{"text": ..., "id"?: ..., "metadata"?: {...}}`."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            doc_id = str(record.get("id") or uuid.uuid5(IMPORT_NAMESPACE, f"jsonl:{os.path.basename(path)}:{line_number}"))
+            yield ImportSource(doc_id, record.get("metadata") or {}, record["text"], is_text=True)
+
+
+class Checkpoint:
+    """Append-only record of imported document ids, so a rerun skips them."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def mark(self, doc_ids: List[str]):
+        self._file.write("".join(f"{doc_id}\n" for doc_id in doc_ids))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(doc_ids)
+
+    def close(self):
+        self._file.close()
+
+
+class Neo4jWriter:
+    def __init__(self):
+        # Imported here so CSV mode runs without a reachable Neo4j
+        from .database import db
+        self.db = db
+        self.db.create_constraints()
+
+    def write(self, documents: List[dict], rows: List[dict]):
+        self.db.import_batch(documents, rows)
+
+    def close(self):
+        self.db.close()
+
+
+class CsvWriter:
+    """Write `neo4j-admin database import` CSVs instead of writing to Neo4j.
+
+    Headers go in separate files so data files can be appended to across
+    resumed runs. Embeddings are written as `;`-separated float arrays.
+    Chunks shared by several documents repeat, hence --skip-duplicate-nodes,
+    and chunk content keeps its line breaks, hence --multiline-fields.
+    """
+
+    FILES = {
+        "documents": ["id:ID(Document)", "metadata", "ingested_at:double", "expires_at:double", ":LABEL"],
+        "chunks": ["id:ID(Chunk)", "content", "embedding:float[]", ":LABEL"],
+        "contains": [":START_ID(Document)", ":END_ID(Chunk)", "position:int", "start:int", "end:int", "page:int", ":TYPE"],
+        "next": [":START_ID(Chunk)", ":END_ID(Chunk)", "doc_id", "position:int", ":TYPE"],
+    }
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._files = {}
+        self._writers = {}
+        for name, header in self.FILES.items():
+            with open(os.path.join(directory, f"{name}_header.csv"), "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(header)
+            self._files[name] = open(os.path.join(directory, f"{name}.csv"), "a", newline="", encoding="utf-8")
+            self._writers[name] = csv.writer(self._files[name])
+
+    def write(self, documents: List[dict], rows: List[dict]):
+        ingested_at = time.time()
+        for doc in documents:
+            expires_at = document_expiry(doc.get("metadata"))
+            self._writers["documents"].writerow([
+                doc["id"], json.dumps(doc["metadata"]) if doc.get("metadata") else "", ingested_at,
+                "" if expires_at is None else expires_at, "Document"
+            ])
+        previous = None
+        for row in rows:
+            self._writers["chunks"].writerow([row["id"], row["content"], ";".join(map(repr, row["embedding"])), "Chunk"])
+            self._writers["contains"].writerow([
+                row["doc_id"], row["id"], row["position"], row["start"], row["end"],
+                "" if row["page"] is None else row["page"], "CONTAINS"
+            ])
+            if previous is not None and previous["doc_id"] == row["doc_id"] and previous["position"] == row["position"] - 1:
+                self._writers["next"].writerow([previous["id"], row["id"], row["doc_id"], previous["position"], "NEXT"])
+            previous = row
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+    def import_command(self) -> str:
+        def files(name):
+            return f"{os.path.join(self.directory, name + '_header.csv')},{os.path.join(self.directory, name + '.csv')}"
+        return (
+            "neo4j-admin database import full neo4j --skip-duplicate-nodes=true --multiline-fields=true "
+            f"--nodes=Document={files('documents')} --nodes=Chunk={files('chunks')} "
+            f"--relationships=CONTAINS={files('contains')} --relationships=NEXT={files('next')}"
+        )
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+
+class BulkImporter:
+    """Import a corpus offline: extract and chunk in a process pool, embed in
+    batches, and write documents in large UNWIND transactions.
+
+    Documents are grouped until a batch holds `batch_chunks` chunks; writing
+    one batch overlaps with embedding the next. A document id is added to the
+    checkpoint once its chunks are written, and embeddings of a batch that
+    was interrupted are served from the embedding cache on the rerun.
+    """
+
+    def __init__(self, writer, checkpoint: Checkpoint, pool: Executor, batch_chunks: int, lookahead: int):
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.pool = pool
+        self.batch_chunks = batch_chunks
+        self.lookahead = lookahead
+        self.documents = 0
+        self.chunks = 0
+        self.characters = 0
+        self.skipped = 0
+        self.failed: List[str] = []
+        self.started_at: Optional[float] = None
+        self._tokens_at_start = 0
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        tokens = ollama_service.embedding_tokens - self._tokens_at_start
+
+        def rate(count):
+            return round(count / elapsed, 2) if elapsed > 0 else 0.0
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "characters": self.characters,
+            "embedding_tokens": tokens,
+            "skipped": self.skipped,
+            "failed": len(self.failed),
+            "seconds": round(elapsed, 2),
+            "docs_per_second": rate(self.documents),
+            "chunks_per_second": rate(self.chunks),
+            "embedding_tokens_per_second": rate(tokens),
+        }
+
+    async def _extracted(self, sources: Iterator[ImportSource]):
+        """Yield (source, chunks) in order, keeping `lookahead` extractions in flight."""
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        sources = iter(sources)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < self.lookahead:
+                source = next(sources, None)
+                if source is None:
+                    exhausted = True
+                elif source.doc_id in self.checkpoint.done:
+                    self.skipped += 1
+                else:
+                    pending.append((source, loop.run_in_executor(
+                        self.pool, extract_chunks, source.source, source.is_pdf, source.is_text
+                    )))
+            if not pending:
+                return
+            source, future = pending.popleft()
+            try:
+                yield source, await future
+            except Exception as e:
+                logger.error(f"Failed to extract {source.metadata.get('filename') or source.doc_id}: {str(e)}")
+                self.failed.append(source.doc_id)
+
+    async def _flush(self, batch: List[tuple]) -> Optional[asyncio.Future]:
+        """Embed a batch and start writing it; returns the write future."""
+        texts = [chunk.text for _, chunks in batch for chunk in chunks]
+        embeddings = await ollama_service.embed_many(texts)
+        documents, rows = [], []
+        offset = 0
+        for source, chunks in batch:
+            documents.append({"id": source.doc_id, "metadata": source.metadata})
+            for index, chunk in enumerate(chunks):
+                rows.append({
+                    "id": content_hash(chunk.text),
+                    "doc_id": source.doc_id,
+                    "content": chunk.text,
+                    "embedding": embeddings[offset],
+                    "position": index,
+                    "start": chunk.start,
+                    "end": chunk.end,
+                    "page": chunk.page
+                })
+                offset += 1
+
+        def write():
+            self.writer.write(documents, rows)
+            self.checkpoint.mark([doc["id"] for doc in documents])
+            self.documents += len(documents)
+            self.chunks += len(rows)
+            self.characters += sum(len(row["content"]) for row in rows)
+            logger.info(f"Imported {self.documents} documents: {self.stats()}")
+
+        return asyncio.get_running_loop().run_in_executor(None, write)
+
+    async def run(self, sources: Iterator[ImportSource]) -> dict:
+        self.started_at = time.perf_counter()
+        self._tokens_at_start = ollama_service.embedding_tokens
+        batch, batch_size = [], 0
+        writing: Optional[asyncio.Future] = None
+        async for source, chunks in self._extracted(sources):
+            if not chunks:
+                logger.warning(f"No text extracted from {source.metadata.get('filename') or source.doc_id}")
+                self.failed.append(source.doc_id)
+                continue
+            batch.append((source, chunks))
+            batch_size += len(chunks)
+            if batch_size >= self.batch_chunks:
+                next_write = await self._flush(batch)
+                if writing is not None:
+                    await writing
+                writing = next_write
+                batch, batch_size = [], 0
+        if batch:
+            next_write = await self._flush(batch)
+            if writing is not None:
+                await writing
+            writing = next_write
+        if writing is not None:
+            await writing
+        return self.stats()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk-import a directory of PDF/text files or a JSONL corpus.")
+    parser.add_argument("input", help="Directory to walk, or a .jsonl file with one {\"text\", \"id\", \"metadata\"} record per line")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Extraction and chunking processes")
+    parser.add_argument("--batch-chunks", type=int, default=settings.NEO4J_WRITE_BATCH_SIZE * 4,
+                        help="Chunks embedded and written per batch")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <input>.checkpoint)")
+    parser.add_argument("--csv-dir", help="Write neo4j-admin import CSVs here instead of writing to Neo4j")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.isdir(args.input):
+        sources = iter_directory(args.input)
+    else:
+        sources = iter_jsonl(args.input)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input.rstrip(os.sep)}.checkpoint")
+    if checkpoint.done:
+        logger.info(f"Resuming: {len(checkpoint.done)} documents already imported")
+    if args.csv_dir:
+        writer = CsvWriter(args.csv_dir)
+    else:
+        writer = Neo4jWriter()
+    importer = BulkImporter(writer, checkpoint, get_process_pool(args.workers), args.batch_chunks, args.workers * 4)
+
+    async def run():
+        try:
+            return await importer.run(sources)
+        finally:
+            await ollama_service.close()
+
+    try:
+        stats = asyncio.run(run())
+    finally:
+        shutdown_process_pool()
+        writer.close()
+        checkpoint.close()
+    print(json.dumps(stats, indent=2))
+    if isinstance(writer, CsvWriter):
+        print(f"Load with: {writer.import_command()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import bisect
+import re
+from typing import Iterable, Iterator, List, Optional
+
+from .config import get_settings
+
+settings = get_settings()
+
+BOUNDARY_MODES = ("word", "sentence", "paragraph")
+
+_NON_SPACE = re.compile(r"\S")
+_SPACE = re.compile(r"\s")
+_WORD_BREAKS = (" ", "\n", "\t", "\r")
+_SENTENCE_ENDS = ".!?"
+# Closing quotes and brackets kept with the sentence they end
+_CLOSERS = "\"')]\u201d\u2019"
+_PARAGRAPH_BREAKS = ("\n\n", "\n\r\n")
+# A sentence or paragraph break is only used if it keeps at least this share of a full chunk
+_MIN_FILL = 0.5
+
+
+def _sentence_end(buffer: str, floor: int, limit: int) -> int:
+    """Return the end of the last sentence in `buffer[floor:limit]`, or -1.
+
+    A sentence ends at a terminator, plus any closers after it, that is
+    followed by whitespace; `buffer[limit]` must exist.
+    """
+    best = -1
+    for terminator in _SENTENCE_ENDS:
+        index = buffer.rfind(terminator, floor, limit)
+        while index > best:
+            end = index + 1
+            while end < limit and buffer[end] in _CLOSERS:
+                end += 1
+            if buffer[end].isspace():
+                best = end
+                break
+            index = buffer.rfind(terminator, floor, index)
+    return best
+
+
+class Chunk:
+    """A chunk of text and where it came from.
+
+    `start` and `end` are character offsets into the concatenated segments,
+    so `text == source[start:end]`. `page` is the 1-based segment the chunk
+    starts in when the segments are pages, otherwise None.
+    """
+
+    __slots__ = ("text", "start", "end", "page")
+
+    def __init__(self, text: str, start: int, end: int, page: Optional[int] = None):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.page = page
+
+    def __repr__(self) -> str:
+        return f"Chunk(start={self.start}, end={self.end}, page={self.page}, text={self.text[:30]!r})"
+
+
+class StreamingChunker:
+    """Incremental chunker fed one text segment at a time.
+
+    Chunks are slices of the source text of at most `chunk_size` characters,
+    with their whitespace kept and leading and trailing whitespace trimmed.
+    A chunk ends at the last paragraph break (`boundary="paragraph"`) or
+    sentence end (`"sentence"`) in its window, falling back to the last word
+    break; a word longer than a chunk is split. With `overlap`, each chunk
+    starts at the first word within `overlap` characters of the previous
+    chunk's end.
+
+    Only unchunked text is buffered and the boundaries are found with
+    `str.rfind` over that buffer, so no string is allocated per word. A
+    chunk is cut once a full window of text is buffered, which makes the
+    output independent of how the source is split into segments.
+    """
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 0, boundary: str = "word", paged: bool = False):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be at least 0 and smaller than chunk_size")
+        if boundary not in BOUNDARY_MODES:
+            raise ValueError(f"boundary must be one of {', '.join(BOUNDARY_MODES)}")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.boundary = boundary
+        self.paged = paged
+        self._buffer = ""
+        # Source offset of the buffer's first character
+        self._offset = 0
+        # Source offset at which each page still in the buffer starts, and its number
+        self._page_starts: List[int] = []
+        self._page_numbers: List[int] = []
+        self._pages = 0
+
+    def feed(self, text: str) -> List[Chunk]:
+        """Add a segment and return the chunks it completed."""
+        if self.paged:
+            self._pages += 1
+            self._page_starts.append(self._offset + len(self._buffer))
+            self._page_numbers.append(self._pages)
+        if not text:
+            return []
+        self._buffer += text
+        return self._cut(final=False)
+
+    def finish(self) -> List[Chunk]:
+        """Flush the remaining text as the final chunks."""
+        chunks = self._cut(final=True)
+        self._offset += len(self._buffer)
+        self._buffer = ""
+        return chunks
+
+    def _page(self, offset: int) -> Optional[int]:
+        if not self._page_starts:
+            return None
+        index = bisect.bisect_right(self._page_starts, offset) - 1
+        return self._page_numbers[max(index, 0)]
+
+    def _break(self, buffer: str, start: int, limit: int) -> int:
+        """Return where the chunk starting at `start` ends; it may not extend past `limit`."""
+        floor = start + int(self.chunk_size * _MIN_FILL)
+        if self.boundary == "paragraph":
+            cut = max(buffer.rfind(marker, floor, limit + 1) for marker in _PARAGRAPH_BREAKS)
+            if cut > start:
+                return cut
+        if self.boundary != "word":
+            cut = _sentence_end(buffer, floor, limit)
+            if cut > start:
+                return cut
+        # The character just past the window is included: a word may end exactly at `limit`
+        cut = max(buffer.rfind(marker, start, limit + 1) for marker in _WORD_BREAKS)
+        return cut if cut > start else limit
+
+    def _cut(self, final: bool) -> List[Chunk]:
+        chunks = []
+        buffer = self._buffer
+        size = len(buffer)
+        position = 0
+        while True:
+            match = _NON_SPACE.search(buffer, position)
+            if match is None:
+                position = size
+                break
+            start = match.start()
+            limit = start + self.chunk_size
+            if size > limit:
+                end = self._break(buffer, start, limit)
+            elif final:
+                end = size
+            else:
+                # Wait until the window and the character after it are buffered
+                position = start
+                break
+            while buffer[end - 1].isspace():
+                end -= 1
+            chunks.append(Chunk(buffer[start:end], self._offset + start, self._offset + end, self._page(self._offset + start)))
+            if size <= limit:
+                # The rest of the text fitted in this chunk
+                position = size
+                break
+            position = self._next_start(buffer, start, end)
+        self._buffer = buffer[position:]
+        self._offset += position
+        if self._page_starts:
+            # Forget the pages that end before the buffer starts
+            keep = max(bisect.bisect_right(self._page_starts, self._offset) - 1, 0)
+            del self._page_starts[:keep], self._page_numbers[:keep]
+        return chunks
+
+    def _next_start(self, buffer: str, start: int, end: int) -> int:
+        if not self.overlap:
+            return end
+        position = end - self.overlap
+        if position <= start:
+            return end
+        if not buffer[position - 1].isspace():
+            # Move forward to the start of the next whole word
+            match = _SPACE.search(buffer, position, end)
+            if match is None:
+                return end
+            position = match.end()
+        return position
+
+
+def iter_text_chunks(segments: Iterable[str], chunk_size: Optional[int] = None, overlap: Optional[int] = None,
+                     boundary: Optional[str] = None, paged: bool = False) -> Iterator[Chunk]:
+    """Chunk a stream of text segments lazily; unset options come from the settings."""
+    chunker = StreamingChunker(
+        chunk_size or settings.CHUNK_SIZE,
+        settings.CHUNK_OVERLAP if overlap is None else overlap,
+        boundary or settings.CHUNK_BOUNDARY,
+        paged
+    )
+    for segment in segments:
+        yield from chunker.feed(segment)
+    yield from chunker.finish()
+
+
+def iter_chunks(segments: Iterable[str], chunk_size: Optional[int] = None) -> Iterator[str]:
+    """Chunk a stream of text segments lazily, yielding only the text."""
+    for chunk in iter_text_chunks(segments, chunk_size):
+        yield chunk.text
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     NEO4J_URI: str = "bolt://neo4j:7687"
@@ -8,6 +9,79 @@ class Settings(BaseSettings):
     OLLAMA_BASE_URL: str = "http://ollama:11434"
     LLM_MODEL: str = "llama3.2"
     EMBEDDING_MODEL: str = "nomic-embed-text"
+    EMBEDDING_DIMENSIONS: Optional[int] = None  # Detected from EMBEDDING_MODEL when unset
+    SCHEMA_INDEX_WAIT_TIMEOUT: float = 60.0  # Seconds startup waits for the vector index to come ONLINE
+    NEO4J_WRITE_BATCH_SIZE: int = 500  # Chunks per UNWIND write transaction
+    NEO4J_DELETE_BATCH_SIZE: int = 1000  # Rows per inner transaction when deleting documents and chunks
+    EMBEDDING_BATCH_SIZE: int = 32  # Texts per /api/embed request
+    EMBEDDING_CONCURRENCY: int = 4  # Maximum in-flight embedding requests
+    EMBEDDING_MAX_RETRIES: int = 3
+    EMBEDDING_RETRY_BACKOFF: float = 0.5  # Seconds, doubled on every retry
+    EMBEDDING_TIMEOUT: float = 120.0  # Seconds per embedding request
+    LLM_MAX_CONCURRENT_GENERATIONS: int = 2  # Generations running at once per model
+    LLM_QUEUE_SIZE: int = 32  # Generations waiting for a slot before new ones get a 503
+    LLM_QUEUE_TIMEOUT: float = 60.0  # Seconds a generation may wait for a slot
+    LLM_READ_TIMEOUT: float = 120.0  # Seconds without streamed output before a generation fails
+    OLLAMA_KEEP_ALIVE: str = "30m"  # How long Ollama keeps a model loaded after each request; "-1" keeps it loaded, "" uses Ollama's default
+    LLM_WARMUP_ENABLED: bool = True  # Load LLM_MODEL and EMBEDDING_MODEL into Ollama at startup
+    CONVERSATION_TTL: float = 1800.0  # Seconds an idle conversation is kept
+    CONVERSATION_MAX_SESSIONS: int = 1000  # Conversations kept before the least recently used is dropped
+    CONVERSATION_MIN_CONTEXT_BUDGET: int = 500  # Context tokens a follow-up must have left beside the kept model state, else the state is reset
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = "data/embedding_cache"  # Shared by all workers on a host
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 100000
+    VECTOR_SEARCH_MODE: str = "neo4j"  # "neo4j", "local", "shadow" or "graph"
+    VECTOR_INDEX_PATH: str = "data/vector_index"
+    VECTOR_QUANTIZATION: str = "none"  # "none", "int8" or "binary" for the local index
+    VECTOR_RERANK_FACTOR: int = 4  # Quantized candidates fetched per requested result
+    CHUNK_SIZE: int = 1000  # Maximum characters per chunk
+    CHUNK_OVERLAP: int = 0  # Characters of the previous chunk repeated at the start of the next, rounded to whole words
+    CHUNK_BOUNDARY: str = "sentence"  # Where chunks end: "word", "sentence" or "paragraph", falling back to a word break
+    INGEST_CHUNK_BATCH_SIZE: int = 64  # Chunks embedded and written together during ingestion
+    INGEST_SEGMENT_QUEUE_SIZE: int = 8  # Extracted pages buffered ahead of the chunker
+    INGEST_BATCH_QUEUE_SIZE: int = 2  # Chunk batches buffered ahead of embedding
+    INGEST_BATCH_MAX_RETRIES: int = 2  # Retries of a failed embed-and-write batch
+    INGEST_MAX_CONCURRENT_JOBS: int = 2  # Ingestion jobs running at once; others wait queued
+    INGEST_EXTRACTION_PROCESSES: int = 2  # Processes extracting PDF text
+    INGEST_PAGES_PER_TASK: int = 8  # PDF pages extracted per process-pool task
+    INGEST_JOB_HISTORY: int = 1000  # Jobs kept for status queries
+    INGEST_UPLOAD_DIR: str = "data/uploads"  # Uploads are spooled here until ingested
+    RETENTION_MAX_AGE: float = 0.0  # Seconds after its last ingestion a document is deleted; 0 keeps documents
+    RETENTION_INTERVAL: float = 3600.0  # Seconds between retention sweeps; 0 disables them
+    RETENTION_BATCH_DOCUMENTS: int = 100  # Expired documents deleted together in a sweep
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_THRESHOLD: float = 0.95  # Minimum query-embedding cosine similarity for a hit
+    ANSWER_CACHE_TTL: float = 3600.0  # Seconds
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    CONTEXT_CANDIDATES: int = 5  # Chunks retrieved per query before context assembly
+    CONTEXT_TOKEN_BUDGET: int = 2500  # Estimated prompt tokens for context; num_ctx is 4096
+    CONTEXT_MIN_SCORE: float = 0.55  # Vector score, (1 + cosine) / 2, below which chunks are dropped
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.8  # Word-shingle Jaccard similarity treated as a duplicate
+    QUERY_BATCH_MAX_QUESTIONS: int = 500  # Questions accepted per /query/batch request
+    QUERY_BATCH_CONCURRENCY: int = 4  # Generations in flight per batch
+    QUERY_BATCH_OVERLOAD_RETRIES: int = 10  # Times a batch generation waits out a full scheduler queue before failing
+    STREAM_FORMAT: str = "json"  # Default /query stream format: json or compact
+    STREAM_COALESCE_MS: int = 50  # Flush buffered answer tokens this long after the first; 0 with STREAM_COALESCE_BYTES=0 sends every token
+    STREAM_COALESCE_BYTES: int = 512  # Flush buffered answer tokens once they reach this size
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_DEFAULT: str = "100/60"  # Requests/seconds per client for routes without their own limit
+    RATE_LIMIT_ROUTES: str = "POST /query=60/60,POST /query/batch=10/60,POST /documents=20/60,GET /health=0,GET /metrics=0"  # [METHOD ]/path[*]=requests/seconds, 0 for unlimited
+    RATE_LIMIT_BACKEND: str = "memory"  # memory (per worker) or sqlite (shared by the workers on a host)
+    RATE_LIMIT_SQLITE_PATH: str = "data/rate_limit.sqlite"
+    RATE_LIMIT_MAX_CLIENTS: int = 100000  # Buckets kept before the least recently seen client is evicted
+    RATE_LIMIT_TRUSTED_PROXIES: str = ""  # Comma-separated IPs/CIDRs whose X-Forwarded-For is trusted
+    METRICS_TIMING_HEADERS: bool = False  # Add a Server-Timing header with per-stage durations to responses
+    GRAPH_PAGE_SIZE: int = 1000  # Default nodes per /graph page
+    GRAPH_MAX_PAGE_SIZE: int = 10000
+    GRAPH_PREVIEW_CHARS: int = 200  # Content characters returned unless include_content is set
+    GRAPH_SUMMARY_TOP_N: int = 200  # Documents shown in /graph/summary
+    GRAPH_SUMMARY_TTL: float = 300.0  # Seconds a summary is reused; ingestion also invalidates it
+    GRAPH_SUMMARY_MAX_ENTRIES: int = 256  # Summaries and document neighbourhoods kept; least recently used are evicted
+    GRAPH_DOCUMENT_CHUNK_LIMIT: int = 500  # Chunks returned when expanding one document
+    GRAPH_SIMILAR_K: int = 5  # SIMILAR_TO edges added per new chunk at ingestion; 0 disables
+    GRAPH_SIMILAR_MIN_SCORE: float = 0.8  # Vector score, (1 + cosine) / 2, required for a SIMILAR_TO edge
+    GRAPH_EXPAND_SEEDS: int = 3  # Vector-index hits a "graph" search starts from
+    GRAPH_EXPAND_PER_SEED: int = 8  # Neighbours considered per seed
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,183 @@
+import logging
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for English text with Llama-family tokenizers
+CHARS_PER_TOKEN = 4
+# Longest run of words checked when trimming the overlap of adjacent chunks
+MAX_OVERLAP_WORDS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate from the character count; no tokenizer needed."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = text.lower().split()
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(a: Set[tuple], b: Set[tuple]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _gap_separator(gap: int) -> str:
+    """Whitespace standing in for the `gap` characters trimmed from the edges of two adjacent chunks.
+
+    Chunks never start or end with whitespace, so a gap holds only
+    whitespace. One character is an inline break, read as a space; a longer
+    run at a chunk edge is a paragraph break, where the chunker prefers to cut.
+    """
+    if gap == 0:
+        # A word longer than a chunk was split
+        return ""
+    return " " if gap == 1 else "\n\n"
+
+
+def _join_adjacent(first: str, second: str, first_end: Optional[int] = None, second_start: Optional[int] = None) -> str:
+    """Join two consecutive chunks, dropping the text the second repeats from the first.
+
+    Given where the first ends and the second starts in their document, the
+    overlap is cut from the original text, so its newlines are kept;
+    otherwise it is found by comparing words.
+    """
+    if first_end is not None and second_start is not None:
+        overlap = first_end - second_start
+        if overlap <= 0:
+            return first + _gap_separator(-overlap) + second
+        if overlap <= len(second) and first.endswith(second[:overlap]):
+            return first + second[overlap:]
+    first_words, second_words = first.split(), second.split()
+    for size in range(min(len(first_words), len(second_words), MAX_OVERLAP_WORDS), 0, -1):
+        if first_words[-size:] == second_words[:size]:
+            return " ".join(first_words + second_words[size:])
+    return f"{first} {second}"
+
+
+class ContextStats:
+    def __init__(self, retrieved: int, retrieved_tokens: int):
+        self.retrieved = retrieved
+        self.retrieved_tokens = retrieved_tokens
+        self.duplicates = 0
+        self.below_threshold = 0
+        self.merged = 0
+        self.over_budget = 0
+        self.truncated = False
+        self.used = 0
+        self.tokens = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "retrieved_chunks": self.retrieved,
+            "used_chunks": self.used,
+            "duplicates_dropped": self.duplicates,
+            "below_threshold": self.below_threshold,
+            "adjacent_merged": self.merged,
+            "over_budget": self.over_budget,
+            "truncated": self.truncated,
+            "retrieved_tokens": self.retrieved_tokens,
+            "context_tokens": self.tokens,
+            "tokens_saved": self.retrieved_tokens - self.tokens
+        }
+
+
+class _Passage:
+    def __init__(self, chunk: dict):
+        self.ids = [chunk["id"]]
+        self.content = chunk["content"]
+        self.score = chunk["score"]
+        located = [location for location in chunk.get("locations") or [] if location.get("position") is not None]
+        self.locations = {(location["doc_id"], location["position"]) for location in located}
+        # Source offsets of the passage's last chunk in each document, where stored
+        self.spans: Dict[Tuple[str, int], Tuple[int, int]] = {
+            (location["doc_id"], location["position"]): (location["start"], location["end"])
+            for location in located
+            if location.get("start") is not None and location.get("end") is not None
+        }
+
+    def follows(self, other: "_Passage") -> bool:
+        return any((doc_id, position - 1) in other.locations for doc_id, position in self.locations)
+
+    def append(self, other: "_Passage"):
+        first_end = second_start = None
+        for (doc_id, position), (start, _) in other.spans.items():
+            previous = self.spans.get((doc_id, position - 1))
+            if previous is not None:
+                first_end, second_start = previous[1], start
+                break
+        self.ids.extend(other.ids)
+        self.content = _join_adjacent(self.content, other.content, first_end, second_start)
+        self.score = max(self.score, other.score)
+        self.locations = other.locations
+        self.spans = other.spans
+
+
+def assemble_context(chunks: List[dict], token_budget: Optional[int] = None, min_score: Optional[float] = None,
+                     duplicate_threshold: Optional[float] = None) -> Tuple[str, List[str], ContextStats]:
+    """Build the prompt context from retrieved chunks within a token budget.
+
+    Chunks scoring below `min_score` are dropped, as are near-duplicates of a
+    better chunk (word-shingle Jaccard similarity of `duplicate_threshold` or
+    more). Chunks that are consecutive in the same document are merged into
+    one passage with their overlap removed. Passages are then packed best
+    first into `token_budget`; one that doesn't fit is skipped in favour of
+    smaller ones, and the best passage is truncated if it alone is too large.
+    Returns the context, the ids of the chunks used, and statistics.
+    """
+    token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+    min_score = settings.CONTEXT_MIN_SCORE if min_score is None else min_score
+    duplicate_threshold = duplicate_threshold or settings.CONTEXT_DUPLICATE_THRESHOLD
+    stats = ContextStats(len(chunks), estimate_tokens("\n".join(chunk["content"] for chunk in chunks)))
+
+    kept: List[_Passage] = []
+    kept_shingles: List[Set[tuple]] = []
+    for chunk in sorted(chunks, key=lambda chunk: chunk["score"], reverse=True):
+        if chunk["score"] < min_score:
+            stats.below_threshold += 1
+            continue
+        shingles = _shingles(chunk["content"])
+        if any(_similarity(shingles, other) >= duplicate_threshold for other in kept_shingles):
+            stats.duplicates += 1
+            continue
+        kept.append(_Passage(chunk))
+        kept_shingles.append(shingles)
+
+    # Merge runs of consecutive chunks, keeping each run at its best chunk's rank
+    passages: List[_Passage] = []
+    for passage in sorted(kept, key=lambda passage: min(passage.locations, default=("", 0))):
+        previous = passages[-1] if passages else None
+        if previous is not None and passage.follows(previous):
+            previous.append(passage)
+            stats.merged += 1
+        else:
+            passages.append(passage)
+    passages.sort(key=lambda passage: passage.score, reverse=True)
+
+    selected, used_ids, tokens = [], [], 0
+    for passage in passages:
+        passage_tokens = estimate_tokens(passage.content)
+        if tokens + passage_tokens > token_budget:
+            if selected:
+                stats.over_budget += len(passage.ids)
+                continue
+            passage.content = passage.content[:token_budget * CHARS_PER_TOKEN]
+            passage_tokens = estimate_tokens(passage.content)
+            stats.truncated = True
+        selected.append(passage.content)
+        used_ids.extend(passage.ids)
+        tokens += passage_tokens
+
+    context = "\n".join(selected)
+    stats.used = len(used_ids)
+    stats.tokens = estimate_tokens(context)
+    return context, used_ids, stats
@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Set
+
+from .config import get_settings
+from .metrics import registry
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class Conversation:
+    """A chat session whose model state is kept between turns.
+
+    `context` is the token state Ollama returned after the last turn. It is
+    sent back with the next question, so a follow-up is evaluated on top of
+    it instead of replaying the history. Chunks already given to the model
+    in an earlier turn are left out of later prompts. Once the kept state
+    leaves too little of the context window for a new prompt, it is reset
+    and the next turn starts from a fresh model state.
+    """
+
+    def __init__(self, model: str):
+        self.id = str(uuid.uuid4())
+        self.model = model
+        self.context: Optional[List[int]] = None
+        self.chunk_ids: Set[str] = set()
+        self.turns: List[dict] = []
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.busy = False
+        self.context_resets = 0
+        # Token counts of the generation in progress, reported with its turn
+        self._generation: dict = {}
+
+    def begin_turn(self) -> bool:
+        """Claim the conversation for one turn; False while another turn is running."""
+        if self.busy:
+            return False
+        self.busy = True
+        self.updated_at = time.time()
+        return True
+
+    def end_turn(self):
+        self.busy = False
+        self.updated_at = time.time()
+
+    def reset_context(self):
+        """Drop the kept model state; chunks seen so far may be sent again."""
+        self.context = None
+        self.chunk_ids.clear()
+        self.context_resets += 1
+
+    def record_generation(self, data: dict):
+        """Keep the token state from the final message of an Ollama stream."""
+        if data.get("context"):
+            self.context = data["context"]
+        self._generation = {"prompt_tokens": data.get("prompt_eval_count"), "answer_tokens": data.get("eval_count")}
+
+    def add_turn(self, question: str, answer: str, chunk_ids: List[str], replayed: bool = False):
+        """Record a turn; a `replayed` answer came from the answer cache, so the model never saw its chunks."""
+        if not replayed:
+            self.chunk_ids.update(chunk_ids)
+        self.turns.append({
+            "question": question,
+            "answer": answer,
+            "chunk_ids": list(chunk_ids),
+            "replayed": replayed,
+            "created_at": time.time(),
+            "prompt_tokens": self._generation.get("prompt_tokens"),
+            "answer_tokens": self._generation.get("answer_tokens")
+        })
+        self._generation = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "conversation_id": self.id,
+            "model": self.model,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "context_tokens": len(self.context or ()),
+            "context_resets": self.context_resets,
+            "turns": self.turns
+        }
+
+
+class ConversationStore:
+    """In-process conversations, expired after `ttl` idle seconds.
+
+    When `max_sessions` is reached the least recently used conversation is
+    dropped. Conversations live in the API process, so with several workers
+    a client must keep talking to the one that created its conversation.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [
+            conversation_id for conversation_id, conversation in self._conversations.items()
+            if conversation.updated_at < cutoff and not conversation.busy
+        ]
+        for conversation_id in expired:
+            del self._conversations[conversation_id]
+        if expired:
+            logger.debug(f"Expired {len(expired)} idle conversations")
+
+    def create(self, model: str) -> Conversation:
+        conversation = Conversation(model)
+        with self._lock:
+            self._expire()
+            self._conversations[conversation.id] = conversation
+            while len(self._conversations) > self.max_sessions:
+                self._conversations.popitem(last=False)
+        return conversation
+
+    def get(self, conversation_id: str) -> Optional[Conversation]:
+        with self._lock:
+            self._expire()
+            conversation = self._conversations.get(conversation_id)
+            if conversation is not None:
+                self._conversations.move_to_end(conversation_id)
+            return conversation
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._conversations.pop(conversation_id, None) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._conversations)
+
+
+conversation_store = ConversationStore(settings.CONVERSATION_TTL, settings.CONVERSATION_MAX_SESSIONS)
+
+registry.gauge(
+    "graph_rag_conversations", "Conversations kept in memory", function=lambda: len(conversation_store)
+)
@@ -1,14 +1,186 @@
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase
 from .config import get_settings
 import time
 import logging
 import json
-from neo4j import Driver
-from typing import Optional
+import asyncio
+from neo4j import Driver, AsyncDriver
+from typing import Dict, Optional, List, Set, Tuple, Iterator
+from .metrics import NEO4J_POOL_SIZE, NEO4J_SESSIONS_IN_USE, NEO4J_WRITE_BATCH_SIZE, NEO4J_WRITE_SECONDS
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+MAX_CONNECTION_POOL_SIZE = 50
+NEO4J_POOL_SIZE.set(MAX_CONNECTION_POOL_SIZE)
+
+# Where each chunk sits in its documents, so adjacent results can be merged
+CHUNK_LOCATIONS = (
+    "[(d:Document)-[r:CONTAINS]->(node) | "
+    "{doc_id: d.id, position: r.position, page: r.page, start: r.start, end: r.end}][..8]"
+)
+
+SEARCH_SIMILAR_CHUNKS_QUERY = f"""
+CALL db.index.vector.queryNodes('chunk_embeddings', $limit, $embedding)
+YIELD node, score
+RETURN node.id as id, node.content as content, score, {CHUNK_LOCATIONS} as locations
+ORDER BY score DESC
+"""
+
+BATCH_SEARCH_SIMILAR_CHUNKS_QUERY = f"""
+UNWIND range(0, size($embeddings) - 1) AS i
+CALL {{
+    WITH i
+    CALL db.index.vector.queryNodes('chunk_embeddings', $limit, $embeddings[i])
+    YIELD node, score
+    RETURN collect({{id: node.id, content: node.content, score: score, locations: {CHUNK_LOCATIONS}}}) AS chunks
+}}
+RETURN i, chunks
+ORDER BY i
+"""
+
+GET_CHUNKS_BY_IDS_QUERY = f"""
+UNWIND $ids AS chunk_id
+MATCH (node:Chunk {{id: chunk_id}})
+RETURN node.id as id, node.content as content, {CHUNK_LOCATIONS} as locations,
+       CASE WHEN $include_embedding THEN node.embedding END as embedding
+"""
+
+# Seeds from the vector index, widened along NEXT and SIMILAR_TO edges in the same query;
+# neighbours carry their embeddings so the caller can score them against the query
+EXPAND_SIMILAR_CHUNKS_QUERY = f"""
+CALL db.index.vector.queryNodes('chunk_embeddings', $seeds, $embedding)
+YIELD node, score
+WITH collect({{id: node.id, content: node.content, score: score, locations: {CHUNK_LOCATIONS}}}) AS seeds,
+     collect(node) AS seed_nodes
+CALL {{
+    WITH seed_nodes
+    UNWIND seed_nodes AS seed
+    CALL {{
+        WITH seed
+        MATCH (seed)-[r:NEXT|SIMILAR_TO]-(neighbor:Chunk)
+        RETURN neighbor
+        ORDER BY CASE type(r) WHEN 'NEXT' THEN 2.0 ELSE r.score END DESC
+        LIMIT $per_seed
+    }}
+    WITH DISTINCT seed_nodes, neighbor AS node
+    WHERE NOT node IN seed_nodes
+    LIMIT $neighbors
+    RETURN collect({{id: node.id, content: node.content, embedding: node.embedding, locations: {CHUNK_LOCATIONS}}}) AS neighbors
+}}
+RETURN seeds, neighbors
+"""
+
+# Labels paged by /graph, in order; each is walked by its uniquely indexed `id`
+GRAPH_PAGE_LABELS = ("Document", "Chunk")
+
+GRAPH_NODES_QUERY = """
+MATCH (n:{label})
+WHERE n.id > $after
+WITH n ORDER BY n.id SKIP $skip LIMIT $limit
+RETURN elementId(n) AS id, n.id AS key, labels(n) AS labels,
+       n {{.*,
+          embedding: CASE WHEN $include_embeddings THEN n.embedding END,
+          content: CASE WHEN $include_content THEN n.content ELSE left(n.content, $preview_chars) END
+       }} AS properties
+"""
+
+GRAPH_RELATIONSHIPS_QUERY = """
+UNWIND $ids AS node_id
+MATCH (n)-[r]->(m)
+WHERE elementId(n) = node_id
+RETURN type(r) AS type, elementId(n) AS start, elementId(m) AS end, properties(r) AS properties
+"""
+
+GRAPH_TOP_DOCUMENTS_QUERY = """
+MATCH (d:Document)
+WITH d, COUNT { (d)-[:CONTAINS]->() } AS chunk_count, COUNT { (d)--() } AS degree
+ORDER BY degree DESC
+LIMIT $limit
+RETURN elementId(d) AS id, d.id AS doc_id, d.metadata AS metadata, chunk_count, degree
+"""
+
+GRAPH_DOCUMENT_DEGREE_QUERY = """
+MATCH (d:Document)
+WITH COUNT { (d)-[:CONTAINS]->() } AS chunk_count
+RETURN min(chunk_count) AS min, max(chunk_count) AS max, avg(chunk_count) AS mean,
+       percentileDisc(chunk_count, 0.5) AS median, percentileDisc(chunk_count, 0.95) AS p95
+"""
+
+GRAPH_DOCUMENT_LINKS_QUERY = """
+MATCH (d1:Document)-[:CONTAINS]->(:Chunk)-[r]->(:Chunk)<-[:CONTAINS]-(d2:Document)
+WHERE elementId(d1) IN $ids AND elementId(d2) IN $ids AND d1 <> d2
+RETURN elementId(d1) AS start, elementId(d2) AS end, type(r) AS type, count(r) AS weight
+"""
+
+GRAPH_DOCUMENT_NEIGHBORHOOD_QUERY = """
+MATCH (d:Document {id: $doc_id})
+OPTIONAL MATCH (d)-[r:CONTAINS]->(c:Chunk)
+WITH d, c ORDER BY r.position LIMIT $limit
+WITH d, collect(c) AS chunks
+RETURN elementId(d) AS doc_element_id, d.id AS doc_id, d.metadata AS metadata,
+       [c IN chunks | {id: elementId(c), chunk_id: c.id, preview: left(c.content, $preview_chars)}] AS chunks
+"""
+
+GRAPH_CHUNK_LINKS_QUERY = """
+UNWIND $ids AS chunk_element_id
+MATCH (c:Chunk)-[r]->(m:Chunk)
+WHERE elementId(c) = chunk_element_id
+RETURN elementId(c) AS start, elementId(m) AS end, type(r) AS type, properties(r) AS properties
+"""
+
+INDEX_STATUS_QUERY = """
+SHOW INDEXES YIELD name, state, populationPercent, options
+WHERE name = $name
+RETURN state, populationPercent AS population_percent, options
+"""
+
+def _document_label(doc_id: str, metadata: Optional[str]) -> str:
+    try:
+        return json.loads(metadata).get("filename") or doc_id
+    except (TypeError, ValueError, AttributeError):
+        return doc_id
+
+def document_expiry(metadata: Optional[dict]) -> Optional[float]:
+    """The `expires_at` epoch seconds in a document's metadata, if it has a numeric one."""
+    value = (metadata or {}).get("expires_at")
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def _driver_config() -> dict:
+    return {
+        "auth": (settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+        "max_connection_lifetime": 3600,  # 1 hour
+        "max_connection_pool_size": MAX_CONNECTION_POOL_SIZE,
+        "connection_acquisition_timeout": 60
+    }
+
+class _TrackedSession:
+    """Wraps a session to count open sessions per driver for /metrics."""
+
+    def __init__(self, session, driver: str):
+        self._session = session
+        self._driver = driver
+
+    def __enter__(self):
+        NEO4J_SESSIONS_IN_USE.inc(driver=self._driver)
+        return self._session.__enter__()
+
+    def __exit__(self, *exc_info):
+        try:
+            return self._session.__exit__(*exc_info)
+        finally:
+            NEO4J_SESSIONS_IN_USE.dec(driver=self._driver)
+
+    async def __aenter__(self):
+        NEO4J_SESSIONS_IN_USE.inc(driver=self._driver)
+        return await self._session.__aenter__()
+
+    async def __aexit__(self, *exc_info):
+        try:
+            return await self._session.__aexit__(*exc_info)
+        finally:
+            NEO4J_SESSIONS_IN_USE.dec(driver=self._driver)
+
 class Neo4jConnection:
     _instance: Optional['Neo4jConnection'] = None
     _driver: Optional[Driver] = None
@@ -19,20 +191,14 @@ class Neo4jConnection:
         return cls._instance
 
     def __init__(self):
-        if self._driver is None:
-            self.connect_with_retry()
+        # The driver is created on first use, so importing this module needs no reachable Neo4j
+        pass
 
     def connect_with_retry(self, max_retries=5, retry_delay=5):
         for attempt in range(max_retries):
             try:
                 logger.info(f"Attempting to connect to Neo4j at {settings.NEO4J_URI}")
-                self._driver = GraphDatabase.driver(
-                    settings.NEO4J_URI,
-                    auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
-                    max_connection_lifetime=3600,  # 1 hour
-                    max_connection_pool_size=50,
-                    connection_acquisition_timeout=60
-                )
+                self._driver = GraphDatabase.driver(settings.NEO4J_URI, **_driver_config())
                 # Test the connection
                 with self._driver.session() as session:
                     session.run("RETURN 1")
@@ -56,7 +222,7 @@ class Neo4jConnection:
         try:
             if not self._driver:
                 self.connect_with_retry()
-            return self._driver.session()
+            return _TrackedSession(self._driver.session(), "sync")
         except Exception as e:
             logger.error(f"Error getting Neo4j session: {str(e)}")
             raise
@@ -79,65 +245,712 @@ class Neo4jConnection:
                 def create_doc_tx(tx):
                     # Convert metadata to string if it exists
                     metadata_str = json.dumps(metadata) if metadata else None
+                    # Merged so re-ingesting an existing document updates it in place
                     query = """
-                    CREATE (d:Document {
-                        id: $doc_id,
-                        content: $content,
-                        metadata: $metadata
-                    })
+                    MERGE (d:Document {id: $doc_id})
+                    SET d.content = $content,
+                        d.metadata = $metadata,
+                        d.ingested_at = $ingested_at,
+                        d.expires_at = $expires_at
                     RETURN d
                     """
-                    result = tx.run(query, doc_id=doc_id, content=content, metadata=metadata_str)
+                    result = tx.run(query, doc_id=doc_id, content=content, metadata=metadata_str,
+                                    ingested_at=time.time(), expires_at=document_expiry(metadata))
                     record = result.single()
-                    logger.info(f"create_document result: {record}")
-                db_name = session.run("CALL db.info() YIELD name RETURN name").single()[0]
-                logger.info(f"Using Neo4j database: {db_name}")
-                session.execute_write(create_doc_tx)
-                logger.info(f"Successfully created document with ID: {doc_id}")
+                    logger.debug(f"create_document result: {record}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    db_name = session.run("CALL db.info() YIELD name RETURN name").single()[0]
+                    logger.debug(f"Using Neo4j database: {db_name}")
+                with NEO4J_WRITE_SECONDS.time(operation="create_document"):
+                    session.execute_write(create_doc_tx)
+                logger.debug(f"Successfully created document with ID: {doc_id}")
         except Exception as e:
             logger.error(f"Error creating document: {str(e)}", exc_info=True)
             raise
 
-    def create_chunk(self, chunk_id: str, content: str, embedding: list, doc_id: str):
+    def create_chunks_bulk(self, doc_id: str, chunks: List[Tuple[str, str, Optional[list], int, int, int, Optional[int]]],
+                           batch_size: int = None) -> List[str]:
+        """Link chunks to a document in batched UNWIND transactions.
+
+        `chunks` is a list of (chunk_id, content, embedding, position, start,
+        end, page) tuples. The source offsets and page are stored on the
+        CONTAINS relationship, since a chunk may be shared by documents.
+        Chunk ids are content hashes, so a chunk already stored for any
+        document is reused as-is and its embedding may be passed as None.
+        Whatever the document held at each position is replaced, and NEXT
+        edges (tagged with the document id and the position they leave) are
+        kept linking each position to the following one, whichever batch
+        writes it first. All batches share one session, and retrying a
+        partially written call is safe.
+
+        Returns the ids of the chunks left without an embedding: a chunk found
+        stored beforehand may have been deleted before this write, and is then
+        created from its content alone.
+        """
+        batch_size = batch_size or settings.NEO4J_WRITE_BATCH_SIZE
+        query = """
+        MATCH (d:Document {id: $doc_id})
+        UNWIND $rows AS row
+        MERGE (c:Chunk {id: row.id})
+        ON CREATE SET c.content = row.content,
+                      c.embedding = row.embedding
+        WITH d, c, row
+        CALL {
+            WITH d, row
+            MATCH (d)-[old:CONTAINS {position: row.position}]->(previous)
+            OPTIONAL MATCH (previous)-[stale:NEXT {doc_id: d.id, position: row.position}]->()
+            DELETE old, stale
+        }
+        CREATE (d)-[:CONTAINS {position: row.position, start: row.start, end: row.end, page: row.page}]->(c)
+        WITH d, c, row
+        CALL {
+            WITH d, c, row
+            MATCH (d)-[:CONTAINS {position: row.position - 1}]->(before)
+            OPTIONAL MATCH (before)-[stale:NEXT {doc_id: d.id, position: row.position - 1}]->()
+            DELETE stale
+            MERGE (before)-[:NEXT {doc_id: d.id, position: row.position - 1}]->(c)
+        }
+        CALL {
+            WITH d, c, row
+            MATCH (d)-[:CONTAINS {position: row.position + 1}]->(after)
+            MERGE (c)-[:NEXT {doc_id: d.id, position: row.position}]->(after)
+        }
+        RETURN count(c) AS created, collect(CASE WHEN c.embedding IS NULL THEN c.id END) AS missing
+        """
+
+        def create_batch_tx(tx, rows):
+            record = tx.run(query, doc_id=doc_id, rows=rows).single()
+            return record["created"], record["missing"]
+
         try:
+            created, missing = 0, []
             with self.get_session() as session:
-                def create_chunk_tx(tx):
-                    query = """
-                    MATCH (d:Document {id: $doc_id})
-                    CREATE (c:Chunk {
-                        id: $chunk_id,
-                        content: $content,
-                        embedding: $embedding
-                    })
-                    CREATE (d)-[:CONTAINS]->(c)
-                    RETURN c
-                    """
-                    result = tx.run(query, chunk_id=chunk_id, content=content, embedding=embedding, doc_id=doc_id)
-                    record = result.single()
-                    logger.info(f"create_chunk result: {record}")
-                db_name = session.run("CALL db.info() YIELD name RETURN name").single()[0]
-                logger.info(f"Using Neo4j database: {db_name}")
-                session.execute_write(create_chunk_tx)
-                logger.info(f"Successfully created chunk with ID: {chunk_id}")
+                for start in range(0, len(chunks), batch_size):
+                    rows = [
+                        {"id": chunk_id, "content": content, "embedding": embedding, "position": position,
+                         "start": offset, "end": end, "page": page}
+                        for chunk_id, content, embedding, position, offset, end, page in chunks[start:start + batch_size]
+                    ]
+                    NEO4J_WRITE_BATCH_SIZE.observe(len(rows), operation="create_chunks")
+                    with NEO4J_WRITE_SECONDS.time(operation="create_chunks"):
+                        batch_created, batch_missing = session.execute_write(create_batch_tx, rows)
+                    created += batch_created
+                    missing.extend(batch_missing)
+            if created != len(chunks):
+                raise RuntimeError(f"Expected to create {len(chunks)} chunks for document {doc_id}, created {created}")
+            logger.debug(f"Successfully created {created} chunks for document {doc_id} in batches of {batch_size}")
+            return list(dict.fromkeys(missing))
+        except Exception as e:
+            logger.error(f"Error creating chunks in bulk: {str(e)}", exc_info=True)
+            raise
+
+    def set_chunk_embeddings(self, embeddings: List[Tuple[str, list]]):
+        """Store embeddings for chunks that have none."""
+        query = """
+        UNWIND $rows AS row
+        MATCH (c:Chunk {id: row.id})
+        WHERE c.embedding IS NULL
+        SET c.embedding = row.embedding
+        """
+        rows = [{"id": chunk_id, "embedding": embedding} for chunk_id, embedding in embeddings]
+        with self.get_session() as session:
+            session.execute_write(lambda tx: tx.run(query, rows=rows).consume())
+
+    def get_document_chunks(self, doc_id: str) -> Dict[int, Tuple[str, Optional[int]]]:
+        """Return the chunk id and start offset stored at each position of a document."""
+        query = """
+        MATCH (:Document {id: $doc_id})-[r:CONTAINS]->(c:Chunk)
+        WHERE r.position IS NOT NULL
+        RETURN r.position AS position, c.id AS id, r.start AS start
+        """
+        with self.get_session() as session:
+            return {record["position"]: (record["id"], record["start"]) for record in session.run(query, doc_id=doc_id)}
+
+    def existing_chunk_ids(self, chunk_ids: List[str]) -> Set[str]:
+        """Return which of the given chunk ids are already stored."""
+        query = """
+        UNWIND $ids AS chunk_id
+        MATCH (c:Chunk {id: chunk_id})
+        RETURN c.id AS id
+        """
+        with self.get_session() as session:
+            return {record["id"] for record in session.run(query, ids=chunk_ids)}
+
+    def prune_document_chunks(self, doc_id: str, chunk_count: int, replaced_ids: List[str] = ()) -> List[str]:
+        """Drop a document's links past `chunk_count`, then delete orphaned chunks.
+
+        `replaced_ids` are chunks that were unlinked from a position during
+        the update. Chunks still contained by another document are kept.
+        Returns the ids of the deleted chunks.
+        """
+        next_query = """
+        MATCH (:Document {id: $doc_id})-[r:CONTAINS]->(:Chunk)-[n:NEXT {doc_id: $doc_id}]->()
+        WHERE r.position >= $count - 1 AND n.position >= $count - 1
+        DELETE n
+        """
+        unlink_query = """
+        MATCH (:Document {id: $doc_id})-[r:CONTAINS]->(c:Chunk)
+        WHERE r.position IS NULL OR r.position >= $count
+        DELETE r
+        RETURN collect(DISTINCT c.id) AS ids
+        """
+        orphan_query = """
+        UNWIND $ids AS chunk_id
+        MATCH (c:Chunk {id: chunk_id})
+        WHERE NOT (c)<-[:CONTAINS]-()
+        DETACH DELETE c
+        RETURN collect(chunk_id) AS removed
+        """
+
+        def prune_tx(tx):
+            tx.run(next_query, doc_id=doc_id, count=chunk_count).consume()
+            unlinked = tx.run(unlink_query, doc_id=doc_id, count=chunk_count).single()["ids"]
+            candidates = list(set(unlinked) | set(replaced_ids))
+            return tx.run(orphan_query, ids=candidates).single()["removed"]
+
+        try:
+            with self.get_session() as session:
+                with NEO4J_WRITE_SECONDS.time(operation="prune_document"):
+                    removed = session.execute_write(prune_tx)
+            logger.info(f"Pruned document {doc_id} to {chunk_count} chunks, deleted {len(removed)} orphaned chunks")
+            return removed
+        except Exception as e:
+            logger.error(f"Error pruning document chunks: {str(e)}", exc_info=True)
+            raise
+
+    def delete_documents(self, doc_ids: List[str], batch_size: int = None) -> dict:
+        """Delete documents with their NEXT edges and the chunks only they contain.
+
+        Each step is an auto-commit `CALL { ... } IN TRANSACTIONS` query that
+        commits every `batch_size` rows, so deleting a large document neither
+        builds one huge transaction in the heap nor holds its locks for the
+        whole delete. A chunk another document still contains is only
+        unlinked. Documents go last, so retrying a failed call finishes it.
+        Returns the ids of the deleted documents and chunks and the number of
+        relationships deleted.
+        """
+        batch_size = int(batch_size or settings.NEO4J_DELETE_BATCH_SIZE)
+        next_query = f"""
+        UNWIND $ids AS doc_id
+        MATCH (:Document {{id: doc_id}})-[:CONTAINS]->(:Chunk)-[n:NEXT {{doc_id: doc_id}}]->()
+        WITH DISTINCT n
+        CALL {{
+            WITH n
+            DELETE n
+        }} IN TRANSACTIONS OF {batch_size} ROWS
+        """
+        # Re-checked inside each transaction, in case a document was linked to the chunk meanwhile
+        chunk_query = f"""
+        UNWIND $ids AS doc_id
+        MATCH (:Document {{id: doc_id}})-[:CONTAINS]->(c:Chunk)
+        WITH DISTINCT c
+        CALL {{
+            WITH c
+            WITH c, c.id AS id
+            WHERE NOT EXISTS {{ MATCH (c)<-[:CONTAINS]-(other:Document) WHERE NOT other.id IN $ids }}
+            DETACH DELETE c
+            RETURN id
+        }} IN TRANSACTIONS OF {batch_size} ROWS
+        RETURN id
+        """
+        unlink_query = f"""
+        UNWIND $ids AS doc_id
+        MATCH (:Document {{id: doc_id}})-[r:CONTAINS]->()
+        CALL {{
+            WITH r
+            DELETE r
+        }} IN TRANSACTIONS OF {batch_size} ROWS
+        """
+        document_query = f"""
+        UNWIND $ids AS doc_id
+        MATCH (d:Document {{id: doc_id}})
+        CALL {{
+            WITH d, doc_id
+            DETACH DELETE d
+            RETURN doc_id AS id
+        }} IN TRANSACTIONS OF {batch_size} ROWS
+        RETURN id
+        """
+        try:
+            relationships = 0
+            # CALL IN TRANSACTIONS needs an auto-commit transaction, so no execute_write
+            with self.get_session() as session, NEO4J_WRITE_SECONDS.time(operation="delete_documents"):
+                relationships += session.run(next_query, ids=doc_ids).consume().counters.relationships_deleted
+                result = session.run(chunk_query, ids=doc_ids)
+                chunk_ids = [record["id"] for record in result]
+                relationships += result.consume().counters.relationships_deleted
+                relationships += session.run(unlink_query, ids=doc_ids).consume().counters.relationships_deleted
+                result = session.run(document_query, ids=doc_ids)
+                deleted_ids = [record["id"] for record in result]
+                relationships += result.consume().counters.relationships_deleted
+            logger.info(
+                f"Deleted {len(deleted_ids)} documents, {len(chunk_ids)} chunks and {relationships} relationships"
+            )
+            return {"document_ids": deleted_ids, "chunk_ids": chunk_ids, "relationships_deleted": relationships}
         except Exception as e:
-            logger.error(f"Error creating chunk: {str(e)}", exc_info=True)
+            logger.error(f"Error deleting documents: {str(e)}", exc_info=True)
+            raise
+
+    def find_expired_documents(self, now: float, max_age: Optional[float] = None, limit: int = 1000,
+                               exclude: Optional[List[str]] = None) -> List[str]:
+        """Return ids of documents past their `expires_at`, or last ingested over `max_age` seconds before `now`.
+
+        Ids in `exclude` are left out.
+        """
+        query = """
+        CALL {
+            MATCH (d:Document) WHERE d.expires_at <= $now RETURN d.id AS id
+            UNION
+            MATCH (d:Document) WHERE d.ingested_at <= $cutoff RETURN d.id AS id
+        }
+        WITH id WHERE NOT id IN $exclude
+        RETURN id
+        LIMIT $limit
+        """
+        cutoff = now - max_age if max_age else None
+        with self.get_session() as session:
+            return [record["id"] for record in session.run(query, now=now, cutoff=cutoff, limit=limit,
+                                                           exclude=list(exclude or ()))]
+
+    def import_batch(self, documents: List[dict], rows: List[dict], batch_size: int = None) -> int:
+        """Write several documents and their chunks for the bulk importer.
+
+        `documents` are {"id", "metadata"} dicts and `rows` are {"id",
+        "doc_id", "content", "embedding", "position", "start", "end", "page"}
+        dicts. Documents are merged in the first transaction, then chunks in
+        UNWIND transactions of `batch_size`. Everything is merged on id, so
+        replaying a batch after a crash is safe.
+        """
+        batch_size = batch_size or settings.NEO4J_WRITE_BATCH_SIZE
+        document_query = """
+        UNWIND $documents AS doc
+        MERGE (d:Document {id: doc.id})
+        SET d.metadata = doc.metadata,
+            d.ingested_at = $ingested_at,
+            d.expires_at = doc.expires_at
+        """
+        chunk_query = """
+        UNWIND $rows AS row
+        MATCH (d:Document {id: row.doc_id})
+        MERGE (c:Chunk {id: row.id})
+        ON CREATE SET c.content = row.content,
+                      c.embedding = row.embedding
+        MERGE (d)-[r:CONTAINS {position: row.position}]->(c)
+        SET r.start = row.start, r.end = row.end, r.page = row.page
+        WITH d, c, row
+        CALL {
+            WITH d, c, row
+            MATCH (d)-[:CONTAINS {position: row.position - 1}]->(before)
+            MERGE (before)-[:NEXT {doc_id: d.id, position: row.position - 1}]->(c)
+        }
+        CALL {
+            WITH d, c, row
+            MATCH (d)-[:CONTAINS {position: row.position + 1}]->(after)
+            MERGE (c)-[:NEXT {doc_id: d.id, position: row.position}]->(after)
+        }
+        RETURN count(c) AS created
+        """
+        documents = [
+            {
+                "id": doc["id"],
+                "metadata": json.dumps(doc["metadata"]) if doc.get("metadata") else None,
+                "expires_at": document_expiry(doc.get("metadata"))
+            }
+            for doc in documents
+        ]
+        try:
+            created = 0
+            with self.get_session() as session:
+                session.execute_write(
+                    lambda tx: tx.run(document_query, documents=documents, ingested_at=time.time()).consume()
+                )
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    NEO4J_WRITE_BATCH_SIZE.observe(len(batch), operation="import_batch")
+                    with NEO4J_WRITE_SECONDS.time(operation="import_batch"):
+                        created += session.execute_write(
+                            lambda tx: tx.run(chunk_query, rows=batch).single()["created"]
+                        )
+            if created != len(rows):
+                raise RuntimeError(f"Expected to create {len(rows)} chunks, created {created}")
+            return created
+        except Exception as e:
+            logger.error(f"Error importing batch: {str(e)}", exc_info=True)
+            raise
+
+    def link_similar_chunks(self, chunks: List[Tuple[str, list]], k: int = None, min_score: float = None) -> int:
+        """Add SIMILAR_TO edges from new chunks to their nearest stored chunks.
+
+        `chunks` are (chunk_id, embedding) pairs. Each gets at most `k`
+        edges, to vector-index neighbours scoring at least `min_score`; a
+        pair already linked in either direction is only rescored. Chunks
+        written moments ago may not be indexed yet, so this is approximate.
+        Returns the number of edges merged.
+        """
+        k = settings.GRAPH_SIMILAR_K if k is None else k
+        min_score = settings.GRAPH_SIMILAR_MIN_SCORE if min_score is None else min_score
+        if not chunks or k <= 0:
+            return 0
+        query = """
+        UNWIND $rows AS row
+        MATCH (c:Chunk {id: row.id})
+        CALL db.index.vector.queryNodes('chunk_embeddings', $k + 1, row.embedding)
+        YIELD node, score
+        WITH c, node, score
+        WHERE node <> c AND score >= $min_score
+        WITH c, node, score ORDER BY score DESC
+        WITH c, collect({node: node, score: score})[..$k] AS neighbors
+        UNWIND neighbors AS neighbor
+        WITH c, neighbor.node AS other, neighbor.score AS score
+        MERGE (c)-[s:SIMILAR_TO]-(other)
+        SET s.score = score
+        RETURN count(s) AS linked
+        """
+        rows = [{"id": chunk_id, "embedding": embedding} for chunk_id, embedding in chunks]
+        try:
+            with self.get_session() as session:
+                NEO4J_WRITE_BATCH_SIZE.observe(len(rows), operation="link_similar")
+                with NEO4J_WRITE_SECONDS.time(operation="link_similar"):
+                    linked = session.execute_write(
+                        lambda tx: tx.run(query, rows=rows, k=k, min_score=min_score).single()["linked"]
+                    )
+            logger.debug(f"Linked {len(rows)} chunks to similar chunks with {linked} edges")
+            return linked
+        except Exception as e:
+            logger.error(f"Error linking similar chunks: {str(e)}")
+            raise
+
+    def iter_unlinked_chunks(self, batch_size: int = 500) -> Iterator[List[Tuple[str, list]]]:
+        """Yield (chunk_id, embedding) batches of chunks without SIMILAR_TO edges, by id."""
+        query = """
+        MATCH (c:Chunk)
+        WHERE c.id > $after AND c.embedding IS NOT NULL AND NOT (c)-[:SIMILAR_TO]-()
+        RETURN c.id AS id, c.embedding AS embedding
+        ORDER BY c.id
+        LIMIT $limit
+        """
+        after = ""
+        while True:
+            with self.get_session() as session:
+                batch = [(record["id"], record["embedding"]) for record in session.run(query, after=after, limit=batch_size)]
+            if not batch:
+                return
+            yield batch
+            after = batch[-1][0]
+
+    def expand_similar_chunks(self, embedding: list, seeds: int, per_seed: int, neighbors: int) -> Tuple[List[dict], List[dict]]:
+        """Return `seeds` vector-index hits and up to `neighbors` chunks one NEXT or SIMILAR_TO hop away."""
+        try:
+            with self.get_session() as session:
+                record = session.run(
+                    EXPAND_SIMILAR_CHUNKS_QUERY, embedding=embedding, seeds=seeds, per_seed=per_seed, neighbors=neighbors
+                ).single()
+                return record["seeds"], record["neighbors"]
+        except Exception as e:
+            logger.error(f"Error expanding similar chunks: {str(e)}")
             raise
 
     def search_similar_chunks(self, embedding: list, limit: int = 5):
         try:
+            with self.get_session() as session:
+                result = session.run(SEARCH_SIMILAR_CHUNKS_QUERY, embedding=embedding, limit=limit)
+                chunks = [record for record in result]
+                logger.debug(f"Found {len(chunks)} similar chunks")
+                return chunks
+        except Exception as e:
+            logger.error(f"Error searching similar chunks: {str(e)}")
+            raise
+
+    def get_chunks_by_ids(self, chunk_ids: List[str], include_embedding: bool = False) -> dict:
+        """Fetch chunks for the given ids, keyed by chunk id."""
+        try:
+            with self.get_session() as session:
+                result = session.run(GET_CHUNKS_BY_IDS_QUERY, ids=chunk_ids, include_embedding=include_embedding)
+                return {record["id"]: record.data() for record in result}
+        except Exception as e:
+            logger.error(f"Error fetching chunks by id: {str(e)}")
+            raise
+
+    def iter_graph(self, limit: int, cursor: Optional[str] = None, skip: int = 0,
+                   include_embeddings: bool = False, include_content: bool = False,
+                   preview_chars: int = 200) -> Iterator[Tuple[str, dict]]:
+        """Stream one page of the graph as ("node" | "relationship" | "page", item) events.
+
+        Documents, then chunks, are ordered by their `id`, so each page is a
+        range seek on the uniqueness constraint's index rather than a sort of
+        every node. Pass the returned `next_cursor` back as `cursor` to fetch
+        the following page. Embeddings are left out and content is cut to a
+        preview unless explicitly requested. Events are yielded as records
+        arrive from the Bolt result.
+        """
+        label, after = GRAPH_PAGE_LABELS[0], ""
+        if cursor is not None:
+            label, _, after = cursor.partition(":")
+            if label not in GRAPH_PAGE_LABELS:
+                raise ValueError(f"Invalid graph cursor: {cursor!r}")
+        node_ids, next_cursor = [], None
+        with self.get_session() as session:
+            for label in GRAPH_PAGE_LABELS[GRAPH_PAGE_LABELS.index(label):]:
+                if skip:
+                    # Count store lookup; lets `skip` run past whole labels without reading them
+                    total = session.run(f"MATCH (n:{label}) RETURN count(n) AS total").single()["total"]
+                    if skip >= total:
+                        skip -= total
+                        after = ""
+                        continue
+                result = session.run(
+                    GRAPH_NODES_QUERY.format(label=label),
+                    after=after,
+                    skip=skip,
+                    limit=limit - len(node_ids),
+                    include_embeddings=include_embeddings,
+                    include_content=include_content,
+                    preview_chars=preview_chars
+                )
+                skip, after = 0, ""
+                for record in result:
+                    properties = {key: value for key, value in record["properties"].items() if value is not None}
+                    node_label = properties.get('name') or properties.get('title') or properties.get('label') or 'Unnamed'
+                    node_ids.append(record["id"])
+                    next_cursor = f"{label}:{record['key']}"
+                    yield "node", {
+                        'id': record["id"],
+                        'label': str(node_label),
+                        'type': record["labels"][0] if record["labels"] else 'Unknown',
+                        'properties': properties
+                    }
+                if len(node_ids) == limit:
+                    break
+            if node_ids:
+                result = session.run(GRAPH_RELATIONSHIPS_QUERY, ids=node_ids)
+                for record in result:
+                    yield "relationship", {
+                        'startNode': record["start"],
+                        'endNode': record["end"],
+                        'type': record["type"],
+                        'properties': {key: value for key, value in record["properties"].items() if value is not None}
+                    }
+        logger.debug(f"Streamed graph page with {len(node_ids)} nodes")
+        yield "page", {"next_cursor": next_cursor if len(node_ids) == limit else None, "nodes": len(node_ids)}
+
+    def graph_summary(self, top_n: int = 200) -> dict:
+        """Level-of-detail view: counts, degree stats and the top documents.
+
+        Chunks are collapsed into their Document, whose properties carry the
+        chunk count and degree. Relationships between chunks of different
+        top documents are aggregated into weighted document-to-document edges.
+        Label and relationship counts come from the count store.
+        """
+        with self.get_session() as session:
+            labels = [record["label"] for record in session.run("CALL db.labels() YIELD label RETURN label")]
+            types = [record["type"] for record in session.run("CALL db.relationshipTypes() YIELD relationshipType AS type RETURN type")]
+            label_counts = {
+                label: session.run(f"MATCH (n:`{label.replace('`', '``')}`) RETURN count(n) AS total").single()["total"]
+                for label in labels
+            }
+            relationship_counts = {
+                rel_type: session.run(f"MATCH ()-[r:`{rel_type.replace('`', '``')}`]->() RETURN count(r) AS total").single()["total"]
+                for rel_type in types
+            }
+            total_nodes = session.run("MATCH (n) RETURN count(n) AS total").single()["total"]
+            degree = session.run(GRAPH_DOCUMENT_DEGREE_QUERY).single().data()
+
+            nodes = []
+            for record in session.run(GRAPH_TOP_DOCUMENTS_QUERY, limit=top_n):
+                nodes.append({
+                    'id': record["id"],
+                    'label': _document_label(record["doc_id"], record["metadata"]),
+                    'type': 'Document',
+                    'properties': {
+                        'id': record["doc_id"],
+                        'chunk_count': record["chunk_count"],
+                        'degree': record["degree"],
+                        'collapsed': True
+                    }
+                })
+            relationships = [
+                {
+                    'startNode': record["start"],
+                    'endNode': record["end"],
+                    'type': record["type"],
+                    'properties': {'weight': record["weight"]}
+                }
+                for record in session.run(GRAPH_DOCUMENT_LINKS_QUERY, ids=[node['id'] for node in nodes])
+            ]
+
+        return {
+            'nodes': nodes,
+            'relationships': relationships,
+            'stats': {
+                'total_nodes': total_nodes,
+                'total_relationships': sum(relationship_counts.values()),
+                'labels': label_counts,
+                'relationship_types': relationship_counts,
+                'chunks_per_document': degree,
+                'documents_shown': len(nodes)
+            }
+        }
+
+    def document_neighborhood(self, doc_id: str, limit: int = 500, preview_chars: int = 200) -> Optional[dict]:
+        """Expand one Document into its chunks and the links between them."""
+        with self.get_session() as session:
+            record = session.run(
+                GRAPH_DOCUMENT_NEIGHBORHOOD_QUERY,
+                doc_id=doc_id,
+                limit=limit,
+                preview_chars=preview_chars
+            ).single()
+            if record is None:
+                return None
+            chunks = record["chunks"]
+            nodes = [{
+                'id': record["doc_element_id"],
+                'label': _document_label(record["doc_id"], record["metadata"]),
+                'type': 'Document',
+                'properties': {'id': record["doc_id"], 'chunk_count': len(chunks)}
+            }]
+            relationships = []
+            for chunk in chunks:
+                nodes.append({
+                    'id': chunk["id"],
+                    'label': 'Unnamed',
+                    'type': 'Chunk',
+                    'properties': {'id': chunk["chunk_id"], 'content': chunk["preview"]}
+                })
+                relationships.append({
+                    'startNode': record["doc_element_id"],
+                    'endNode': chunk["id"],
+                    'type': 'CONTAINS',
+                    'properties': {}
+                })
+            for link in session.run(GRAPH_CHUNK_LINKS_QUERY, ids=[chunk["id"] for chunk in chunks]):
+                relationships.append({
+                    'startNode': link["start"],
+                    'endNode': link["end"],
+                    'type': link["type"],
+                    'properties': {key: value for key, value in link["properties"].items() if value is not None}
+                })
+        return {'nodes': nodes, 'relationships': relationships}
+
+    def count_chunks(self) -> int:
+        with self.get_session() as session:
+            return session.run("MATCH (c:Chunk) RETURN count(c) AS total").single()["total"]
+
+    def iter_chunk_embeddings(self, batch_size: int = 5000) -> Iterator[Tuple[List[str], List[list]]]:
+        """Yield (chunk_ids, embeddings) pages of all chunks, ordered by id.
+
+        Pages are keyed on the last seen id so each query is an index seek on
+        the chunk_id constraint rather than an ever-growing SKIP.
+        """
+        last_id = ""
+        while True:
             with self.get_session() as session:
                 query = """
-                CALL db.index.vector.queryNodes('chunk_embeddings', $limit, $embedding)
-                YIELD node, score
-                RETURN node.content as content, score
-                ORDER BY score DESC
+                MATCH (c:Chunk)
+                WHERE c.id > $last_id AND c.embedding IS NOT NULL
+                RETURN c.id as id, c.embedding as embedding
+                ORDER BY c.id
+                LIMIT $limit
                 """
-                result = session.run(query, embedding=embedding, limit=limit)
-                chunks = [record for record in result]
-                logger.info(f"Found {len(chunks)} similar chunks")
+                records = list(session.run(query, last_id=last_id, limit=batch_size))
+            if not records:
+                return
+            yield [record["id"] for record in records], [record["embedding"] for record in records]
+            last_id = records[-1]["id"]
+
+class AsyncNeo4jConnection:
+    """Neo4j connection backed by the async driver, for the request path.
+
+    It keeps its own connection pool so awaiting a query never blocks the
+    event loop or competes with ingestion for the synchronous pool. The
+    driver is created on first use inside the running event loop.
+    """
+
+    def __init__(self):
+        self._driver: Optional[AsyncDriver] = None
+
+    async def connect_with_retry(self, max_retries=5, retry_delay=5):
+        for attempt in range(max_retries):
+            try:
+                logger.info(f"Attempting async connection to Neo4j at {settings.NEO4J_URI}")
+                self._driver = AsyncGraphDatabase.driver(settings.NEO4J_URI, **_driver_config())
+                async with self._driver.session() as session:
+                    await session.run("RETURN 1")
+                logger.info("Successfully connected to Neo4j (async)")
+                return
+            except Exception as e:
+                if attempt < max_retries - 1:
+                    logger.warning(f"Failed to connect to Neo4j (attempt {attempt + 1}/{max_retries}): {str(e)}")
+                    await asyncio.sleep(retry_delay)
+                else:
+                    logger.error(f"Failed to connect to Neo4j after {max_retries} attempts: {str(e)}")
+                    raise
+
+    async def close(self):
+        if self._driver:
+            await self._driver.close()
+            self._driver = None
+
+    async def get_session(self):
+        if not self._driver:
+            await self.connect_with_retry()
+        return _TrackedSession(self._driver.session(), "async")
+
+    async def search_similar_chunks(self, embedding: list, limit: int = 5) -> List[dict]:
+        try:
+            async with await self.get_session() as session:
+                result = await session.run(SEARCH_SIMILAR_CHUNKS_QUERY, embedding=embedding, limit=limit)
+                chunks = await result.data()
+                logger.debug(f"Found {len(chunks)} similar chunks")
                 return chunks
         except Exception as e:
             logger.error(f"Error searching similar chunks: {str(e)}")
             raise
 
-db = Neo4jConnection() 
\ No newline at end of file
+    async def search_similar_chunks_batch(self, embeddings: List[list], limit: int = 5) -> List[List[dict]]:
+        """Run several vector searches in one round trip; results follow `embeddings`."""
+        if not embeddings:
+            return []
+        try:
+            async with await self.get_session() as session:
+                result = await session.run(BATCH_SEARCH_SIMILAR_CHUNKS_QUERY, embeddings=embeddings, limit=limit)
+                return [record["chunks"] for record in await result.data()]
+        except Exception as e:
+            logger.error(f"Error searching similar chunks in batch: {str(e)}")
+            raise
+
+    async def expand_similar_chunks(self, embedding: list, seeds: int, per_seed: int,
+                                    neighbors: int) -> Tuple[List[dict], List[dict]]:
+        """Awaitable `Neo4jConnection.expand_similar_chunks`."""
+        try:
+            async with await self.get_session() as session:
+                result = await session.run(
+                    EXPAND_SIMILAR_CHUNKS_QUERY, embedding=embedding, seeds=seeds, per_seed=per_seed, neighbors=neighbors
+                )
+                record = await result.single()
+                return record["seeds"], record["neighbors"]
+        except Exception as e:
+            logger.error(f"Error expanding similar chunks: {str(e)}")
+            raise
+
+    async def get_chunks_by_ids(self, chunk_ids: List[str], include_embedding: bool = False) -> dict:
+        """Fetch chunks for the given ids, keyed by chunk id."""
+        try:
+            async with await self.get_session() as session:
+                result = await session.run(GET_CHUNKS_BY_IDS_QUERY, ids=chunk_ids, include_embedding=include_embedding)
+                return {record["id"]: record for record in await result.data()}
+        except Exception as e:
+            logger.error(f"Error fetching chunks by id: {str(e)}")
+            raise
+
+    async def get_index_status(self, name: str) -> Optional[dict]:
+        """Return the state and population progress of an index, or None if it doesn't exist."""
+        async with await self.get_session() as session:
+            result = await session.run(INDEX_STATUS_QUERY, name=name)
+            record = await result.single()
+            if record is None:
+                return None
+            return {"state": record["state"], "population_percent": record["population_percent"]}
+
+db = Neo4jConnection()
+async_db = AsyncNeo4jConnection() 
\ No newline at end of file
@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Hits refresh an entry's LRU timestamp at most this often, so hot entries
+# don't turn every read into a write.
+TOUCH_INTERVAL = 60.0
+# SQLite limits the number of bound parameters per statement.
+MAX_PARAMS = 500
+
+
+def content_hash(text: str) -> str:
+    """Return the content address used as the cache key for `text`."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _slot_tag(key: str) -> int:
+    """Non-zero 64-bit tag written beside a vector to identify its key; 0 marks a slot being written."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+class EmbeddingStore:
+    """Disk-backed, size-bounded LRU store of float32 embeddings for one model.
+
+    Vectors live in a fixed-capacity float32 record file that is memory-mapped,
+    so reads are served from the page cache without copying and all processes
+    mapping the file share the same pages. A SQLite index (WAL mode) maps
+    content hashes to record slots and tracks last use for LRU eviction;
+    writers serialize through SQLite's write lock, which makes the store safe
+    to share between uvicorn workers.
+
+    A writer may overwrite an evicted slot before its transaction commits,
+    while other workers still see the old key mapped to it. Each slot
+    therefore carries a tag of its key in a second memory-mapped file, cleared
+    while the vector is written; a read whose tag does not match the key
+    before and after the copy is counted as a miss.
+    """
+
+    def __init__(self, directory: str, model: str, capacity: int):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.memmap] = None
+        self._tags: Optional[np.memmap] = None
+        self._dim: Optional[int] = None
+
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self._data_path = os.path.join(directory, f"{name}.f32")
+        self._tag_path = os.path.join(directory, f"{name}.tags")
+        self._conn = sqlite3.connect(
+            os.path.join(directory, f"{name}.sqlite"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        # Drop entries that no longer fit if the configured capacity shrank
+        self._conn.execute("DELETE FROM entries WHERE slot >= ?", (capacity,))
+        self._conn.execute("DELETE FROM free_slots WHERE slot >= ?", (capacity,))
+        self._load_vectors()
+
+    def _load_vectors(self) -> bool:
+        """Map the record file if any process has already fixed the dimension."""
+        if self._vectors is None:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            if row:
+                self._open_vectors(row[0])
+        return self._vectors is not None
+
+    def _open_vectors(self, dim: int):
+        for path, size in ((self._data_path, self.capacity * dim * 4), (self._tag_path, self.capacity * 8)):
+            if not os.path.exists(path) or os.path.getsize(path) < size:
+                # Sparse file; pages are only allocated once written
+                with open(path, "ab") as f:
+                    f.truncate(size)
+        self._vectors = np.memmap(self._data_path, dtype=np.float32, mode="r+", shape=(self.capacity, dim))
+        self._tags = np.memmap(self._tag_path, dtype=np.uint64, mode="r+", shape=(self.capacity,))
+        self._dim = dim
+
+    def _write_slot(self, slot: int, key: str, vector: np.ndarray):
+        self._tags[slot] = 0
+        self._vectors[slot] = vector
+        self._tags[slot] = _slot_tag(key)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return a copy of the cached vector for `key`, or None."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up many keys at once; missing keys are absent from the result."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            if not self._load_vectors():
+                self.misses += len(keys)
+                return found
+            stale = []
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), MAX_PARAMS):
+                batch = unique_keys[start:start + MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT key, slot, last_used FROM entries WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, slot, last_used in rows:
+                    # Another worker may be overwriting the slot for an uncommitted eviction
+                    tag = _slot_tag(key)
+                    if self._tags[slot] != tag:
+                        continue
+                    vector = np.array(self._vectors[slot], copy=True)
+                    if self._tags[slot] != tag:
+                        continue
+                    found[key] = vector
+                    if now - last_used > TOUCH_INTERVAL:
+                        stale.append((now, key))
+            if stale:
+                self._conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", stale)
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put(self, key: str, vector: List[float]):
+        self.put_many({key: vector})
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        """Store vectors, evicting least recently used entries when full."""
+        if not vectors:
+            return
+        matrix = np.asarray(list(vectors.values()), dtype=np.float32)
+        with self._lock:
+            if not self._load_vectors():
+                self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (matrix.shape[1],))
+                self._load_vectors()
+            if matrix.shape[1] != self._dim:
+                logger.warning(f"Not caching embeddings of dimension {matrix.shape[1]}, store expects {self._dim}")
+                return
+
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, vector in zip(vectors.keys(), matrix):
+                    row = self._conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        if self._tags[row[0]] != _slot_tag(key):
+                            # Clobbered by a rolled-back eviction, or written before slots were tagged
+                            self._write_slot(row[0], key, vector)
+                        continue
+                    slot = self._free_slot()
+                    self._write_slot(slot, key, vector)
+                    self._conn.execute(
+                        "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                        (key, slot, now)
+                    )
+                self._vectors.flush()
+                self._tags.flush()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _free_slot(self) -> int:
+        row = self._conn.execute("SELECT slot FROM free_slots LIMIT 1").fetchone()
+        if row:
+            self._conn.execute("DELETE FROM free_slots WHERE slot = ?", row)
+            return row[0]
+        max_slot = self._conn.execute("SELECT max(slot) FROM entries").fetchone()[0]
+        if max_slot is None:
+            return 0
+        if max_slot + 1 < self.capacity:
+            return max_slot + 1
+        key, slot = self._conn.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT 1").fetchone()
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return slot
+
+    def delete_many(self, keys: List[str]) -> int:
+        """Remove entries, returning their slots to the free list."""
+        deleted = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(keys), MAX_PARAMS):
+                    batch = keys[start:start + MAX_PARAMS]
+                    placeholders = ','.join('?' * len(batch))
+                    self._conn.execute(
+                        f"INSERT OR IGNORE INTO free_slots SELECT slot FROM entries WHERE key IN ({placeholders})",
+                        batch
+                    )
+                    deleted += self._conn.execute(f"DELETE FROM entries WHERE key IN ({placeholders})", batch).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT count(*) FROM entries").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "capacity": self.capacity,
+                "dimensions": self._dim,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._tags.flush()
+                self._vectors = None
+                self._tags = None
+            self._conn.close()
@@ -0,0 +1,95 @@
+# Imported by the extraction worker processes: keep it free of imports that
+# open connections at import time (database, llm).
+import codecs
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional
+
+import PyPDF2
+
+from .chunking import Chunk, iter_text_chunks
+
+TEXT_READ_SIZE = 64 * 1024
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def iter_pdf_pages(stream: BinaryIO) -> Iterator[str]:
+    """Yield the text of each PDF page; pages are parsed lazily."""
+    reader = PyPDF2.PdfReader(stream)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def iter_text_blocks(stream: BinaryIO, encoding: str = "utf-8") -> Iterator[str]:
+    """Yield decoded blocks of a text file without reading it all at once."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        block = stream.read(TEXT_READ_SIZE)
+        if not block:
+            break
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_text_file(path: str, encoding: str = "utf-8") -> Iterator[str]:
+    with open(path, "rb") as f:
+        yield from iter_text_blocks(f, encoding)
+
+
+def pdf_page_count(path: str) -> int:
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) of a PDF file."""
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [reader.pages[i].extract_text() or "" for i in range(start, min(end, len(reader.pages)))]
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the shared extraction process pool, creating it on first use.
+
+    Workers are spawned rather than forked so they don't inherit the API
+    process's driver threads and sockets.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def iter_pdf_pages_parallel(path: str, pool: ProcessPoolExecutor, pages_per_task: int = 8, lookahead: int = 2) -> Iterator[str]:
+    """Yield PDF page texts in order, extracting page ranges in a process pool.
+
+    At most `lookahead` ranges are in flight, which bounds the pages held in
+    memory while keeping extraction ahead of the consumer.
+    """
+    total = pool.submit(pdf_page_count, path).result()
+    pending = deque()
+    next_start = 0
+    while next_start < total or pending:
+        while next_start < total and len(pending) < lookahead:
+            pending.append(pool.submit(extract_pdf_pages, path, next_start, next_start + pages_per_task))
+            next_start += pages_per_task
+        yield from pending.popleft().result()
+
+
+def extract_chunks(source: str, is_pdf: bool = False, is_text: bool = False, chunk_size: Optional[int] = None) -> List[Chunk]:
+    """Extract and chunk one document: a file path, or raw text if `is_text`."""
+    if is_text:
+        return list(iter_text_chunks([source], chunk_size))
+    if is_pdf:
+        with open(source, "rb") as f:
+            return list(iter_text_chunks(iter_pdf_pages(f), chunk_size, paged=True))
+    return list(iter_text_chunks(iter_text_file(source), chunk_size))
@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from .config import get_settings
+from .database import db
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class GraphSummaryCache:
+    """TTL cache for level-of-detail graph views.
+
+    Summaries aggregate over every document, so they are computed once per
+    parameter set and reused until the TTL runs out or ingestion changes the
+    graph. Concurrent misses for the same key share one computation. Keys come
+    from request parameters, so the least recently used entry is evicted when
+    full, and None results (unknown documents) are not cached.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        # Per-key lock and the number of callers holding or waiting for it; dropped when unused
+        self._key_locks: Dict[Hashable, List] = {}
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry[0] <= cutoff]:
+            del self._entries[key]
+
+    def _lookup(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                with self._lock:
+                    # Another caller may have computed it while this one waited
+                    entry = self._lookup(key)
+                    if entry is not None:
+                        return entry[1]
+                    self.misses += 1
+                value = compute()
+                if value is not None:
+                    with self._lock:
+                        self._expire()
+                        self._entries[key] = (time.monotonic(), value)
+                        while len(self._entries) > self.max_entries:
+                            self._entries.popitem(last=False)
+                return value
+        finally:
+            with self._lock:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self._key_locks[key]
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+graph_summary_cache = GraphSummaryCache(settings.GRAPH_SUMMARY_TTL, settings.GRAPH_SUMMARY_MAX_ENTRIES)
+
+
+def get_graph_summary(top_n: int) -> dict:
+    return graph_summary_cache.get_or_compute(("summary", top_n), lambda: db.graph_summary(top_n))
+
+
+def get_document_neighborhood(doc_id: str, limit: int) -> Optional[dict]:
+    return graph_summary_cache.get_or_compute(
+        ("document", doc_id, limit),
+        lambda: db.document_neighborhood(doc_id, limit, settings.GRAPH_PREVIEW_CHARS)
+    )
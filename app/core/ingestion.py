@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .chunking import Chunk, StreamingChunker
+from .config import get_settings
+from .database import db
+from .embedding_cache import content_hash
+from .llm import ollama_service
+from .vector_index import vector_index, LOCAL_INDEX_MODES
+from .answer_cache import answer_cache
+from .graph_summary import graph_summary_cache
+from .metrics import INGEST_CHUNKS, INGEST_CHUNKS_PER_SECOND
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output on its queue
+_DONE = object()
+
+
+class EmptyDocumentError(ValueError):
+    """Raised when no text could be extracted from an upload."""
+
+
+class IngestionPipeline:
+    """Extract, chunk, embed and write one document as a streaming pipeline.
+
+    Three stages are connected by bounded queues: segment extraction runs in
+    a worker thread, chunking carries text across segment boundaries and
+    records each chunk's source offsets and page, and embed-and-write
+    handles fixed-size batches. A full queue blocks the stage feeding it, so
+    memory stays flat whatever the file size and the first batches are
+    searchable before the last pages are parsed.
+
+    Chunks are identified by a hash of their content. Only chunks that are
+    not already stored for some document are embedded, and with `update`
+    the positions whose chunk and start offset are unchanged since the last
+    ingestion of `doc_id` are skipped entirely; stale positions and orphaned
+    chunks are pruned at the end.
+    """
+
+    def __init__(self, doc_id: str, metadata: dict, executor: Optional[Executor] = None, update: bool = False,
+                 paged: bool = False):
+        self.doc_id = doc_id
+        self.metadata = metadata
+        self.executor = executor
+        self.update = update
+        # Segments are pages, so chunks record the page they start on
+        self.paged = paged
+        self.segments_read = 0
+        self.characters = 0
+        self.chunks_seen = 0
+        self.chunks_embedded = 0
+        self.chunks_written = 0
+        # Chunks left as they were, and changed chunks whose content was already stored
+        self.chunks_unchanged = 0
+        self.chunks_reused = 0
+        self.chunks_removed = 0
+        # Chunk id and start offset stored at each position before this run, for update mode
+        self._stored: Dict[int, Tuple[str, Optional[int]]] = {}
+        self._replaced: Set[str] = set()
+        self.started_at: Optional[float] = None
+        # Attempts per chunk index, for chunks whose batch had to be retried
+        self.chunk_retries: Dict[int, int] = {}
+        self.failed_chunks: List[int] = []
+        self._document_created = False
+        self._stop = threading.Event()
+
+    def _produce(self, segments: Iterator[str], queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        """Run the extraction generator, blocking while the queue is full."""
+        try:
+            for segment in segments:
+                if self._stop.is_set():
+                    return
+                self.segments_read += 1
+                self.characters += len(segment)
+                asyncio.run_coroutine_threadsafe(queue.put(segment), loop).result()
+        finally:
+            asyncio.run_coroutine_threadsafe(queue.put(_DONE), loop).result()
+
+    async def _chunk(self, segments: asyncio.Queue, batches: asyncio.Queue):
+        chunker = StreamingChunker(settings.CHUNK_SIZE, settings.CHUNK_OVERLAP, settings.CHUNK_BOUNDARY, self.paged)
+        batch: List[Chunk] = []
+        while True:
+            segment = await segments.get()
+            chunks = chunker.finish() if segment is _DONE else chunker.feed(segment)
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= settings.INGEST_CHUNK_BATCH_SIZE:
+                    await batches.put(batch)
+                    batch = []
+            if segment is _DONE:
+                break
+        if batch:
+            await batches.put(batch)
+        await batches.put(_DONE)
+
+    async def _write_batch(self, first_index: int, batch: List[Chunk]):
+        loop = asyncio.get_running_loop()
+        if not self._document_created:
+            await loop.run_in_executor(self.executor, db.create_document, self.doc_id, None, self.metadata)
+            self._document_created = True
+        chunk_ids = [content_hash(chunk.text) for chunk in batch]
+        changed = [
+            (first_index + i, chunk_id, chunk)
+            for i, (chunk_id, chunk) in enumerate(zip(chunk_ids, batch))
+            if self._stored.get(first_index + i) != (chunk_id, chunk.start)
+        ]
+        if changed:
+            existing = await loop.run_in_executor(
+                self.executor, db.existing_chunk_ids, list({chunk_id for _, chunk_id, _ in changed})
+            )
+            new_chunks = {chunk_id: chunk.text for _, chunk_id, chunk in changed if chunk_id not in existing}
+            embeddings = dict(zip(new_chunks, await ollama_service.embed_many(list(new_chunks.values())))) if new_chunks else {}
+            rows = [
+                (chunk_id, chunk.text, embeddings.get(chunk_id), position, chunk.start, chunk.end, chunk.page)
+                for position, chunk_id, chunk in changed
+            ]
+            missing = await loop.run_in_executor(self.executor, db.create_chunks_bulk, self.doc_id, rows)
+            # Reused chunks deleted since the existence check were recreated without their embedding
+            missing = set(missing) - set(embeddings)
+            recreated = {chunk_id: chunk.text for _, chunk_id, chunk in changed if chunk_id in missing}
+            if recreated:
+                logger.info(f"Re-embedding {len(recreated)} chunks of document {self.doc_id} deleted while it was written")
+                vectors = dict(zip(recreated, await ollama_service.embed_many(list(recreated.values()))))
+                await loop.run_in_executor(self.executor, db.set_chunk_embeddings, list(vectors.items()))
+                embeddings.update(vectors)
+                new_chunks.update(recreated)
+            if embeddings and settings.GRAPH_SIMILAR_K > 0:
+                await self._link_similar(embeddings)
+            self._replaced.update(self._stored[position][0] for position, _, _ in changed if position in self._stored)
+            if settings.VECTOR_SEARCH_MODE in LOCAL_INDEX_MODES and embeddings:
+                vector_index.add(list(embeddings), list(embeddings.values()))
+            # New chunks can change what an earlier answer would have been based on
+            answer_cache.invalidate()
+            graph_summary_cache.invalidate()
+            self.chunks_embedded += len(new_chunks)
+            self.chunks_reused += len(changed) - len(new_chunks)
+        self.chunks_unchanged += len(batch) - len(changed)
+        self.chunks_written += len(batch)
+
+    async def _link_similar(self, embeddings: Dict[str, list]):
+        """Link new chunks to similar stored ones; a failure only costs graph-walk recall."""
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, db.link_similar_chunks, list(embeddings.items())
+            )
+        except Exception as e:
+            logger.warning(f"Skipped SIMILAR_TO edges for {len(embeddings)} chunks of document {self.doc_id}: {str(e)}")
+
+    async def _prune(self):
+        """Unlink positions past the new end and delete chunks no document contains."""
+        loop = asyncio.get_running_loop()
+        removed = await loop.run_in_executor(
+            self.executor, db.prune_document_chunks, self.doc_id, self.chunks_seen, list(self._replaced)
+        )
+        self.chunks_removed = len(removed)
+        if removed:
+            if settings.VECTOR_SEARCH_MODE in LOCAL_INDEX_MODES:
+                vector_index.remove(removed)
+            answer_cache.invalidate()
+            graph_summary_cache.invalidate()
+
+    async def _write(self, batches: asyncio.Queue):
+        while True:
+            batch = await batches.get()
+            if batch is _DONE:
+                return
+            first_index = self.chunks_seen
+            self.chunks_seen += len(batch)
+            for attempt in range(settings.INGEST_BATCH_MAX_RETRIES + 1):
+                try:
+                    await self._write_batch(first_index, batch)
+                    break
+                except Exception as e:
+                    indices = range(first_index, first_index + len(batch))
+                    if attempt == settings.INGEST_BATCH_MAX_RETRIES:
+                        # Chunk writes are idempotent, so a failed batch can be re-ingested later
+                        logger.error(f"Giving up on chunks {first_index}-{indices[-1]} of document {self.doc_id}: {str(e)}")
+                        self.failed_chunks.extend(indices)
+                        break
+                    for index in indices:
+                        self.chunk_retries[index] = attempt + 1
+                    logger.warning(f"Retrying chunks {first_index}-{indices[-1]} of document {self.doc_id} (attempt {attempt + 1}): {str(e)}")
+                    await asyncio.sleep(settings.EMBEDDING_RETRY_BACKOFF * (2 ** attempt))
+            logger.debug(f"Wrote {self.chunks_written} chunks for document {self.doc_id}")
+
+    async def run(self, segments: Iterator[str]) -> dict:
+        self.started_at = time.time()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        if self.update:
+            self._stored = await loop.run_in_executor(self.executor, db.get_document_chunks, self.doc_id)
+        segment_queue = asyncio.Queue(maxsize=settings.INGEST_SEGMENT_QUEUE_SIZE)
+        batch_queue = asyncio.Queue(maxsize=settings.INGEST_BATCH_QUEUE_SIZE)
+        tasks = [
+            # The producer blocks for the whole run, so keep it off the shared executor
+            loop.run_in_executor(None, self._produce, segments, segment_queue, loop),
+            asyncio.ensure_future(self._chunk(segment_queue, batch_queue)),
+            asyncio.ensure_future(self._write(batch_queue))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            self._stop.set()
+            for task in tasks[1:]:
+                task.cancel()
+            # Unblock the producer if it is waiting on a full queue
+            while not segment_queue.empty():
+                segment_queue.get_nowait()
+            raise
+
+        if self.chunks_seen == 0:
+            raise EmptyDocumentError("No text content could be extracted from the file")
+        if self.chunks_written == 0:
+            raise RuntimeError(f"All {self.chunks_seen} chunks failed to process")
+        if self.update:
+            await self._prune()
+
+        elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            INGEST_CHUNKS_PER_SECOND.observe(self.chunks_written / elapsed)
+        INGEST_CHUNKS.inc(self.chunks_embedded, result="embedded")
+        INGEST_CHUNKS.inc(self.chunks_reused, result="reused")
+        INGEST_CHUNKS.inc(self.chunks_unchanged, result="unchanged")
+        logger.info(
+            f"Ingested document {self.doc_id}: {self.segments_read} segments, {self.characters} characters, "
+            f"{self.chunks_written} chunks ({self.chunks_embedded} embedded, {self.chunks_reused} reused, "
+            f"{self.chunks_unchanged} unchanged, {self.chunks_removed} removed) in {elapsed:.2f}s"
+        )
+        return {
+            "segments": self.segments_read,
+            "characters": self.characters,
+            "chunks": self.chunks_written,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_reused": self.chunks_reused,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_removed": self.chunks_removed,
+            "failed_chunks": len(self.failed_chunks),
+            "seconds": elapsed
+        }
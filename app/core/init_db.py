@@ -1,39 +1,220 @@
-from .database import db
+from .database import db, INDEX_STATUS_QUERY
+from .config import get_settings
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
 import logging
+import time
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
+SCHEMA_NAME = "graph_rag"
+VECTOR_INDEX_NAME = "chunk_embeddings"
+VECTOR_SIMILARITY_FUNCTION = "cosine"
+
+# Output dimensions of common Ollama embedding models; others are probed
+KNOWN_EMBEDDING_DIMENSIONS = {
+    "nomic-embed-text": 768,
+    "mxbai-embed-large": 1024,
+    "snowflake-arctic-embed": 1024,
+    "bge-m3": 1024,
+    "bge-large": 1024,
+    "all-minilm": 384,
+}
+
+GET_SCHEMA_VERSION_QUERY = """
+MATCH (s:SchemaVersion {name: $name})
+RETURN s.version AS version, s.embedding_model AS embedding_model,
+       s.vector_dimensions AS vector_dimensions, s.similarity_function AS similarity_function
+"""
+
+SET_SCHEMA_VERSION_QUERY = """
+MERGE (s:SchemaVersion {name: $name})
+SET s.version = $version,
+    s.embedding_model = $embedding_model,
+    s.vector_dimensions = $vector_dimensions,
+    s.similarity_function = $similarity_function,
+    s.updated_at = datetime()
+"""
+
+@lru_cache()
+def embedding_dimensions() -> int:
+    """Dimension of the configured embedding model's vectors.
+
+    EMBEDDING_DIMENSIONS takes precedence, then the known-model table; an
+    unknown model is asked for one embedding and measured.
+    """
+    if settings.EMBEDDING_DIMENSIONS:
+        return settings.EMBEDDING_DIMENSIONS
+    model = settings.EMBEDDING_MODEL.split(":")[0]
+    if model in KNOWN_EMBEDDING_DIMENSIONS:
+        return KNOWN_EMBEDDING_DIMENSIONS[model]
+    from .llm import ollama_service
+    dimensions = len(ollama_service.generate_embedding("dimension probe"))
+    logger.info(f"Detected {dimensions}-dimensional embeddings for {settings.EMBEDDING_MODEL}")
+    return dimensions
+
+def get_vector_index_status() -> Optional[dict]:
+    with db.get_session() as session:
+        record = session.run(INDEX_STATUS_QUERY, name=VECTOR_INDEX_NAME).single()
+        return record.data() if record else None
+
 def drop_vector_index():
     try:
         with db.get_session() as session:
-            session.run("DROP INDEX chunk_embeddings IF EXISTS")
+            session.run(f"DROP INDEX {VECTOR_INDEX_NAME} IF EXISTS")
             logger.info("Successfully dropped vector search index")
     except Exception as e:
         logger.error(f"Error dropping vector index: {str(e)}")
         raise
 
-def initialize_database():
+def create_vector_index(dimensions: int):
+    with db.get_session() as session:
+        session.run(f"""
+        CREATE VECTOR INDEX {VECTOR_INDEX_NAME} IF NOT EXISTS
+        FOR (c:Chunk)
+        ON (c.embedding)
+        OPTIONS {{
+            indexConfig: {{
+                `vector.dimensions`: {int(dimensions)},
+                `vector.similarity_function`: '{VECTOR_SIMILARITY_FUNCTION}'
+            }}
+        }}
+        """)
+        logger.info(f"Successfully created {dimensions}-dimensional vector search index")
+
+def ensure_vector_index():
+    """Create the vector index, or recreate it only if its config changed."""
+    dimensions = embedding_dimensions()
+    status = get_vector_index_status()
+    if status is not None:
+        config = (status["options"] or {}).get("indexConfig", {})
+        current = (config.get("vector.dimensions"), str(config.get("vector.similarity_function", "")).lower())
+        if current == (dimensions, VECTOR_SIMILARITY_FUNCTION):
+            logger.info(f"Vector search index is up to date ({status['state']})")
+            return
+        logger.warning(
+            f"Vector search index config {current} does not match ({dimensions}, {VECTOR_SIMILARITY_FUNCTION}); "
+            f"recreating it. Chunks embedded with a different model must be re-ingested."
+        )
+        drop_vector_index()
+    create_vector_index(dimensions)
+
+def wait_for_vector_index(timeout: float, poll_interval: float = 1.0) -> Optional[str]:
+    """Poll until the vector index is ONLINE or the timeout passes; return its state."""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = get_vector_index_status()
+        state = status["state"] if status else None
+        if state in ("ONLINE", "FAILED") or time.monotonic() >= deadline:
+            break
+        logger.info(f"Waiting for vector search index: {state}, {status['population_percent'] if status else 0:.0f}% populated")
+        time.sleep(poll_interval)
+    if state != "ONLINE":
+        logger.warning(f"Vector search index is {state} after {timeout:.0f}s; /health reports not ready until it is ONLINE")
+    return state
+
+def link_consecutive_chunks():
+    """Add the NEXT edges ingestion maintains to documents stored before it did."""
+    with db.get_session() as session:
+        # CALL IN TRANSACTIONS needs an auto-commit transaction, so no execute_write
+        session.run("""
+        MATCH (d:Document)-[r:CONTAINS]->(c:Chunk)
+        WHERE r.position IS NOT NULL
+        CALL {
+            WITH d, r, c
+            MATCH (d)-[:CONTAINS {position: r.position + 1}]->(n:Chunk)
+            MERGE (c)-[:NEXT {doc_id: d.id, position: r.position}]->(n)
+        } IN TRANSACTIONS OF 10000 ROWS
+        """).consume()
+        logger.info("Linked consecutive chunks with NEXT edges")
+
+def index_document_ages():
+    """Index the ingestion and expiry times retention queries by."""
+    with db.get_session() as session:
+        session.run("CREATE INDEX document_ingested_at IF NOT EXISTS FOR (d:Document) ON (d.ingested_at)")
+        session.run("CREATE INDEX document_expires_at IF NOT EXISTS FOR (d:Document) ON (d.expires_at)")
+        # Documents stored before ingestion times were recorded start aging now
+        session.run("""
+        MATCH (d:Document)
+        WHERE d.ingested_at IS NULL
+        CALL {
+            WITH d
+            SET d.ingested_at = $now
+        } IN TRANSACTIONS OF 10000 ROWS
+        """, now=time.time()).consume()
+        logger.info("Indexed document ingestion and expiry times")
+
+def link_similar_chunks(batch_size: int = 500) -> int:
+    """Add SIMILAR_TO edges to every chunk that has none, e.g. after a bulk import."""
+    chunks = 0
+    for batch in db.iter_unlinked_chunks(batch_size):
+        db.link_similar_chunks(batch)
+        chunks += len(batch)
+        logger.info(f"Linked {chunks} chunks to similar chunks")
+    return chunks
+
+# Applied in order; each step must be idempotent, since an older deployment
+# may already have the objects without a recorded version
+MIGRATIONS: List[Tuple[int, str, Callable[[], None]]] = [
+    (1, "document and chunk id constraints", db.create_constraints),
+    (2, "chunk embedding vector index", ensure_vector_index),
+    (3, "NEXT edges between consecutive chunks", link_consecutive_chunks),
+    (4, "document ingestion and expiry time indexes", index_document_ages),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version() -> Optional[dict]:
+    with db.get_session() as session:
+        record = session.run(GET_SCHEMA_VERSION_QUERY, name=SCHEMA_NAME).single()
+        return record.data() if record else None
+
+def set_schema_version(version: int):
+    with db.get_session() as session:
+        session.run(
+            SET_SCHEMA_VERSION_QUERY,
+            name=SCHEMA_NAME,
+            version=version,
+            embedding_model=settings.EMBEDDING_MODEL,
+            vector_dimensions=embedding_dimensions(),
+            similarity_function=VECTOR_SIMILARITY_FUNCTION
+        )
+
+def initialize_database(wait_timeout: Optional[float] = None):
+    """Bring the schema up to SCHEMA_VERSION without touching what is current.
+
+    Pending migrations are applied in order and the version is recorded on a
+    SchemaVersion node. The vector index is reconciled on every run and only
+    rebuilt when the embedding dimension or similarity changed. Startup then
+    waits up to `wait_timeout` seconds for the index to come ONLINE.
+    """
     try:
-        with db.get_session() as session:
-            # Drop existing index if it exists
-            drop_vector_index()
-            
-            # Create vector search index for chunk embeddings
-            session.run("""
-            CREATE VECTOR INDEX chunk_embeddings IF NOT EXISTS
-            FOR (c:Chunk)
-            ON (c.embedding)
-            OPTIONS {
-                indexConfig: {
-                    `vector.dimensions`: 768,
-                    `vector.similarity_function`: 'cosine'
-                }
-            }
-            """)
-            logger.info("Successfully created vector search index")
+        recorded = get_schema_version() or {}
+        applied = recorded.get("version") or 0
+        dimensions = embedding_dimensions()
+        for version, description, migrate in MIGRATIONS:
+            if version > applied:
+                logger.info(f"Applying schema migration {version}: {description}")
+                migrate()
+        if applied >= 2:
+            # Cheap when nothing changed; catches a new model or a dropped index
+            ensure_vector_index()
+        if applied != SCHEMA_VERSION or recorded.get("vector_dimensions") != dimensions or recorded.get("embedding_model") != settings.EMBEDDING_MODEL:
+            set_schema_version(SCHEMA_VERSION)
+        logger.info(f"Database schema at version {SCHEMA_VERSION} (was {applied})")
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
+    return wait_for_vector_index(settings.SCHEMA_INDEX_WAIT_TIMEOUT if wait_timeout is None else wait_timeout)
 
 if __name__ == "__main__":
-    initialize_database() 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Bring the Neo4j schema up to date.")
+    parser.add_argument("--link-similar", action="store_true",
+                        help="Then add SIMILAR_TO edges to chunks without any (after a bulk import or an upgrade)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    initialize_database()
+    if args.link_similar:
+        link_similar_chunks()
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import BinaryIO, Optional
+
+from .config import get_settings
+from .extraction import get_process_pool, iter_pdf_pages_parallel, iter_text_file
+from .ingestion import IngestionPipeline, EmptyDocumentError
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("completed", "completed_with_errors", "failed")
+
+
+def save_upload(stream: BinaryIO) -> str:
+    """Copy an upload to a temporary file the background job can reopen."""
+    os.makedirs(settings.INGEST_UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.INGEST_UPLOAD_DIR, suffix=".upload")
+    with os.fdopen(fd, "wb") as f:
+        shutil.copyfileobj(stream, f, length=1024 * 1024)
+    return path
+
+
+class IngestionJob:
+    def __init__(self, doc_id: str, path: str, content_type: str, metadata: dict, update: bool = False):
+        self.id = str(uuid.uuid4())
+        self.doc_id = doc_id
+        self.update = update
+        self.path = path
+        self.content_type = content_type
+        self.metadata = metadata
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.pipeline: Optional[IngestionPipeline] = None
+
+    def to_dict(self) -> dict:
+        pipeline = self.pipeline
+        progress = {
+            "pages_parsed": 0,
+            "chunks_seen": 0,
+            "chunks_embedded": 0,
+            "chunks_written": 0,
+            "chunks_unchanged": 0,
+            "chunks_reused": 0,
+            "chunks_removed": 0,
+            "chunks_failed": 0,
+            "chunks_per_second": 0.0,
+            "chunk_retries": {},
+            "failed_chunks": []
+        }
+        if pipeline is not None and pipeline.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - pipeline.started_at
+            progress.update({
+                "pages_parsed": pipeline.segments_read,
+                "chunks_seen": pipeline.chunks_seen,
+                "chunks_embedded": pipeline.chunks_embedded,
+                "chunks_written": pipeline.chunks_written,
+                "chunks_unchanged": pipeline.chunks_unchanged,
+                "chunks_reused": pipeline.chunks_reused,
+                "chunks_removed": pipeline.chunks_removed,
+                "chunks_failed": len(pipeline.failed_chunks),
+                "chunks_per_second": pipeline.chunks_written / elapsed if elapsed > 0 else 0.0,
+                "chunk_retries": {str(index): attempts for index, attempts in pipeline.chunk_retries.items()},
+                "failed_chunks": list(pipeline.failed_chunks)
+            })
+        return {
+            "job_id": self.id,
+            "doc_id": self.doc_id,
+            "filename": self.metadata.get("filename"),
+            "update": self.update,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            **progress
+        }
+
+
+class IngestionJobManager:
+    """Runs uploads as background ingestion jobs and tracks their progress.
+
+    At most INGEST_MAX_CONCURRENT_JOBS pipelines run at once; further jobs
+    wait in the "queued" state. PDF pages are extracted in a process pool so
+    parsing doesn't hold the GIL the event loop needs. Finished jobs are kept
+    for status queries until INGEST_JOB_HISTORY is exceeded. Job state lives
+    in the API process, so status is only visible on the worker that
+    accepted the upload.
+    """
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._tasks = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def submit(self, doc_id: str, path: str, content_type: str, metadata: dict, executor: Executor,
+               update: bool = False) -> IngestionJob:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.INGEST_MAX_CONCURRENT_JOBS)
+        job = IngestionJob(doc_id, path, content_type, metadata, update)
+        self._jobs[job.id] = job
+        self._evict_finished()
+        task = asyncio.create_task(self._run(job, executor))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Queued ingestion job {job.id} for document {doc_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def is_ingesting(self, doc_id: str) -> bool:
+        """Whether a job for `doc_id` is queued or running in this process."""
+        return any(job.doc_id == doc_id and job.status not in FINISHED_STATES for job in self._jobs.values())
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(self._jobs) - settings.INGEST_JOB_HISTORY)]:
+            del self._jobs[job_id]
+
+    def _segments(self, job: IngestionJob):
+        if job.content_type == "application/pdf":
+            pool = get_process_pool(settings.INGEST_EXTRACTION_PROCESSES)
+            return iter_pdf_pages_parallel(job.path, pool, settings.INGEST_PAGES_PER_TASK)
+        return iter_text_file(job.path)
+
+    async def _run(self, job: IngestionJob, executor: Executor):
+        async with self._semaphore:
+            job.status = "running"
+            job.pipeline = IngestionPipeline(
+                job.doc_id, job.metadata, executor, update=job.update, paged=job.content_type == "application/pdf"
+            )
+            try:
+                await job.pipeline.run(self._segments(job))
+                job.status = "completed_with_errors" if job.pipeline.failed_chunks else "completed"
+            except EmptyDocumentError as e:
+                logger.warning(f"Ingestion job {job.id} found no text: {job.metadata.get('filename')}")
+                job.status = "failed"
+                job.error = str(e)
+            except Exception as e:
+                logger.error(f"Ingestion job {job.id} failed: {str(e)}", exc_info=True)
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+job_manager = IngestionJobManager()
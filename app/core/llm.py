@@ -1,37 +1,236 @@
 import requests
 import json
 import aiohttp
-from typing import List, Dict, Any, AsyncGenerator
+from typing import List, Dict, Any, AsyncGenerator, Optional
 from .config import get_settings
 import logging
-import hashlib
-from functools import lru_cache
 import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from .embedding_cache import EmbeddingStore, content_hash
+from .chunking import iter_chunks
+from .conversations import Conversation
+from .metrics import (
+    registry, EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_LOOKUPS, EMBEDDING_REQUEST_SECONDS,
+    GENERATION_TOKENS, GENERATION_TOKENS_PER_SECOND, GENERATION_TTFT_SECONDS
+)
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Sent with every request: Ollama reloads a model whose options changed, so warm-up must match
+GENERATION_OPTIONS = {"num_thread": 4, "num_ctx": 4096, "num_batch": 512}
+EMBEDDING_OPTIONS = {"num_thread": 4}
+
+def keep_alive_option() -> dict:
+    """The keep_alive field for Ollama requests; a bare number is sent as seconds."""
+    value = settings.OLLAMA_KEEP_ALIVE.strip()
+    if not value:
+        return {}
+    try:
+        return {"keep_alive": int(value)}
+    except ValueError:
+        pass
+    try:
+        return {"keep_alive": float(value)}
+    except ValueError:
+        return {"keep_alive": value}
+
+class GenerationOverloaded(Exception):
+    """Raised when a generation can't be admitted; `retry_after` is in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class GenerationSlot:
+    """Permission to run one generation; release it when the stream ends."""
+
+    def __init__(self, scheduler: "GenerationScheduler", waited: float):
+        self.scheduler = scheduler
+        self.waited = waited
+        self.started_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.scheduler._release(time.monotonic() - self.started_at)
+
+class GenerationScheduler:
+    """Admission control for one model's generations.
+
+    At most `max_in_flight` generations run at once. Up to `max_queue`
+    further requests wait, served round-robin across clients so one client
+    with many requests can't starve the others. A request is rejected with
+    GenerationOverloaded straight away when the queue is full, or after
+    waiting `queue_timeout` seconds, with a Retry-After estimated from recent
+    generation times. Runs on the event loop only.
+    """
+
+    def __init__(self, model: str, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters: "OrderedDict[str, deque]" = OrderedDict()
+        self._wait_times = deque(maxlen=1000)
+        self._durations = deque(maxlen=100)
+
+    def _retry_after(self) -> int:
+        average = sum(self._durations) / len(self._durations) if self._durations else 10.0
+        return max(1, math.ceil(average * (self.queued + 1) / self.max_in_flight))
+
+    def _dispatch(self):
+        # Grant free slots to the oldest waiter of each client in turn
+        while self.in_flight < self.max_in_flight and self._waiters:
+            client_id, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiters.move_to_end(client_id)
+            else:
+                del self._waiters[client_id]
+            self.queued -= 1
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _remove(self, client_id: str, future: asyncio.Future):
+        waiters = self._waiters.get(client_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[client_id]
+
+    def _release(self, duration: float):
+        self.in_flight -= 1
+        self._durations.append(duration)
+        self._dispatch()
+
+    async def acquire(self, client_id: str = "anonymous") -> GenerationSlot:
+        start = time.monotonic()
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+        else:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise GenerationOverloaded(
+                    f"Generation queue for {self.model} is full ({self.queued} waiting)", self._retry_after()
+                )
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(client_id, deque()).append(future)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not future.done():
+                    self._remove(client_id, future)
+                    future.cancel()
+                    self.timed_out += 1
+                    raise GenerationOverloaded(
+                        f"Timed out after {self.queue_timeout:g}s waiting for a {self.model} generation slot",
+                        self._retry_after()
+                    )
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as the caller went away
+                    self._release(0.0)
+                else:
+                    self._remove(client_id, future)
+                    future.cancel()
+                raise
+        waited = time.monotonic() - start
+        self._wait_times.append(waited)
+        self.admitted += 1
+        return GenerationSlot(self, waited)
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_times)
+
+        def percentile(pct):
+            return waits[min(len(waits) - 1, int(pct / 100 * len(waits)))] if waits else 0.0
+        return {
+            "model": self.model,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "waiting_clients": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_seconds_p50": percentile(50),
+            "wait_seconds_p95": percentile(95),
+            "wait_seconds_max": waits[-1] if waits else 0.0,
+            "generation_seconds_avg": sum(self._durations) / len(self._durations) if self._durations else 0.0
+        }
+
 class OllamaService:
     def __init__(self):
         self.base_url = settings.OLLAMA_BASE_URL
         self.llm_model = settings.LLM_MODEL
         self.embedding_model = settings.EMBEDDING_MODEL
-        self.embedding_cache = {}
-        self.cache_size = 1000  # Maximum number of embeddings to cache
+        self.embedding_cache: Optional[EmbeddingStore] = None
+        if settings.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingStore(
+                settings.EMBEDDING_CACHE_DIR,
+                self.embedding_model,
+                settings.EMBEDDING_CACHE_MAX_ENTRIES
+            )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._embed_semaphore: Optional[asyncio.Semaphore] = None
+        self._schedulers: Dict[str, GenerationScheduler] = {}
+        # Prompt tokens Ollama reports for /api/embed requests, for throughput reporting
+        self.embedding_tokens = 0
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared keep-alive HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.EMBEDDING_CONCURRENCY * 2 + settings.LLM_MAX_CONCURRENT_GENERATIONS),
+                timeout=aiohttp.ClientTimeout(total=settings.EMBEDDING_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def scheduler(self, model: Optional[str] = None) -> GenerationScheduler:
+        """Return the generation scheduler for a model, creating it on first use."""
+        model = model or self.llm_model
+        if model not in self._schedulers:
+            self._schedulers[model] = GenerationScheduler(
+                model,
+                settings.LLM_MAX_CONCURRENT_GENERATIONS,
+                settings.LLM_QUEUE_SIZE,
+                settings.LLM_QUEUE_TIMEOUT
+            )
+        return self._schedulers[model]
 
     def _get_cache_key(self, text: str) -> str:
         """Generate a cache key for the text."""
-        return hashlib.md5(text.encode()).hexdigest()
+        return content_hash(text)
 
-    @lru_cache(maxsize=1000)
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text with caching."""
         cache_key = self._get_cache_key(text)
         
         # Check cache first
-        if cache_key in self.embedding_cache:
-            logger.info("Cache hit for embedding")
-            return self.embedding_cache[cache_key]
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Cache hit for embedding")
+                return cached.tolist()
         
         # Generate new embedding
         try:
@@ -40,25 +239,95 @@ class OllamaService:
                 json={
                     "model": self.embedding_model,
                     "prompt": text,
-                    "options": {
-                        "num_thread": 4
-                    }
+                    "options": EMBEDDING_OPTIONS,
+                    **keep_alive_option()
                 }
             )
             response.raise_for_status()
             embedding = response.json()["embedding"]
             
             # Update cache
-            if len(self.embedding_cache) >= self.cache_size:
-                # Remove oldest item if cache is full
-                self.embedding_cache.pop(next(iter(self.embedding_cache)))
-            self.embedding_cache[cache_key] = embedding
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(cache_key, embedding)
             
             return embedding
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             raise
 
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts with one /api/embed call, retrying on 5xx and timeouts."""
+        if self._embed_semaphore is None:
+            self._embed_semaphore = asyncio.Semaphore(settings.EMBEDDING_CONCURRENCY)
+
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        async with self._embed_semaphore:
+            for attempt in range(settings.EMBEDDING_MAX_RETRIES + 1):
+                try:
+                    start = time.perf_counter()
+                    session = await self._get_session()
+                    async with session.post(
+                        f"{self.base_url}/api/embed",
+                        json={
+                            "model": self.embedding_model,
+                            "input": texts,
+                            "options": EMBEDDING_OPTIONS,
+                            **keep_alive_option()
+                        }
+                    ) as response:
+                        response.raise_for_status()
+                        data = await response.json()
+                        embeddings = data["embeddings"]
+                        if len(embeddings) != len(texts):
+                            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+                        self.embedding_tokens += data.get("prompt_eval_count", 0)
+                        EMBEDDING_REQUEST_SECONDS.observe(time.perf_counter() - start)
+                        return embeddings
+                except (aiohttp.ClientResponseError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status >= 500
+                    if not retryable or attempt == settings.EMBEDDING_MAX_RETRIES:
+                        logger.error(f"Error generating batch embeddings: {str(e)}")
+                        raise
+                    delay = settings.EMBEDDING_RETRY_BACKOFF * (2 ** attempt)
+                    logger.warning(f"Embedding request failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+
+    async def embed_many(self, texts: List[str], batch_size: int = None) -> List[List[float]]:
+        """Embed many texts using batched requests with bounded concurrency.
+
+        Cached texts are served from the embedding store and only the misses
+        (deduplicated by content hash) are sent to Ollama. Returns embeddings
+        in the same order as `texts`.
+        """
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        keys = [self._get_cache_key(text) for text in texts]
+        cached = {}
+        if self.embedding_cache is not None:
+            cached = await asyncio.to_thread(self.embedding_cache.get_many, keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+
+        generated = {}
+        if missing:
+            pending = list(missing.values())
+            batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+            results = await asyncio.gather(*[self._embed_batch(batch) for batch in batches])
+            generated = dict(zip(missing.keys(), [embedding for batch in results for embedding in batch]))
+            if self.embedding_cache is not None:
+                await asyncio.to_thread(self.embedding_cache.put_many, generated)
+
+        EMBEDDING_CACHE_LOOKUPS.inc(len(texts) - len(missing), result="hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(len(missing), result="miss")
+        logger.debug(f"Embedded {len(texts)} texts ({len(texts) - len(missing)} cached, {len(missing)} generated)")
+        return [generated[key] if key in generated else cached[key].tolist() for key in keys]
+
+    async def generate_embedding_async(self, text: str) -> List[float]:
+        """Awaitable single-text embedding over the shared session and cache."""
+        return (await self.embed_many([text]))[0]
+
     def generate_response(self, prompt: str, context: str = "") -> str:
         full_prompt = f"Context: {context}\n\nQuestion: {prompt}\n\nAnswer:" if context else prompt
         
@@ -68,63 +337,116 @@ class OllamaService:
                 "model": self.llm_model,
                 "prompt": full_prompt,
                 "stream": False,
-                "options": {
-                    "num_thread": 4,
-                    "num_ctx": 4096,
-                    "num_batch": 512
-                }
+                "options": GENERATION_OPTIONS,
+                **keep_alive_option()
             }
         )
         response.raise_for_status()
         return response.json()["response"]
 
-    async def generate_streaming_response(self, prompt: str, context: str = "") -> AsyncGenerator[str, None]:
+    async def generate_streaming_response(self, prompt: str, context: str = "", slot: Optional[GenerationSlot] = None,
+                                          client_id: str = "anonymous",
+                                          conversation: Optional[Conversation] = None) -> AsyncGenerator[str, None]:
+        """Stream a generation, holding a scheduler slot until it ends.
+
+        Pass a `slot` acquired beforehand to admit the request before
+        committing to a response; otherwise one is acquired for `client_id`.
+        In a `conversation` the generation continues from the token state of
+        its previous turn, and the new state is stored on it.
+        """
         full_prompt = f"Context: {context}\n\nQuestion: {prompt}\n\nAnswer:" if context else prompt
+        if slot is None:
+            slot = await self.scheduler().acquire(client_id)
         
-        async with aiohttp.ClientSession() as session:
+        payload = {
+            "model": self.llm_model,
+            "prompt": full_prompt,
+            "stream": True,
+            "options": GENERATION_OPTIONS,
+            **keep_alive_option()
+        }
+        if conversation is not None and conversation.context:
+            payload["context"] = conversation.context
+        
+        try:
+            start = time.perf_counter()
+            first_token = True
+            session = await self._get_session()
             async with session.post(
                 f"{self.base_url}/api/generate",
-                json={
-                    "model": self.llm_model,
-                    "prompt": full_prompt,
-                    "stream": True,
-                    "options": {
-                        "num_thread": 4,
-                        "num_ctx": 4096,
-                        "num_batch": 512
-                    }
-                }
+                json=payload,
+                # Generations can outlast the embedding timeout; only a stalled stream is an error
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=settings.LLM_READ_TIMEOUT)
             ) as response:
                 response.raise_for_status()
                 async for line in response.content:
                     if line:
                         try:
                             data = json.loads(line)
+                            if data.get("done"):
+                                self._record_generation(data)
+                                if conversation is not None:
+                                    conversation.record_generation(data)
                             if "response" in data:
+                                if first_token and data["response"]:
+                                    first_token = False
+                                    GENERATION_TTFT_SECONDS.observe(time.perf_counter() - start)
                                 yield data["response"]
                         except json.JSONDecodeError:
                             continue
+        finally:
+            slot.release()
 
-    def chunk_text(self, text: str, chunk_size: int = 1000) -> List[str]:
-        """Split text into chunks of approximately chunk_size characters."""
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for word in words:
-            word_size = len(word) + 1  # +1 for space
-            if current_size + word_size > chunk_size and current_chunk:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = [word]
-                current_size = word_size
-            else:
-                current_chunk.append(word)
-                current_size += word_size
-        
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-        
-        return chunks
+    @staticmethod
+    def _record_generation(data: dict):
+        # Ollama's final stream message reports decode speed in nanoseconds
+        tokens, duration = data.get("eval_count"), data.get("eval_duration")
+        if tokens:
+            GENERATION_TOKENS.inc(tokens)
+            if duration:
+                GENERATION_TOKENS_PER_SECOND.observe(tokens / (duration / 1e9))
+
+    async def warm_up(self):
+        """Load the generation and embedding models so the first requests don't wait for them.
+
+        Failures are only logged: Ollama may still be pulling the models.
+        """
+        async def load(kind: str, model: str, path: str, payload: dict):
+            start = time.perf_counter()
+            try:
+                session = await self._get_session()
+                async with session.post(
+                    f"{self.base_url}{path}",
+                    json={"model": model, **payload, **keep_alive_option()},
+                    timeout=aiohttp.ClientTimeout(total=None, sock_read=settings.LLM_READ_TIMEOUT)
+                ) as response:
+                    response.raise_for_status()
+                    await response.read()
+                logger.info(f"Loaded {kind} model {model} in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                logger.warning(f"Could not warm up {kind} model {model}: {str(e)}")
+
+        await asyncio.gather(
+            # An empty prompt loads the model without generating
+            load("generation", self.llm_model, "/api/generate", {"prompt": "", "stream": False, "options": GENERATION_OPTIONS}),
+            load("embedding", self.embedding_model, "/api/embed", {"input": ["warm-up"], "options": EMBEDDING_OPTIONS})
+        )
+
+    async def generate_response_async(self, prompt: str, context: str = "", client_id: str = "anonymous") -> str:
+        """Awaitable `generate_response`, collected from the streaming endpoint."""
+        return "".join([chunk async for chunk in self.generate_streaming_response(prompt, context, client_id=client_id)])
+
+    def chunk_text(self, text: str, chunk_size: Optional[int] = None) -> List[str]:
+        """Split text into chunks of at most chunk_size characters."""
+        return list(iter_chunks([text], chunk_size))
+
+ollama_service = OllamaService()
 
-ollama_service = OllamaService() 
\ No newline at end of file
+registry.gauge(
+    "graph_rag_generations_in_flight", "Generations running against Ollama", ["model"],
+    function=lambda: {(model,): scheduler.in_flight for model, scheduler in ollama_service._schedulers.items()}
+)
+registry.gauge(
+    "graph_rag_generations_queued", "Generations waiting for a scheduler slot", ["model"],
+    function=lambda: {(model,): scheduler.queued for model, scheduler in ollama_service._schedulers.items()}
+) 
\ No newline at end of file
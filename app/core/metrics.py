@@ -0,0 +1,255 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond index lookups to long generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+RATE_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or read from `function` at scrape time.
+
+    `function` returns a value, or a {label values tuple: value} dict for a
+    labelled gauge.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterator[str]:
+        if self.function is not None:
+            value = self.function()
+            values = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """The process's metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], object]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+
+registry = MetricsRegistry()
+
+# Query path
+QUERY_SECONDS = registry.histogram(
+    "graph_rag_query_seconds", "Total /query latency until the last event is sent", ["cached"]
+)
+QUERY_STAGE_SECONDS = registry.histogram(
+    "graph_rag_query_stage_seconds", "Latency of each /query stage before generation", ["stage"]
+)
+VECTOR_SEARCH_SECONDS = registry.histogram(
+    "graph_rag_vector_search_seconds", "Vector search latency", ["mode"]
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "graph_rag_http_request_seconds", "HTTP latency until the response starts", ["method", "route", "status"]
+)
+RATE_LIMITED = registry.counter(
+    "graph_rag_rate_limited_total", "Requests rejected with 429", ["rule"]
+)
+ANSWER_CACHE_LOOKUPS = registry.counter(
+    "graph_rag_answer_cache_lookups_total", "Semantic answer cache lookups", ["result"]
+)
+
+# Ollama
+EMBEDDING_REQUEST_SECONDS = registry.histogram(
+    "graph_rag_embedding_request_seconds", "Ollama /api/embed request latency"
+)
+EMBEDDING_BATCH_SIZE = registry.histogram(
+    "graph_rag_embedding_batch_size", "Texts per Ollama /api/embed request", buckets=SIZE_BUCKETS
+)
+EMBEDDING_CACHE_LOOKUPS = registry.counter(
+    "graph_rag_embedding_cache_lookups_total", "Embedding cache lookups", ["result"]
+)
+GENERATION_TTFT_SECONDS = registry.histogram(
+    "graph_rag_generation_time_to_first_token_seconds", "Time from sending a generation to its first token"
+)
+GENERATION_TOKENS_PER_SECOND = registry.histogram(
+    "graph_rag_generation_tokens_per_second", "Generation decode speed reported by Ollama", buckets=RATE_BUCKETS
+)
+GENERATION_TOKENS = registry.counter(
+    "graph_rag_generation_tokens_total", "Tokens generated"
+)
+
+# Neo4j
+NEO4J_WRITE_SECONDS = registry.histogram(
+    "graph_rag_neo4j_write_seconds", "Neo4j write transaction latency", ["operation"]
+)
+NEO4J_WRITE_BATCH_SIZE = registry.histogram(
+    "graph_rag_neo4j_write_batch_size", "Rows per Neo4j write transaction", ["operation"], buckets=SIZE_BUCKETS
+)
+NEO4J_SESSIONS_IN_USE = registry.gauge(
+    "graph_rag_neo4j_sessions_in_use", "Open Neo4j sessions, each holding at most one pooled connection", ["driver"]
+)
+NEO4J_POOL_SIZE = registry.gauge(
+    "graph_rag_neo4j_pool_size", "Maximum connections per Neo4j driver pool"
+)
+
+# Ingestion
+INGEST_CHUNKS_PER_SECOND = registry.histogram(
+    "graph_rag_ingest_chunks_per_second", "Chunks written per second, per ingested document", buckets=RATE_BUCKETS
+)
+INGEST_CHUNKS = registry.counter(
+    "graph_rag_ingest_chunks_total", "Chunks ingested", ["result"]
+)
+
+# Deletion and retention
+DELETED_NODES = registry.counter(
+    "graph_rag_deleted_nodes_total", "Nodes deleted with their documents", ["label", "reason"]
+)
+DELETE_NODES_PER_SECOND = registry.histogram(
+    "graph_rag_delete_nodes_per_second", "Nodes deleted per second, per delete", buckets=RATE_BUCKETS
+)
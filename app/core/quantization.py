@@ -0,0 +1,61 @@
+from typing import Tuple
+
+import numpy as np
+
+# Number of set bits in every possible byte, for vectorized Hamming distance
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# Rows scored per block, bounding the float32 temporaries of int8 scoring
+SCORE_BLOCK_ROWS = 65536
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Scale each row into [-127, 127] and round to int8.
+
+    Returns the codes and the per-row scale that maps them back, so that
+    `codes * scales[:, None]` approximates `matrix`.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(matrix: np.ndarray) -> np.ndarray:
+    """Pack the sign bit of every dimension, 8 dimensions per byte."""
+    return np.packbits(np.asarray(matrix) > 0, axis=1)
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Approximate dot products of a float32 query against int8 rows."""
+    query = np.asarray(query, dtype=np.float32)
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        block = codes[start:start + SCORE_BLOCK_ROWS]
+        scores[start:start + len(block)] = block.astype(np.float32) @ query
+    return scores * scales
+
+
+def hamming_distances(bits: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Hamming distance between packed binary codes and one packed query."""
+    distances = np.empty(len(bits), dtype=np.int32)
+    for start in range(0, len(bits), SCORE_BLOCK_ROWS):
+        block = bits[start:start + SCORE_BLOCK_ROWS]
+        distances[start:start + len(block)] = POPCOUNT[np.bitwise_xor(block, query_bits)].sum(axis=1, dtype=np.int32)
+    return distances
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` highest scores, best first."""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+def recall_at_k(expected: np.ndarray, found: np.ndarray) -> float:
+    """Fraction of the exact top-k that the approximate top-k recovered."""
+    if len(expected) == 0:
+        return 1.0
+    return len(np.intersect1d(expected, found)) / len(expected)
@@ -0,0 +1,267 @@
+import asyncio
+import ipaddress
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKENDS = ("memory", "sqlite")
+
+
+class RateLimitRule:
+    """`requests` per `seconds`, enforced as a token bucket that holds up to `requests` tokens."""
+
+    def __init__(self, name: str, requests: int, seconds: float):
+        if requests <= 0 or seconds <= 0:
+            raise ValueError(f"Rate limit {name!r} needs a positive request count and period")
+        self.name = name
+        self.requests = requests
+        self.seconds = seconds
+        self.rate = requests / seconds
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> Optional["RateLimitRule"]:
+        """Parse "requests/seconds"; "0" or "unlimited" means no limit."""
+        spec = spec.strip().lower()
+        if spec in ("0", "unlimited"):
+            return None
+        requests, _, seconds = spec.partition("/")
+        return cls(name, int(requests), float(seconds or 1))
+
+
+class RateLimitDecision:
+    def __init__(self, rule: RateLimitRule, allowed: bool, tokens: float):
+        self.rule = rule
+        self.allowed = allowed
+        self.remaining = int(tokens)
+        # Seconds until one token is available again
+        self.retry_after = 0 if allowed else max(1, math.ceil((1 - tokens) / rule.rate))
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": f"{self.rule.requests};w={self.rule.seconds:g}",
+            "X-RateLimit-Remaining": str(self.remaining),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def _take(tokens: float, updated: float, now: float, rule: RateLimitRule) -> Tuple[bool, float]:
+    """Refill a bucket for the time since `updated` and take one token if there is one."""
+    tokens = min(rule.requests, tokens + max(now - updated, 0) * rule.rate)
+    if tokens >= 1:
+        return True, tokens - 1
+    return False, tokens
+
+
+class MemoryBackend:
+    """Per-process buckets in an LRU map of at most `max_clients` keys.
+
+    Each check is O(1). The least recently seen client is evicted first;
+    an evicted client simply starts again with a full bucket.
+    """
+
+    blocking = False
+
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rule: RateLimitRule, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(rule.requests), now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            allowed, bucket[0] = _take(bucket[0], bucket[1], now, rule)
+            bucket[1] = now
+            return allowed, bucket[0]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file (WAL mode) shared by every worker on a host.
+
+    A check is one short IMMEDIATE transaction on a primary-key row, so
+    workers serialize through SQLite's write lock. Every `CLEANUP_INTERVAL`
+    checks, buckets idle long enough to have refilled are deleted, then the
+    least recently used beyond `max_clients`.
+    """
+
+    blocking = True
+    CLEANUP_INTERVAL = 1000
+
+    def __init__(self, path: str, max_clients: int):
+        self.max_clients = max_clients
+        self._checks = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                full_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+
+    def take(self, key: str, rule: RateLimitRule, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (float(rule.requests), now)
+                allowed, tokens = _take(tokens, updated, now, rule)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                    (key, tokens, now, now + (rule.requests - tokens) / rule.rate)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._checks += 1
+            if self._checks % self.CLEANUP_INTERVAL == 0:
+                self._cleanup(now)
+            return allowed, tokens
+
+    def _cleanup(self, now: float):
+        try:
+            # A bucket that has refilled is the same as no bucket
+            self._conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM buckets WHERE key IN (SELECT key FROM buckets ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                (self.max_clients,)
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Rate limit cleanup skipped: {str(e)}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM buckets").fetchone()[0]
+
+
+class RateLimiter:
+    """Per-client, per-route token buckets.
+
+    Routes are matched by exact path, or by prefix for patterns ending in
+    "*", optionally restricted to one method; the most specific match
+    wins. Every rule keeps its own bucket per client. Requests matching no
+    route share the `default` rule's bucket; a rule of None is unlimited.
+    """
+
+    def __init__(self, backend, default: Optional[RateLimitRule], routes: List[Tuple[Optional[str], str, Optional[RateLimitRule]]]):
+        self.backend = backend
+        self.default = default
+        self._exact: Dict[Tuple[Optional[str], str], Optional[RateLimitRule]] = {}
+        self._prefixes: List[Tuple[Optional[str], str, Optional[RateLimitRule]]] = []
+        for method, path, rule in routes:
+            if path.endswith("*"):
+                self._prefixes.append((method, path[:-1], rule))
+            else:
+                self._exact[(method, path)] = rule
+        # Longest prefix first, method-specific before any-method
+        self._prefixes.sort(key=lambda route: (len(route[1]), route[0] is not None), reverse=True)
+
+    @classmethod
+    def parse_routes(cls, spec: str) -> List[Tuple[Optional[str], str, Optional[RateLimitRule]]]:
+        """Parse "[METHOD ]/path=requests/seconds" entries separated by commas."""
+        routes = []
+        for entry in filter(None, (entry.strip() for entry in spec.split(","))):
+            route, _, limit = entry.rpartition("=")
+            method, _, path = route.strip().rpartition(" ")
+            if not path.startswith("/"):
+                raise ValueError(f"Invalid rate limit route {entry!r}")
+            routes.append((method.upper() or None, path, RateLimitRule.parse(route.strip(), limit)))
+        return routes
+
+    def rule_for(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for key in ((method, path), (None, path)):
+            if key in self._exact:
+                return self._exact[key]
+        for route_method, prefix, rule in self._prefixes:
+            if path.startswith(prefix) and route_method in (None, method):
+                return rule
+        return self.default
+
+    def check(self, client: str, method: str, path: str) -> Optional[RateLimitDecision]:
+        """Take a token for the request; None when its route is unlimited."""
+        rule = self.rule_for(method, path)
+        if rule is None:
+            return None
+        allowed, tokens = self.backend.take(f"{rule.name}|{client}", rule, time.time())
+        return RateLimitDecision(rule, allowed, tokens)
+
+    async def check_async(self, client: str, method: str, path: str) -> Optional[RateLimitDecision]:
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.check, client, method, path)
+        return self.check(client, method, path)
+
+
+def _parse_networks(spec: str) -> list:
+    return [ipaddress.ip_network(entry.strip(), strict=False) for entry in spec.split(",") if entry.strip()]
+
+
+TRUSTED_PROXIES = _parse_networks(settings.RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def client_key(host: Optional[str], forwarded_for: Optional[str]) -> str:
+    """The client a request is counted against.
+
+    Behind a trusted proxy this is the address the proxy appended to
+    X-Forwarded-For; otherwise the peer address, so clients can't pick
+    their own key.
+    """
+    if not host:
+        return "unknown"
+    if forwarded_for and TRUSTED_PROXIES:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return host
+        if any(address in network for network in TRUSTED_PROXIES):
+            return forwarded_for.rsplit(",", 1)[-1].strip() or host
+    return host
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    if settings.RATE_LIMIT_BACKEND not in RATE_LIMIT_BACKENDS:
+        raise ValueError(f"RATE_LIMIT_BACKEND must be one of {RATE_LIMIT_BACKENDS}, got {settings.RATE_LIMIT_BACKEND!r}")
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        backend = SQLiteBackend(settings.RATE_LIMIT_SQLITE_PATH, settings.RATE_LIMIT_MAX_CLIENTS)
+    else:
+        backend = MemoryBackend(settings.RATE_LIMIT_MAX_CLIENTS)
+    return RateLimiter(
+        backend,
+        RateLimitRule.parse("default", settings.RATE_LIMIT_DEFAULT),
+        RateLimiter.parse_routes(settings.RATE_LIMIT_ROUTES)
+    )
+
+
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from typing import List, Optional
+
+from .config import get_settings
+from .database import db
+from .vector_index import vector_index, LOCAL_INDEX_MODES
+from .answer_cache import answer_cache
+from .graph_summary import graph_summary_cache
+from .jobs import job_manager
+from .metrics import DELETED_NODES, DELETE_NODES_PER_SECOND
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def delete_documents(doc_ids: List[str], reason: str = "request") -> dict:
+    """Delete documents and their orphaned chunks, then drop what the process caches of them.
+
+    Deleted chunks leave the local vector index, and cached answers and graph
+    summaries are invalidated. The embedding cache is keyed by content, so
+    its entries stay valid. Returns counts and the deletion throughput.
+    """
+    start = time.perf_counter()
+    deleted = db.delete_documents(doc_ids, settings.NEO4J_DELETE_BATCH_SIZE)
+    documents, chunks = len(deleted["document_ids"]), len(deleted["chunk_ids"])
+    if chunks and settings.VECTOR_SEARCH_MODE in LOCAL_INDEX_MODES:
+        vector_index.remove(deleted["chunk_ids"])
+    if documents or chunks:
+        # Cached answers may be based on the deleted chunks
+        answer_cache.invalidate()
+        graph_summary_cache.invalidate()
+    elapsed = time.perf_counter() - start
+    nodes = documents + chunks
+    DELETED_NODES.inc(documents, label="Document", reason=reason)
+    DELETED_NODES.inc(chunks, label="Chunk", reason=reason)
+    if nodes and elapsed > 0:
+        DELETE_NODES_PER_SECOND.observe(nodes / elapsed)
+    return {
+        "documents_deleted": documents,
+        "chunks_deleted": chunks,
+        "relationships_deleted": deleted["relationships_deleted"],
+        "seconds": elapsed,
+        "nodes_per_second": nodes / elapsed if elapsed > 0 else 0.0
+    }
+
+
+def apply_retention(max_age: Optional[float] = None) -> dict:
+    """Delete every document past its `expires_at` or older than `max_age` seconds.
+
+    `max_age` defaults to RETENTION_MAX_AGE. Documents are deleted
+    RETENTION_BATCH_DOCUMENTS at a time. Documents with an ingestion job
+    still queued or running are skipped, as `DELETE /documents/{doc_id}`
+    refuses them; the next sweep picks them up.
+    """
+    max_age = settings.RETENTION_MAX_AGE if max_age is None else max_age
+    now = time.time()
+    start = time.perf_counter()
+    totals = {"documents_deleted": 0, "chunks_deleted": 0, "relationships_deleted": 0}
+    skipped = []
+    while True:
+        found = db.find_expired_documents(now, max_age, settings.RETENTION_BATCH_DOCUMENTS, exclude=skipped)
+        if not found:
+            break
+        doc_ids = []
+        for doc_id in found:
+            if job_manager.is_ingesting(doc_id):
+                logger.info(f"Retention skipped document {doc_id}: it is being ingested")
+                skipped.append(doc_id)
+            else:
+                doc_ids.append(doc_id)
+        if not doc_ids:
+            continue
+        report = delete_documents(doc_ids, reason="retention")
+        for key in totals:
+            totals[key] += report[key]
+        if not report["documents_deleted"]:
+            # Found but already gone, e.g. deleted by another worker
+            break
+    elapsed = time.perf_counter() - start
+    nodes = totals["documents_deleted"] + totals["chunks_deleted"]
+    if nodes:
+        logger.info(
+            f"Retention deleted {totals['documents_deleted']} documents and {totals['chunks_deleted']} chunks "
+            f"in {elapsed:.2f}s ({nodes / elapsed:.0f} nodes/s)"
+        )
+    return {
+        **totals,
+        "documents_skipped": len(skipped),
+        "seconds": elapsed,
+        "nodes_per_second": nodes / elapsed if elapsed > 0 else 0.0
+    }
+
+
+async def run_retention(executor: Optional[Executor] = None):
+    """Apply the retention policy every RETENTION_INTERVAL seconds until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.RETENTION_INTERVAL)
+        try:
+            await loop.run_in_executor(executor, apply_retention)
+        except Exception as e:
+            logger.error(f"Retention sweep failed: {str(e)}", exc_info=True)
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, List, Optional
+
+from .config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+STREAM_FORMATS = ("json", "compact")
+
+
+def _event(name: str, data: str) -> str:
+    # Every line of the payload needs its own data: field
+    lines = data.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return f"event: {name}\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+
+def _compact_source(source: dict) -> list:
+    """[id, score], plus the first page the chunk is on when it is known."""
+    pages = [location["page"] for location in source.get("locations") or [] if location.get("page") is not None]
+    return [source["id"], source["score"]] + pages[:1]
+
+
+class SSEEncoder:
+    """Encode /query stream frames.
+
+    The json format sends every frame as a default `data: {...}` event, as
+    the stream always has. The compact format sends answer text as raw
+    `event: t` payloads and sources as an `event: s` array of [id, score]
+    pairs, so the hot path skips json.dumps and the frames are smaller.
+    The final context frame is JSON in both formats.
+    """
+
+    def __init__(self, format: Optional[str] = None):
+        self.format = format or settings.STREAM_FORMAT
+        if self.format not in STREAM_FORMATS:
+            raise ValueError(f"Unknown stream format {self.format!r}; expected one of {STREAM_FORMATS}")
+
+    @property
+    def compact(self) -> bool:
+        return self.format == "compact"
+
+    def text(self, text: str) -> str:
+        if self.compact:
+            return _event("t", text)
+        return f"data: {json.dumps({'chunk': text})}\n\n"
+
+    def sources(self, sources: List[dict]) -> str:
+        if self.compact:
+            return _event("s", json.dumps([_compact_source(source) for source in sources]))
+        return f"data: {json.dumps({'sources': sources})}\n\n"
+
+    def context(self, context: str, context_stats: dict) -> str:
+        return f"data: {json.dumps({'context': context, 'context_stats': context_stats})}\n\n"
+
+
+async def coalesce_tokens(tokens: AsyncIterator[str], interval_ms: Optional[float] = None,
+                          max_bytes: Optional[int] = None) -> AsyncIterator[str]:
+    """Join streamed tokens into larger pieces.
+
+    Buffered text is flushed `interval_ms` after its first token arrived or
+    once it reaches `max_bytes` UTF-8 bytes, whichever comes first, and at
+    the end of the stream. The interval is enforced even while the source
+    is stalled. With both limits at 0 every token passes straight through.
+    """
+    interval_ms = settings.STREAM_COALESCE_MS if interval_ms is None else interval_ms
+    max_bytes = settings.STREAM_COALESCE_BYTES if max_bytes is None else max_bytes
+    if interval_ms <= 0 and max_bytes <= 0:
+        async for token in tokens:
+            yield token
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = tokens.__aiter__()
+    buffer: List[str] = []
+    size = 0
+    deadline: Optional[float] = None
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                future, pending = pending, None
+                try:
+                    token = future.result()
+                except StopAsyncIteration:
+                    break
+                buffer.append(token)
+                size += len(token.encode("utf-8"))
+                if deadline is None and interval_ms > 0:
+                    deadline = loop.time() + interval_ms / 1000
+                if max_bytes <= 0 or size < max_bytes:
+                    continue
+            # Size limit reached or interval elapsed
+            yield "".join(buffer)
+            buffer, size, deadline = [], 0, None
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            # Closes the source too, so its own cleanup runs now
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        elif hasattr(iterator, "aclose"):
+            await iterator.aclose()
@@ -0,0 +1,444 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import get_settings
+from .database import db, async_db
+from .init_db import embedding_dimensions
+from .metrics import VECTOR_SEARCH_SECONDS
+from .quantization import quantize_int8, quantize_binary, int8_scores, hamming_distances, top_k, recall_at_k
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ("neo4j", "local", "shadow", "graph")
+# Modes that keep the in-process index loaded and up to date
+LOCAL_INDEX_MODES = ("local", "shadow")
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+
+class LocalVectorIndex:
+    """In-process exact cosine index over chunk embeddings.
+
+    Embeddings are kept L2-normalized in one contiguous float32 matrix with a
+    parallel array of chunk ids, so a top-k query is a single matrix-vector
+    product followed by `argpartition`. Rows are appended into spare capacity;
+    the matrix is only reallocated when it fills up, which lets searches work
+    on a snapshot of the first `n` rows without holding the lock.
+    """
+
+    ARRAYS: Tuple[str, ...] = ("vectors",)
+    # Whether search scores are exact cosine similarities
+    exact = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._ids: Optional[np.ndarray] = None
+        self._size = 0
+        self._dim: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return self._dim
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _encode(self, matrix: np.ndarray) -> Dict[str, np.ndarray]:
+        """Turn normalized float32 rows into the stored per-row arrays."""
+        return {"vectors": matrix}
+
+    def _score(self, arrays: Dict[str, np.ndarray], size: int, query: np.ndarray) -> np.ndarray:
+        """Cosine scores of a normalized query against the first `size` rows."""
+        return arrays["vectors"][:size] @ query
+
+    def _reserve(self, needed: int, encoded: Dict[str, np.ndarray]):
+        capacity = len(self._ids) if self._ids is not None else 0
+        writeable = all(array.flags.writeable for array in self._arrays.values())
+        if needed <= capacity and writeable:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        arrays = {}
+        for name, rows in encoded.items():
+            array = np.empty((capacity,) + rows.shape[1:], dtype=rows.dtype)
+            if name in self._arrays:
+                array[:self._size] = self._arrays[name][:self._size]
+            arrays[name] = array
+        ids = np.empty(capacity, dtype=object)
+        if self._ids is not None:
+            ids[:self._size] = self._ids[:self._size]
+        self._arrays, self._ids = arrays, ids
+
+    def add(self, chunk_ids: List[str], embeddings: List[list]):
+        if not len(chunk_ids):
+            return
+        matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        encoded = self._encode(matrix)
+        with self._lock:
+            if self._dim is not None and matrix.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match index dimension {self._dim}")
+            self._dim = matrix.shape[1]
+            end = self._size + len(chunk_ids)
+            self._reserve(end, encoded)
+            for name, rows in encoded.items():
+                self._arrays[name][self._size:end] = rows
+            self._ids[self._size:end] = chunk_ids
+            self._size = end
+
+    def remove(self, chunk_ids: List[str]) -> int:
+        """Drop the given chunks; the remaining rows are copied into new arrays."""
+        if not len(chunk_ids):
+            return 0
+        with self._lock:
+            if self._size == 0:
+                return 0
+            keep = ~np.isin(self._ids[:self._size], list(chunk_ids))
+            removed = self._size - int(keep.sum())
+            if removed:
+                # Copies rather than compacting in place, so searches on a snapshot stay consistent
+                self._arrays = {name: array[:self._size][keep] for name, array in self._arrays.items()}
+                self._ids = self._ids[:self._size][keep]
+                self._size = len(self._ids)
+            return removed
+
+    def search(self, embedding: list, limit: int = 5) -> List[Tuple[str, float]]:
+        """Return up to `limit` (chunk_id, cosine score) pairs, best first."""
+        with self._lock:
+            size, arrays, ids = self._size, self._arrays, self._ids
+        if size == 0:
+            return []
+        query = np.array(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self._score(arrays, size, query)
+        return [(ids[i], float(scores[i])) for i in top_k(scores, limit)]
+
+    def search_many(self, embeddings: List[list], limit: int = 5) -> List[List[Tuple[str, float]]]:
+        """`search` for several queries, scored together in one matrix product."""
+        with self._lock:
+            size, arrays, ids = self._size, self._arrays, self._ids
+        if size == 0:
+            return [[] for _ in embeddings]
+        queries = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        scores = self._score_many(arrays, size, queries)
+        return [
+            [(ids[i], float(scores[i, column])) for i in top_k(scores[:, column], limit)]
+            for column in range(len(queries))
+        ]
+
+    def _score_many(self, arrays: Dict[str, np.ndarray], size: int, queries: np.ndarray) -> np.ndarray:
+        """Scores of normalized queries against the first `size` rows, one column per query."""
+        return arrays["vectors"][:size] @ queries.T
+
+    def memory_per_chunk(self) -> int:
+        """Bytes of vector data held per chunk, excluding the id."""
+        return sum(array.itemsize * int(np.prod(array.shape[1:])) for array in self._arrays.values())
+
+    def clear(self):
+        with self._lock:
+            self._arrays, self._ids, self._size, self._dim = {}, None, 0, None
+
+    def warm(self, batch_size: int = 5000):
+        """Rebuild the index from every chunk embedding stored in Neo4j."""
+        start = time.perf_counter()
+        self.clear()
+        for chunk_ids, embeddings in db.iter_chunk_embeddings(batch_size):
+            self.add(chunk_ids, embeddings)
+        logger.info(
+            f"Warmed local vector index with {self._size} chunks in {time.perf_counter() - start:.2f}s "
+            f"({self.memory_per_chunk()} bytes/chunk)"
+        )
+
+    def save(self, path: str):
+        """Persist each stored array as a .npy file plus a JSON id list."""
+        with self._lock:
+            size, arrays, ids = self._size, self._arrays, self._ids
+        if size == 0:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        for name in self.ARRAYS:
+            with open(f"{path}.{name}.npy.tmp", "wb") as f:
+                np.save(f, arrays[name][:size], allow_pickle=False)
+        with open(f"{path}.ids.json.tmp", "w") as f:
+            json.dump(ids[:size].tolist(), f)
+        for name in self.ARRAYS:
+            os.replace(f"{path}.{name}.npy.tmp", f"{path}.{name}.npy")
+        os.replace(f"{path}.ids.json.tmp", f"{path}.ids.json")
+        logger.info(f"Saved local vector index with {size} chunks to {path}")
+
+    def load(self, path: str) -> bool:
+        """Memory-map a saved index. Returns False if none exists."""
+        files = [f"{path}.{name}.npy" for name in self.ARRAYS] + [f"{path}.ids.json"]
+        if not all(os.path.exists(file) for file in files):
+            return False
+        arrays = {name: np.load(f"{path}.{name}.npy", mmap_mode="r") for name in self.ARRAYS}
+        with open(f"{path}.ids.json") as f:
+            ids = np.array(json.load(f), dtype=object)
+        if any(len(array) != len(ids) for array in arrays.values()):
+            logger.warning(f"Ignoring saved vector index at {path}: id and vector counts differ")
+            return False
+        with self._lock:
+            # The read-only mappings are copied into writable buffers on the first add
+            self._arrays, self._ids, self._size = arrays, ids, len(ids)
+            self._dim = self._loaded_dimensions(arrays)
+        logger.info(f"Loaded local vector index with {len(ids)} chunks from {path}")
+        return True
+
+    def _loaded_dimensions(self, arrays: Dict[str, np.ndarray]) -> int:
+        return arrays["vectors"].shape[1]
+
+    def load_or_warm(self, path: str):
+        """Load the saved index, falling back to Neo4j if it is missing or stale."""
+        if self.load(path) and self._size == db.count_chunks():
+            return
+        self.warm()
+        self.save(path)
+
+
+class QuantizedVectorIndex(LocalVectorIndex):
+    """Compact first-pass index over int8 or sign-bit binary codes.
+
+    int8 stores one scaled byte per dimension (about 4x smaller than float32)
+    and scores with an int8 dot product; binary stores one bit per dimension
+    (32x smaller) and scores by Hamming distance, mapped back to an
+    approximate cosine. Scores are approximate, so callers over-fetch
+    candidates and re-rank them with the full-precision embeddings.
+    """
+
+    exact = False
+
+    def __init__(self, mode: str, dimensions: Optional[int] = None):
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"Unsupported quantization mode: {mode!r}")
+        super().__init__()
+        self.mode = mode
+        self._expected_dimensions = dimensions
+        self.ARRAYS = ("codes", "scales") if mode == "int8" else ("bits",)
+        self.last_recall: Optional[float] = None
+
+    @property
+    def expected_dimensions(self) -> int:
+        return self._expected_dimensions or embedding_dimensions()
+
+    def _encode(self, matrix: np.ndarray) -> Dict[str, np.ndarray]:
+        if matrix.shape[1] != self.expected_dimensions:
+            raise ValueError(
+                f"Embedding dimension {matrix.shape[1]} does not match chunk_embeddings dimension {self.expected_dimensions}"
+            )
+        if self.mode == "int8":
+            codes, scales = quantize_int8(matrix)
+            return {"codes": codes, "scales": scales}
+        return {"bits": quantize_binary(matrix)}
+
+    def _score(self, arrays: Dict[str, np.ndarray], size: int, query: np.ndarray) -> np.ndarray:
+        if self.mode == "int8":
+            return int8_scores(arrays["codes"][:size], arrays["scales"][:size], query)
+        distances = hamming_distances(arrays["bits"][:size], quantize_binary(query[None, :])[0])
+        # Sign agreement on random hyperplanes estimates the angle between vectors
+        return np.cos(np.pi * distances / self._dim).astype(np.float32)
+
+    def _score_many(self, arrays: Dict[str, np.ndarray], size: int, queries: np.ndarray) -> np.ndarray:
+        return np.stack([self._score(arrays, size, query) for query in queries], axis=1)
+
+    def _loaded_dimensions(self, arrays: Dict[str, np.ndarray]) -> int:
+        return self.expected_dimensions
+
+    def warm(self, batch_size: int = 5000, evaluation_queries: int = 100, k: int = 10):
+        """Rebuild from Neo4j and measure recall@k against exact search.
+
+        The first `evaluation_queries` embeddings double as queries. Their
+        exact top-k is tracked incrementally while streaming batches, so the
+        comparison never needs the full-precision matrix in memory.
+        """
+        start = time.perf_counter()
+        self.clear()
+        queries = None
+        best_scores = best_rows = None
+        for chunk_ids, embeddings in db.iter_chunk_embeddings(batch_size):
+            matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+            if queries is None:
+                queries = matrix[:evaluation_queries].copy()
+                best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+                best_rows = np.empty((len(queries), 0), dtype=np.int64)
+            scores = np.concatenate([best_scores, queries @ matrix.T], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(self._size, self._size + len(matrix)), (len(queries), len(matrix)))], axis=1)
+            keep = np.argsort(-scores, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            self.add(chunk_ids, embeddings)
+
+        elapsed = time.perf_counter() - start
+        if queries is None:
+            logger.info("Warmed quantized vector index with 0 chunks")
+            return
+        first_pass, reranked = [], []
+        for i, query in enumerate(queries):
+            candidates = top_k(self._score(self._arrays, self._size, query), k * settings.VECTOR_RERANK_FACTOR)
+            first_pass.append(recall_at_k(best_rows[i], candidates[:k]))
+            # Exact re-ranking keeps every true top-k row that made the candidate set
+            reranked.append(recall_at_k(best_rows[i], candidates))
+        self.last_recall = float(np.mean(reranked))
+        logger.info(
+            f"Warmed {self.mode} vector index with {self._size} chunks in {elapsed:.2f}s: "
+            f"{self.memory_per_chunk()} bytes/chunk vs {self._dim * 4} for float32, "
+            f"recall@{k}={np.mean(first_pass):.3f} first pass, {self.last_recall:.3f} after re-ranking "
+            f"{k * settings.VECTOR_RERANK_FACTOR} candidates ({len(queries)} queries)"
+        )
+
+def _local_candidates(embedding: list, limit: int) -> List[Tuple[str, float]]:
+    # Quantized indexes over-fetch so exact re-ranking can recover the true top-k
+    if vector_index.exact:
+        return vector_index.search(embedding, limit)
+    return vector_index.search(embedding, limit * settings.VECTOR_RERANK_FACTOR)
+
+
+def _local_candidates_many(embeddings: List[list], limit: int) -> List[List[Tuple[str, float]]]:
+    return vector_index.search_many(embeddings, limit if vector_index.exact else limit * settings.VECTOR_RERANK_FACTOR)
+
+
+def _rank_local(embedding: list, limit: int, candidates: List[Tuple[str, float]], chunks: dict) -> List[dict]:
+    """Combine local index candidates with the chunks fetched for them.
+
+    Scores are mapped from cosine to Neo4j's (1 + cosine) / 2 scale, so
+    results look the same whichever tier served them.
+    """
+    def result(chunk_id: str, score: float) -> dict:
+        chunk = chunks[chunk_id]
+        return {"id": chunk_id, "content": chunk["content"], "score": (1.0 + score) / 2, "locations": chunk.get("locations") or []}
+
+    if vector_index.exact:
+        return [result(chunk_id, score) for chunk_id, score in candidates if chunk_id in chunks]
+    if not chunks:
+        return []
+    chunk_ids = list(chunks)
+    matrix = LocalVectorIndex._normalize(np.asarray([chunks[chunk_id]["embedding"] for chunk_id in chunk_ids], dtype=np.float32))
+    query = np.array(embedding, dtype=np.float32)
+    scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+    return [result(chunk_ids[i], float(scores[i])) for i in top_k(scores, limit)]
+
+
+def _log_shadow(limit: int, chunks: list, local_chunks: list, local_ms: float, neo4j_ms: float):
+    expected = {chunk["id"] for chunk in chunks}
+    recall = len(expected & {chunk["id"] for chunk in local_chunks}) / len(expected) if expected else 1.0
+    logger.info(f"Shadow vector search: recall@{limit}={recall:.2f} local={local_ms:.1f}ms neo4j={neo4j_ms:.1f}ms")
+
+
+async def _search_local_async(embedding: list, limit: int) -> List[dict]:
+    candidates = await asyncio.to_thread(_local_candidates, embedding, limit)
+    chunks = await async_db.get_chunks_by_ids([chunk_id for chunk_id, _ in candidates], include_embedding=not vector_index.exact)
+    return _rank_local(embedding, limit, candidates, chunks)
+
+
+def _rank_expanded(embedding: list, limit: int, seeds: List[dict], neighbors: List[dict]) -> List[dict]:
+    """Score graph neighbours against the query and rank them with the seeds."""
+    results = [dict(seed) for seed in seeds]
+    if neighbors:
+        matrix = LocalVectorIndex._normalize(np.asarray([neighbor["embedding"] for neighbor in neighbors], dtype=np.float32))
+        query = np.array(embedding, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        results.extend(
+            {"id": neighbor["id"], "content": neighbor["content"], "score": (1.0 + float(score)) / 2,
+             "locations": neighbor.get("locations") or []}
+            for neighbor, score in zip(neighbors, scores)
+        )
+    results.sort(key=lambda chunk: chunk["score"], reverse=True)
+    return results[:limit]
+
+
+def _graph_walk_sizes(limit: int) -> Tuple[int, int, int]:
+    seeds = max(1, min(limit, settings.GRAPH_EXPAND_SEEDS))
+    return seeds, settings.GRAPH_EXPAND_PER_SEED, max(limit - seeds, 0)
+
+
+async def _search_graph_async(embedding: list, limit: int) -> List[dict]:
+    seeds, neighbors = await async_db.expand_similar_chunks(embedding, *_graph_walk_sizes(limit))
+    return _rank_expanded(embedding, limit, seeds, neighbors)
+
+
+async def search_chunks_async(embedding: list, limit: int = 5, mode: str = None) -> list:
+    """Retrieve the most similar chunks using the configured search tier.
+
+    "neo4j" queries the chunk_embeddings index, "local" ranks with the
+    in-process index and only fetches content for the winners from Neo4j, and
+    "shadow" runs both, returns the Neo4j results and logs the local recall.
+    "graph" takes a few seeds from the index and fills the rest of `limit`
+    with chunks one NEXT or SIMILAR_TO hop away, scored against the query.
+    """
+    mode = mode or settings.VECTOR_SEARCH_MODE
+    with VECTOR_SEARCH_SECONDS.time(mode=mode):
+        return await _search_chunks_async(embedding, limit, mode)
+
+
+async def _search_chunks_async(embedding: list, limit: int, mode: str) -> list:
+    if mode == "graph":
+        return await _search_graph_async(embedding, limit)
+    if mode == "local":
+        return await _search_local_async(embedding, limit)
+    if mode == "shadow":
+        start = time.perf_counter()
+        local_chunks = await _search_local_async(embedding, limit)
+        local_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        chunks = await async_db.search_similar_chunks(embedding, limit)
+        _log_shadow(limit, chunks, local_chunks, local_ms, (time.perf_counter() - start) * 1000)
+        return chunks
+    return await async_db.search_similar_chunks(embedding, limit)
+
+
+async def search_chunks_batch_async(embeddings: List[list], limit: int = 5, mode: str = None) -> List[list]:
+    """`search_chunks_async` for many queries at once, results in query order.
+
+    "neo4j" runs every query in one UNWIND over the vector index; "local"
+    scores all queries with one matrix product and fetches the content of
+    every winner in a single lookup; "graph" runs the walks concurrently.
+    """
+    mode = mode or settings.VECTOR_SEARCH_MODE
+    with VECTOR_SEARCH_SECONDS.time(mode=f"{mode}_batch"):
+        return await _search_chunks_batch_async(embeddings, limit, mode)
+
+
+async def _search_chunks_batch_async(embeddings: List[list], limit: int, mode: str) -> List[list]:
+    if mode == "graph":
+        return list(await asyncio.gather(*[_search_graph_async(embedding, limit) for embedding in embeddings]))
+    if mode == "neo4j":
+        return await async_db.search_similar_chunks_batch(embeddings, limit)
+    start = time.perf_counter()
+    candidates = await asyncio.to_thread(_local_candidates_many, embeddings, limit)
+    chunk_ids = list({chunk_id for query_candidates in candidates for chunk_id, _ in query_candidates})
+    chunks = await async_db.get_chunks_by_ids(chunk_ids, include_embedding=not vector_index.exact)
+    local_results = [
+        _rank_local(embedding, limit, query_candidates, {chunk_id: chunks[chunk_id] for chunk_id, _ in query_candidates if chunk_id in chunks})
+        for embedding, query_candidates in zip(embeddings, candidates)
+    ]
+    if mode == "local":
+        return local_results
+    local_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    results = await async_db.search_similar_chunks_batch(embeddings, limit)
+    neo4j_ms = (time.perf_counter() - start) * 1000
+    for query_chunks, query_local in zip(results, local_results):
+        _log_shadow(limit, query_chunks, query_local, local_ms / len(embeddings), neo4j_ms / len(embeddings))
+    return results
+
+
+def create_vector_index() -> LocalVectorIndex:
+    if settings.VECTOR_QUANTIZATION not in QUANTIZATION_MODES:
+        raise ValueError(f"VECTOR_QUANTIZATION must be one of {QUANTIZATION_MODES}, got {settings.VECTOR_QUANTIZATION!r}")
+    if settings.VECTOR_QUANTIZATION == "none":
+        return LocalVectorIndex()
+    return QuantizedVectorIndex(settings.VECTOR_QUANTIZATION)
+
+
+vector_index = create_vector_index()
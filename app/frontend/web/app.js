@@ -1,5 +1,7 @@
 // Configuration
 const API_URL = '/api';
+const GRAPH_PAGE_SIZE = 1000;
+const GRAPH_MAX_NODES = 5000;
 
 // DOM Elements
 const chatMessages = document.getElementById('chatMessages');
@@ -23,6 +25,7 @@ const togglePhysicsButton = document.getElementById('togglePhysics');
 // Initialize graph visualization
 let network = null;
 let isProcessing = false;
+let conversationId = null;
 let selectedFile = null;
 let physicsEnabled = true;
 
@@ -296,6 +299,10 @@ async function uploadDocument() {
         
         // Processing phase
         showStatus('Processing document chunks...', STATUS_TYPES.PROGRESS);
+        const job = await waitForIngestionJob(result.job_id);
+        if (job.status === 'completed_with_errors') {
+            showStatus(`${job.chunks_failed} chunks could not be processed.`, STATUS_TYPES.WARNING);
+        }
         
         // Update graph visualization
         await updateGraphVisualization();
@@ -327,6 +334,38 @@ async function uploadDocument() {
     }
 }
 
+async function waitForIngestionJob(jobId) {
+    // Poll the background ingestion job until it finishes
+    while (true) {
+        const response = await fetch(`${API_URL}/documents/jobs/${jobId}`);
+        if (!response.ok) {
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
+        }
+        const job = await response.json();
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Document processing failed');
+        }
+        if (job.status === 'completed' || job.status === 'completed_with_errors') {
+            return job;
+        }
+        uploadButton.innerHTML = `<span class="spinner"></span> Processing... ${job.chunks_written} chunks (${job.pages_parsed} pages)`;
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+// Follow-up questions share a conversation so the model keeps its state between turns
+async function getConversationId() {
+    if (conversationId === null) {
+        const response = await fetch(`${API_URL}/conversations`, { method: 'POST' });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        conversationId = (await response.json()).conversation_id;
+    }
+    return conversationId;
+}
+
 async function sendMessage() {
     const message = messageInput.value.trim();
     if (!message || isProcessing) return;
@@ -340,14 +379,24 @@ async function sendMessage() {
     messageInput.value = '';
 
     try {
-        const response = await fetch(`${API_URL}/query`, {
+        const postQuery = async () => fetch(`${API_URL}/query`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ text: message })
+            body: JSON.stringify({ text: message, format: 'compact', conversation_id: await getConversationId() })
         });
+        let response = await postQuery();
+        if (response.status === 404) {
+            // The conversation expired on the server; start a new one
+            conversationId = null;
+            response = await postQuery();
+        }
 
+        if (response.status === 503) {
+            const retryAfter = response.headers.get('Retry-After');
+            throw new Error(`The server is busy, please retry in ${retryAfter || 'a few'} seconds`);
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
@@ -355,61 +404,50 @@ async function sendMessage() {
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
         let assistantMessage = '';
-        let context = '';
+        let buffer = '';
 
         // Create initial assistant message
         addMessageToChat('assistant', '');
 
+        const handleEvent = (event) => {
+            if (event.type === 't') {
+                // Compact format: raw answer text
+                assistantMessage += event.data;
+                updateAssistantMessage(assistantMessage);
+                return;
+            }
+            if (event.type === 's') {
+                // Compact format: [[id, score, page?], ...]
+                addSourcesToMessage(JSON.parse(event.data).map(([id, score, page]) => ({ id, score, locations: [{ page }] })));
+                return;
+            }
+            const data = JSON.parse(event.data);
+            if (data.chunk) {
+                assistantMessage += data.chunk;
+                updateAssistantMessage(assistantMessage);
+            } else if (data.sources) {
+                addSourcesToMessage(data.sources);
+            } else if (data.context) {
+                addContextToMessage(data.context);
+            }
+        };
+
         while (true) {
             const { value, done } = await reader.read();
             if (done) break;
 
-            const chunk = decoder.decode(value);
-            const lines = chunk.split('\n');
-
-            for (const line of lines) {
-                if (line.startsWith('data: ')) {
-                    try {
-                        const data = JSON.parse(line.slice(6));
-                        if (data.chunk) {
-                            assistantMessage += data.chunk;
-                            updateAssistantMessage(assistantMessage);
-                        } else if (data.context) {
-                            context = data.context;
-                            // Add context to the existing message using the collapsible structure
-                            const lastMessage = chatMessages.lastElementChild;
-                            if (lastMessage && lastMessage.classList.contains('assistant')) {
-                                const contextDiv = document.createElement('div');
-                                contextDiv.className = 'message-context';
-                                
-                                const contextHeader = document.createElement('div');
-                                contextHeader.className = 'message-context-header collapsed';
-                                contextHeader.innerHTML = `
-                                    <i class="fas fa-chevron-down"></i>
-                                    <span>Context</span>
-                                `;
-                                
-                                const contextContent = document.createElement('div');
-                                contextContent.className = 'message-context-content';
-                                contextContent.textContent = context;
-                                
-                                contextDiv.appendChild(contextHeader);
-                                contextDiv.appendChild(contextContent);
-                                
-                                // Add click handler for toggling
-                                contextHeader.addEventListener('click', (e) => {
-                                    e.stopPropagation();
-                                    const isCollapsed = contextHeader.classList.contains('collapsed');
-                                    contextHeader.classList.toggle('collapsed');
-                                    contextContent.classList.toggle('expanded');
-                                });
-                                
-                                lastMessage.appendChild(contextDiv);
-                            }
-                        }
-                    } catch (e) {
-                        console.error('Error parsing SSE data:', e);
-                    }
+            // Frames can span reads, so only complete events are parsed
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+
+            for (const block of events) {
+                const event = parseSSEEvent(block);
+                if (event === null) continue;
+                try {
+                    handleEvent(event);
+                } catch (e) {
+                    console.error('Error parsing SSE data:', e);
                 }
             }
         }
@@ -469,6 +507,65 @@ function addMessageToChat(role, content, context = null) {
     chatMessages.scrollTop = chatMessages.scrollHeight;
 }
 
+function parseSSEEvent(block) {
+    let type = 'message';
+    const data = [];
+    for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) {
+            type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            data.push(line.startsWith('data: ') ? line.slice(6) : line.slice(5));
+        }
+    }
+    return data.length ? { type, data: data.join('\n') } : null;
+}
+
+function addSourcesToMessage(sources) {
+    const lastMessage = chatMessages.lastElementChild;
+    if (!lastMessage || !lastMessage.classList.contains('assistant') || !sources.length) return;
+
+    const sourcesDiv = document.createElement('div');
+    sourcesDiv.className = 'message-sources';
+    const label = source => {
+        const page = (source.locations || []).map(location => location.page).find(page => page != null);
+        return `${source.id.slice(0, 8)}${page != null ? ` p.${page}` : ''} (${source.score.toFixed(2)})`;
+    };
+    sourcesDiv.textContent = `Sources: ${sources.map(label).join(', ')}`;
+    lastMessage.appendChild(sourcesDiv);
+}
+
+function addContextToMessage(context) {
+    // Add context to the existing message using the collapsible structure
+    const lastMessage = chatMessages.lastElementChild;
+    if (lastMessage && lastMessage.classList.contains('assistant')) {
+        const contextDiv = document.createElement('div');
+        contextDiv.className = 'message-context';
+        
+        const contextHeader = document.createElement('div');
+        contextHeader.className = 'message-context-header collapsed';
+        contextHeader.innerHTML = `
+            <i class="fas fa-chevron-down"></i>
+            <span>Context</span>
+        `;
+        
+        const contextContent = document.createElement('div');
+        contextContent.className = 'message-context-content';
+        contextContent.textContent = context;
+        
+        contextDiv.appendChild(contextHeader);
+        contextDiv.appendChild(contextContent);
+        
+        // Add click handler for toggling
+        contextHeader.addEventListener('click', (e) => {
+            e.stopPropagation();
+            contextHeader.classList.toggle('collapsed');
+            contextContent.classList.toggle('expanded');
+        });
+        
+        lastMessage.appendChild(contextDiv);
+    }
+}
+
 function updateAssistantMessage(content) {
     const lastMessage = chatMessages.lastElementChild;
     if (lastMessage && lastMessage.classList.contains('assistant')) {
@@ -487,11 +584,38 @@ async function updateGraphVisualization() {
             loadingElement.style.display = 'flex';
         }
 
-        const response = await fetch(`${API_URL}/graph`);
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+        // Large graphs are shown as a per-document summary that expands on double click
+        const summaryResponse = await fetch(`${API_URL}/graph/summary`);
+        if (!summaryResponse.ok) {
+            throw new Error(`HTTP error! status: ${summaryResponse.status}`);
         }
-        const data = await response.json();
+        const summary = await summaryResponse.json();
+        if (summary.stats.total_nodes > GRAPH_MAX_NODES) {
+            if (loadingElement) {
+                loadingElement.style.display = 'none';
+            }
+            showStatus(`Showing ${summary.stats.documents_shown} of ${summary.stats.labels.Document || 0} documents; double-click one to expand it`, STATUS_TYPES.INFO);
+            renderGraph(summary);
+            return;
+        }
+
+        // Fetch graph pages until the end or the render limit is reached
+        const data = { nodes: [], relationships: [] };
+        let cursor = null;
+        do {
+            const params = new URLSearchParams({ limit: GRAPH_PAGE_SIZE });
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            const response = await fetch(`${API_URL}/graph?${params}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const page = await response.json();
+            data.nodes.push(...page.nodes);
+            data.relationships.push(...page.relationships);
+            cursor = page.next_cursor;
+        } while (cursor && data.nodes.length < GRAPH_MAX_NODES);
         
         // Hide loading state
         if (loadingElement) {
@@ -509,11 +633,10 @@ async function updateGraphVisualization() {
     }
 }
 
-function renderGraph(graphData) {
-    // Create nodes and edges for vis.js
-    const nodes = new vis.DataSet(graphData.nodes.map(node => ({
+function toVisNode(node) {
+    return {
         id: node.id,
-        label: node.label || node.name || node.title || 'Unnamed',
+        label: getNodeLabel(node),
         title: createNodeTooltip(node),
         group: node.type || 'default',
         color: {
@@ -548,9 +671,11 @@ function renderGraph(graphData) {
             y: 5
         },
         properties: node.properties || {}
-    })));
-    
-    const edges = new vis.DataSet(graphData.relationships.map(rel => ({
+    };
+}
+
+function toVisEdge(rel) {
+    return {
         from: rel.startNode,
         to: rel.endNode,
         label: rel.type,
@@ -594,7 +719,36 @@ function renderGraph(graphData) {
             y: 5
         },
         properties: rel.properties || {}
-    })));
+    };
+}
+
+function getNodeLabel(node) {
+    const label = node.label || node.name || node.title || 'Unnamed';
+    // Collapsed summary documents show how many chunks they stand for
+    if (node.properties && node.properties.collapsed) {
+        return `${label} (${node.properties.chunk_count} chunks)`;
+    }
+    return label;
+}
+
+async function expandDocumentNode(node, nodes, edges) {
+    try {
+        const response = await fetch(`${API_URL}/graph/documents/${encodeURIComponent(node.properties.id)}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const neighborhood = await response.json();
+        nodes.update(neighborhood.nodes.map(toVisNode));
+        edges.add(neighborhood.relationships.map(toVisEdge));
+    } catch (error) {
+        showStatus(`Error expanding document: ${error.message}`, STATUS_TYPES.ERROR);
+    }
+}
+
+function renderGraph(graphData) {
+    // Create nodes and edges for vis.js
+    const nodes = new vis.DataSet(graphData.nodes.map(toVisNode));
+    const edges = new vis.DataSet(graphData.relationships.map(toVisEdge));
     
     // Create network
     const container = document.getElementById('graphVisualization');
@@ -772,9 +926,13 @@ function renderGraph(graphData) {
         network.unselectAll();
     });
 
-    // Add double click event to focus on node
+    // Add double click event to focus on node, expanding collapsed documents
     network.on('doubleClick', function(params) {
         if (params.nodes.length > 0) {
+            const node = nodes.get(params.nodes[0]);
+            if (node && node.properties.collapsed) {
+                expandDocumentNode(node, nodes, edges);
+            }
             network.focus(params.nodes[0], {
                 scale: 1.5,
                 animation: true
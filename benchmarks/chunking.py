@@ -0,0 +1,148 @@
+"""Compare the offset-preserving chunker with the old word-split chunker.
+
+Chunks a synthetic corpus (or a real text file) streamed in 64 KB blocks,
+the way uploads are read, and reports throughput for the old chunker and
+for each boundary mode of the current one:
+
+    python benchmarks/chunking.py --megabytes 300
+    python benchmarks/chunking.py --input big.txt --overlap 100 --whole
+
+`--whole` passes the input as one string, as `OllamaService.chunk_text`
+does. The old chunker split every segment into one string per word and
+rebuilt chunks with `" ".join`; it is kept here as the baseline.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Iterable, Iterator, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.core.chunking import BOUNDARY_MODES, StreamingChunker  # noqa: E402
+from app.core.extraction import iter_text_file  # noqa: E402
+
+BLOCK_SIZE = 64 * 1024
+VOCABULARY = (
+    "graph node edge document chunk vector index query answer model token context search score "
+    "embedding retrieval neighbour page section paragraph sentence the a of and to in is for with"
+).split()
+
+
+class LegacyChunker:
+    """The word-split chunker this benchmark compares against."""
+
+    def __init__(self, chunk_size: int = 1000):
+        self.chunk_size = chunk_size
+        self._words: List[str] = []
+        self._size = 0
+        self._partial = ""
+
+    def feed(self, text: str) -> List[str]:
+        if not text:
+            return []
+        text = self._partial + text
+        words = text.split()
+        self._partial = words.pop() if words and not text[-1].isspace() else ""
+        return self._add_words(words)
+
+    def finish(self) -> List[str]:
+        chunks = self._add_words([self._partial] if self._partial else [])
+        if self._words:
+            chunks.append(" ".join(self._words))
+        return chunks
+
+    def _add_words(self, words: List[str]) -> List[str]:
+        chunks = []
+        for word in words:
+            word_size = len(word) + 1
+            if self._size + word_size > self.chunk_size and self._words:
+                chunks.append(" ".join(self._words))
+                self._words = [word]
+                self._size = word_size
+            else:
+                self._words.append(word)
+                self._size += word_size
+        return chunks
+
+
+def synthetic_blocks(megabytes: float, seed: int = 0) -> Iterator[str]:
+    """Yield `megabytes` of paragraphs of sentences in 64 KB blocks."""
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(256):
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            words = rng.choices(VOCABULARY, k=rng.randint(5, 25))
+            sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+        paragraphs.append(" ".join(sentences) + "\n\n")
+    corpus = "".join(paragraphs)
+    remaining = int(megabytes * 1024 * 1024)
+    offset = 0
+    while remaining > 0:
+        block = corpus[offset:offset + min(BLOCK_SIZE, remaining)]
+        if not block:
+            offset = 0
+            continue
+        offset += len(block)
+        remaining -= len(block)
+        yield block
+
+
+def run(chunker, segments: Iterable[str], trace_memory: bool) -> dict:
+    if trace_memory:
+        tracemalloc.start()
+    characters = chunks = 0
+    start = time.perf_counter()
+    for segment in segments:
+        characters += len(segment)
+        chunks += len(chunker.feed(segment))
+    chunks += len(chunker.finish())
+    seconds = time.perf_counter() - start
+    result = {"characters": characters, "chunks": chunks, "seconds": round(seconds, 3),
+              "mb_per_second": round(characters / 1024 / 1024 / seconds, 1) if seconds else None}
+    if trace_memory:
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=300, help="Size of the synthetic corpus")
+    parser.add_argument("--input", help="Chunk this text file instead of a synthetic corpus")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--whole", action="store_true", help="Chunk the input as one string instead of 64 KB blocks")
+    parser.add_argument("--trace-memory", action="store_true", help="Report peak Python allocations (much slower)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    def segments():
+        blocks = iter_text_file(args.input) if args.input else synthetic_blocks(args.megabytes)
+        return ["".join(blocks)] if args.whole else blocks
+
+    candidates = [("legacy", lambda: LegacyChunker(args.chunk_size))] + [
+        (boundary, lambda boundary=boundary: StreamingChunker(args.chunk_size, args.overlap, boundary))
+        for boundary in BOUNDARY_MODES
+    ]
+    results = {}
+    for name, factory in candidates:
+        results[name] = run(factory(), segments(), args.trace_memory)
+        result = results[name]
+        print(
+            f"{name:<10} chunks={result['chunks']:<8} {result['seconds']:>7.2f}s "
+            f"{result['mb_per_second'] or 0:>7.1f} MB/s"
+            + (f" peak={result['peak_mb']} MB" if "peak_mb" in result else "")
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"chunk_size": args.chunk_size, "overlap": args.overlap, "whole": args.whole, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
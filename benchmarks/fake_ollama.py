@@ -0,0 +1,151 @@
+"""A deterministic stand-in for the Ollama HTTP API.
+
+Serves the endpoints the API calls (`/api/embed`, `/api/embeddings`,
+`/api/generate`) with a fixed, configurable latency so benchmarks measure
+the application rather than the model:
+
+    python benchmarks/fake_ollama.py --port 11434 --ttft-ms 200 --token-ms 20
+
+Embeddings are hashed bags of words: every word maps to a fixed random
+unit vector and a text embeds to the normalized sum of its words' vectors.
+The same text always embeds the same way, and texts sharing words score as
+similar, so retrieval over a synthetic corpus behaves like the real thing.
+Generations stream `--tokens` words after `--ttft-ms`, one every
+`--token-ms`, and end with the context and token counts Ollama reports.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+from aiohttp import web
+
+WORD = re.compile(r"\w+")
+ANSWER_WORDS = (
+    "the context describes this in detail and the main points follow from the "
+    "documents retrieved for the question so the answer is grounded in them"
+).split()
+
+
+class FakeOllamaConfig:
+    def __init__(self, dimensions: int = 768, embed_ms: float = 5.0, embed_per_text_ms: float = 0.5,
+                 ttft_ms: float = 100.0, token_ms: float = 10.0, tokens: int = 64):
+        self.dimensions = dimensions
+        self.embed_ms = embed_ms
+        self.embed_per_text_ms = embed_per_text_ms
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def embed_text(text: str, dimensions: int) -> list:
+    """Deterministic bag-of-words embedding of `text`."""
+    words = WORD.findall(text.lower()) or [""]
+    vector = np.sum([_word_vector(word, dimensions) for word in words], axis=0)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def create_app(config: FakeOllamaConfig) -> web.Application:
+    stats = {"embed_requests": 0, "embedded_texts": 0, "generations": 0}
+
+    async def embed(request: web.Request) -> web.Response:
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep((config.embed_ms + config.embed_per_text_ms * len(texts)) / 1000)
+        stats["embed_requests"] += 1
+        stats["embedded_texts"] += len(texts)
+        return web.json_response({
+            "model": body.get("model"),
+            "embeddings": [embed_text(text, config.dimensions) for text in texts],
+            "prompt_eval_count": sum(len(WORD.findall(text)) for text in texts)
+        })
+
+    async def embeddings(request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep((config.embed_ms + config.embed_per_text_ms) / 1000)
+        stats["embed_requests"] += 1
+        stats["embedded_texts"] += 1
+        return web.json_response({"embedding": embed_text(body["prompt"], config.dimensions)})
+
+    async def generate(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        if not body.get("prompt"):
+            # Ollama loads the model and returns at once
+            return web.json_response({"model": body.get("model"), "response": "", "done": True, "done_reason": "load"})
+        stats["generations"] += 1
+        words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(config.tokens)]
+        prompt_tokens = len(WORD.findall(body["prompt"]))
+        # Token state to continue from: the previous state plus this prompt and answer
+        context = list(body.get("context") or []) + list(range(prompt_tokens + len(words)))
+        start = time.perf_counter()
+        if not body.get("stream", True):
+            await asyncio.sleep((config.ttft_ms + config.token_ms * max(config.tokens - 1, 0)) / 1000)
+            return web.json_response({"model": body.get("model"), "response": " ".join(words), "done": True})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        await asyncio.sleep(config.ttft_ms / 1000)
+        decode_start = time.perf_counter()
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(config.token_ms / 1000)
+            token = word if i == 0 else f" {word}"
+            await response.write((json.dumps({"model": body.get("model"), "response": token, "done": False}) + "\n").encode())
+        now = time.perf_counter()
+        await response.write((json.dumps({
+            "model": body.get("model"),
+            "response": "",
+            "done": True,
+            "context": context,
+            "total_duration": int((now - start) * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(words),
+            "eval_duration": int((now - decode_start) * 1e9)
+        }) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def version(request: web.Request) -> web.Response:
+        return web.json_response({"version": "0.0.0-fake"})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/api/embed", embed)
+    app.router.add_post("/api/embeddings", embeddings)
+    app.router.add_post("/api/generate", generate)
+    app.router.add_get("/api/version", version)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--embed-ms", type=float, default=5.0, help="Latency of every embedding request")
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.5, help="Extra latency per text in a request")
+    parser.add_argument("--ttft-ms", type=float, default=100.0, help="Delay before the first generated token")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="Delay between generated tokens")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per generation")
+    args = parser.parse_args()
+    config = FakeOllamaConfig(args.dimensions, args.embed_ms, args.embed_per_text_ms, args.ttft_ms, args.token_ms, args.tokens)
+    web.run_app(create_app(config), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
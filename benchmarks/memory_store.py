@@ -0,0 +1,530 @@
+"""An in-memory graph store with the interface of app.core.database.
+
+`MemoryStore` implements the `Neo4jConnection` methods the API calls, and
+`AsyncMemoryStore` the `AsyncNeo4jConnection` ones, over plain dicts and a
+brute-force NumPy vector search. Scores use the vector index's (1 + cos) / 2
+scale. It lets the benchmark suite run the real application offline:
+
+    from memory_store import install
+    install()          # before anything imports app.core.database's db
+    from app.api.main import app
+
+Element ids are "doc:<id>" and "chunk:<id>". Writes are serialized by one
+lock; nothing is persisted.
+"""
+import json
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Chunk locations returned per chunk, as CHUNK_LOCATIONS does
+MAX_LOCATIONS = 8
+
+
+def _document_label(doc_id: str, metadata: Optional[str]) -> str:
+    try:
+        return json.loads(metadata).get("filename") or doc_id
+    except (TypeError, ValueError, AttributeError):
+        return doc_id
+
+
+def _percentile_disc(values: List[int], pct: float) -> Optional[int]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, int(np.ceil(pct * len(ordered))) - 1)]
+
+
+class MemoryStore:
+    """Documents, chunks, CONTAINS/NEXT/SIMILAR_TO edges and a vector search in memory."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documents: Dict[str, dict] = {}
+        self._chunks: Dict[str, str] = {}
+        # doc id -> {position: chunk id}, and chunk id -> {(doc id, position)}
+        self._contains: Dict[str, Dict[int, str]] = {}
+        self._locations: Dict[str, Set[Tuple[str, int]]] = {}
+        # doc id -> {position: (start, end, page)}, the CONTAINS properties
+        self._spans: Dict[str, Dict[int, tuple]] = {}
+        # SIMILAR_TO edges, start chunk id -> {end chunk id: score}, and indexed by end
+        self._similar: Dict[str, Dict[str, float]] = {}
+        self._similar_to: Dict[str, Dict[str, float]] = {}
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    # Connection lifecycle; nothing to connect to
+
+    def connect_with_retry(self, max_retries=5, retry_delay=5):
+        pass
+
+    def close(self):
+        pass
+
+    def create_constraints(self):
+        pass
+
+    # Vector search
+
+    def _add_vector(self, chunk_id: str, embedding: list):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        size = len(self._ids)
+        if self._matrix.shape[1] != vector.shape[0]:
+            self._matrix = np.zeros((max(1024, size), vector.shape[0]), dtype=np.float32)
+        elif size == self._matrix.shape[0]:
+            grown = np.zeros((size * 2, self._matrix.shape[1]), dtype=np.float32)
+            grown[:size] = self._matrix
+            self._matrix = grown
+        self._matrix[size] = vector
+        self._rows[chunk_id] = size
+        self._ids.append(chunk_id)
+
+    def _remove_vector(self, chunk_id: str):
+        row = self._rows.pop(chunk_id, None)
+        if row is None:
+            return
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved
+            self._rows[moved] = row
+        self._ids.pop()
+
+    def _nearest(self, embedding: list, limit: int) -> List[Tuple[str, float]]:
+        size = len(self._ids)
+        if not size or limit <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = self._matrix[:size] @ (query / norm if norm else query)
+        limit = min(limit, size)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[row], float((1 + scores[row]) / 2)) for row in top]
+
+    def _span(self, doc_id: str, position: int) -> dict:
+        start, end, page = self._spans.get(doc_id, {}).get(position, (None, None, None))
+        return {"page": page, "start": start, "end": end}
+
+    def _chunk_locations(self, chunk_id: str) -> List[dict]:
+        return [
+            {"doc_id": doc_id, "position": position, **self._span(doc_id, position)}
+            for doc_id, position in sorted(self._locations.get(chunk_id, ()))[:MAX_LOCATIONS]
+        ]
+
+    def _chunk(self, chunk_id: str, **fields) -> dict:
+        return {"id": chunk_id, "content": self._chunks[chunk_id], **fields, "locations": self._chunk_locations(chunk_id)}
+
+    def _embedding(self, chunk_id: str) -> list:
+        return self._matrix[self._rows[chunk_id]].tolist()
+
+    def search_similar_chunks(self, embedding: list, limit: int = 5) -> List[dict]:
+        with self._lock:
+            return [self._chunk(chunk_id, score=score) for chunk_id, score in self._nearest(embedding, limit)]
+
+    def search_similar_chunks_batch(self, embeddings: List[list], limit: int = 5) -> List[List[dict]]:
+        return [self.search_similar_chunks(embedding, limit) for embedding in embeddings]
+
+    def get_chunks_by_ids(self, chunk_ids: List[str], include_embedding: bool = False) -> dict:
+        with self._lock:
+            return {
+                chunk_id: self._chunk(chunk_id, embedding=self._embedding(chunk_id) if include_embedding else None)
+                for chunk_id in chunk_ids
+                if chunk_id in self._chunks
+            }
+
+    def _neighbors(self, chunk_id: str) -> List[Tuple[float, str]]:
+        """(rank, chunk id) of every NEXT or SIMILAR_TO neighbour; NEXT ranks above any score."""
+        neighbors = []
+        for doc_id, position in self._locations.get(chunk_id, ()):
+            chunks = self._contains[doc_id]
+            for other in (chunks.get(position - 1), chunks.get(position + 1)):
+                if other is not None:
+                    neighbors.append((2.0, other))
+        neighbors.extend((score, other) for other, score in self._similar.get(chunk_id, {}).items())
+        neighbors.extend((score, other) for other, score in self._similar_to.get(chunk_id, {}).items())
+        return neighbors
+
+    def expand_similar_chunks(self, embedding: list, seeds: int, per_seed: int, neighbors: int) -> Tuple[List[dict], List[dict]]:
+        with self._lock:
+            hits = self._nearest(embedding, seeds)
+            seed_ids = {chunk_id for chunk_id, _ in hits}
+            expanded: List[str] = []
+            for chunk_id, _ in hits:
+                ranked = sorted(self._neighbors(chunk_id), key=lambda neighbor: neighbor[0], reverse=True)[:per_seed]
+                for _, other in ranked:
+                    if other not in seed_ids and other not in expanded:
+                        expanded.append(other)
+            return (
+                [self._chunk(chunk_id, score=score) for chunk_id, score in hits],
+                [self._chunk(chunk_id, embedding=self._embedding(chunk_id)) for chunk_id in expanded[:neighbors]]
+            )
+
+    # Writes
+
+    def create_document(self, doc_id: str, content: str, metadata: dict = None):
+        expires_at = (metadata or {}).get("expires_at")
+        with self._lock:
+            self._documents[doc_id] = {
+                "content": content,
+                "metadata": json.dumps(metadata) if metadata else None,
+                "ingested_at": time.time(),
+                "expires_at": float(expires_at) if isinstance(expires_at, (int, float)) else None
+            }
+            self._contains.setdefault(doc_id, {})
+            self._spans.setdefault(doc_id, {})
+
+    def create_chunks_bulk(self, doc_id: str, chunks: List[tuple], batch_size: int = None) -> List[str]:
+        with self._lock:
+            if doc_id not in self._documents:
+                raise RuntimeError(f"Expected to create {len(chunks)} chunks for document {doc_id}, created 0")
+            contains = self._contains[doc_id]
+            for chunk_id, content, embedding, position, start, end, page in chunks:
+                if chunk_id not in self._chunks:
+                    self._chunks[chunk_id] = content
+                    if embedding is not None:
+                        self._add_vector(chunk_id, embedding)
+                previous = contains.get(position)
+                if previous is not None:
+                    self._locations[previous].discard((doc_id, position))
+                contains[position] = chunk_id
+                self._spans[doc_id][position] = (start, end, page)
+                self._locations.setdefault(chunk_id, set()).add((doc_id, position))
+            return list(dict.fromkeys(chunk[0] for chunk in chunks if chunk[0] not in self._rows))
+
+    def set_chunk_embeddings(self, embeddings: List[Tuple[str, list]]):
+        with self._lock:
+            for chunk_id, embedding in embeddings:
+                if chunk_id in self._chunks and chunk_id not in self._rows:
+                    self._add_vector(chunk_id, embedding)
+
+    def get_document_chunks(self, doc_id: str) -> Dict[int, Tuple[str, Optional[int]]]:
+        with self._lock:
+            spans = self._spans.get(doc_id, {})
+            return {
+                position: (chunk_id, spans.get(position, (None,))[0])
+                for position, chunk_id in self._contains.get(doc_id, {}).items()
+            }
+
+    def existing_chunk_ids(self, chunk_ids: List[str]) -> Set[str]:
+        with self._lock:
+            return {chunk_id for chunk_id in chunk_ids if chunk_id in self._chunks}
+
+    def _delete_chunk(self, chunk_id: str):
+        del self._chunks[chunk_id]
+        self._locations.pop(chunk_id, None)
+        self._remove_vector(chunk_id)
+        for other in self._similar.pop(chunk_id, {}):
+            self._similar_to[other].pop(chunk_id, None)
+        for other in self._similar_to.pop(chunk_id, {}):
+            self._similar[other].pop(chunk_id, None)
+
+    def prune_document_chunks(self, doc_id: str, chunk_count: int, replaced_ids: List[str] = ()) -> List[str]:
+        with self._lock:
+            contains = self._contains.get(doc_id, {})
+            unlinked = set(replaced_ids)
+            for position in [position for position in contains if position >= chunk_count]:
+                chunk_id = contains.pop(position)
+                self._spans[doc_id].pop(position, None)
+                self._locations[chunk_id].discard((doc_id, position))
+                unlinked.add(chunk_id)
+            removed = [chunk_id for chunk_id in unlinked if chunk_id in self._chunks and not self._locations.get(chunk_id)]
+            for chunk_id in removed:
+                self._delete_chunk(chunk_id)
+            return removed
+
+    def delete_documents(self, doc_ids: List[str], batch_size: int = None) -> dict:
+        with self._lock:
+            doc_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id in self._documents]
+            relationships = 0
+            candidates = set()
+            for doc_id in doc_ids:
+                contains = self._contains.pop(doc_id, {})
+                self._spans.pop(doc_id, None)
+                # CONTAINS edges, and NEXT edges between consecutive positions
+                relationships += len(contains) + sum(1 for position in contains if position + 1 in contains)
+                for position, chunk_id in contains.items():
+                    self._locations[chunk_id].discard((doc_id, position))
+                    candidates.add(chunk_id)
+                del self._documents[doc_id]
+            chunk_ids = sorted(chunk_id for chunk_id in candidates if not self._locations.get(chunk_id))
+            similar = {
+                tuple(sorted((chunk_id, other)))
+                for chunk_id in chunk_ids
+                for other in list(self._similar.get(chunk_id, {})) + list(self._similar_to.get(chunk_id, {}))
+            }
+            relationships += len(similar)
+            for chunk_id in chunk_ids:
+                self._delete_chunk(chunk_id)
+            return {"document_ids": doc_ids, "chunk_ids": chunk_ids, "relationships_deleted": relationships}
+
+    def find_expired_documents(self, now: float, max_age: Optional[float] = None, limit: int = 1000,
+                               exclude: Optional[List[str]] = None) -> List[str]:
+        cutoff = now - max_age if max_age else None
+        exclude = set(exclude or ())
+        with self._lock:
+            return [
+                doc_id for doc_id, document in self._documents.items()
+                if doc_id not in exclude
+                and ((document["expires_at"] is not None and document["expires_at"] <= now)
+                     or (cutoff is not None and document["ingested_at"] <= cutoff))
+            ][:limit]
+
+    def link_similar_chunks(self, chunks: List[Tuple[str, list]], k: int = None, min_score: float = None) -> int:
+        k = 5 if k is None else k
+        min_score = 0.8 if min_score is None else min_score
+        if not chunks or k <= 0:
+            return 0
+        linked = 0
+        with self._lock:
+            for chunk_id, embedding in chunks:
+                if chunk_id not in self._chunks:
+                    continue
+                hits = [
+                    (other, score) for other, score in self._nearest(embedding, k + 1)
+                    if other != chunk_id and score >= min_score
+                ][:k]
+                for other, score in hits:
+                    start, end = (other, chunk_id) if chunk_id in self._similar.get(other, {}) else (chunk_id, other)
+                    self._similar.setdefault(start, {})[end] = score
+                    self._similar_to.setdefault(end, {})[start] = score
+                    linked += 1
+        return linked
+
+    def iter_unlinked_chunks(self, batch_size: int = 500) -> Iterator[List[Tuple[str, list]]]:
+        with self._lock:
+            unlinked = [
+                (chunk_id, self._embedding(chunk_id)) for chunk_id in sorted(self._rows)
+                if not self._similar.get(chunk_id) and not self._similar_to.get(chunk_id)
+            ]
+        for start in range(0, len(unlinked), batch_size):
+            yield unlinked[start:start + batch_size]
+
+    # Reads for the graph views and the local index
+
+    def count_chunks(self) -> int:
+        with self._lock:
+            return len(self._chunks)
+
+    def iter_chunk_embeddings(self, batch_size: int = 5000) -> Iterator[Tuple[List[str], List[list]]]:
+        with self._lock:
+            chunk_ids = sorted(self._rows)
+        for start in range(0, len(chunk_ids), batch_size):
+            with self._lock:
+                page = [chunk_id for chunk_id in chunk_ids[start:start + batch_size] if chunk_id in self._rows]
+                yield page, [self._embedding(chunk_id) for chunk_id in page]
+
+    def _outgoing(self, element_id: str) -> Iterator[dict]:
+        kind, _, key = element_id.partition(":")
+        if kind == "doc":
+            for position, chunk_id in sorted(self._contains.get(key, {}).items()):
+                # Neo4j doesn't store null properties
+                properties = {name: value for name, value in self._span(key, position).items() if value is not None}
+                yield {"startNode": element_id, "endNode": f"chunk:{chunk_id}", "type": "CONTAINS",
+                       "properties": {"position": position, **properties}}
+            return
+        for doc_id, position in sorted(self._locations.get(key, ())):
+            following = self._contains[doc_id].get(position + 1)
+            if following is not None:
+                yield {
+                    "startNode": element_id, "endNode": f"chunk:{following}", "type": "NEXT",
+                    "properties": {"doc_id": doc_id, "position": position}
+                }
+        for other, score in self._similar.get(key, {}).items():
+            yield {"startNode": element_id, "endNode": f"chunk:{other}", "type": "SIMILAR_TO", "properties": {"score": score}}
+
+    def iter_graph(self, limit: int, cursor: Optional[str] = None, skip: int = 0,
+                   include_embeddings: bool = False, include_content: bool = False,
+                   preview_chars: int = 200) -> Iterator[Tuple[str, dict]]:
+        order = {"Document": 0, "Chunk": 1}
+        if cursor is not None:
+            label, _, after = cursor.partition(":")
+            if label not in order:
+                raise ValueError(f"Invalid graph cursor: {cursor!r}")
+        with self._lock:
+            element_ids = sorted(
+                [f"doc:{doc_id}" for doc_id in self._documents] + [f"chunk:{chunk_id}" for chunk_id in self._chunks],
+                key=lambda element_id: (element_id.startswith("chunk:"), element_id.partition(":")[2])
+            )
+            if cursor is not None:
+                element_ids = [
+                    element_id for element_id in element_ids
+                    if (element_id.startswith("chunk:"), element_id.partition(":")[2]) > (order[label] == 1, after)
+                ]
+            page = element_ids[skip:skip + limit]
+            nodes, relationships = [], []
+            for element_id in page:
+                kind, _, key = element_id.partition(":")
+                if kind == "doc":
+                    document = self._documents[key]
+                    content = document["content"]
+                    properties = {"id": key, "metadata": document["metadata"]}
+                else:
+                    content = self._chunks[key]
+                    properties = {"id": key}
+                    if include_embeddings and key in self._rows:
+                        properties["embedding"] = self._embedding(key)
+                if content is not None:
+                    properties["content"] = content if include_content else content[:preview_chars]
+                nodes.append({
+                    "id": element_id,
+                    "label": "Unnamed",
+                    "type": "Document" if kind == "doc" else "Chunk",
+                    "properties": {name: value for name, value in properties.items() if value is not None}
+                })
+                relationships.extend(self._outgoing(element_id))
+        for node in nodes:
+            yield "node", node
+        for relationship in relationships:
+            yield "relationship", relationship
+        last = page[-1].partition(":") if page else None
+        next_cursor = f"{'Document' if last[0] == 'doc' else 'Chunk'}:{last[2]}" if last else None
+        yield "page", {"next_cursor": next_cursor if len(page) == limit else None, "nodes": len(page)}
+
+    def graph_summary(self, top_n: int = 200) -> dict:
+        with self._lock:
+            chunk_counts = {doc_id: len(chunks) for doc_id, chunks in self._contains.items() if doc_id in self._documents}
+            top = sorted(chunk_counts, key=chunk_counts.get, reverse=True)[:top_n]
+            top_set = set(top)
+            weights: Dict[Tuple[str, str, str], int] = {}
+            relationship_counts = {"CONTAINS": sum(chunk_counts.values()), "NEXT": 0, "SIMILAR_TO": 0}
+            for chunk_id in self._chunks:
+                for relationship in self._outgoing(f"chunk:{chunk_id}"):
+                    relationship_counts[relationship["type"]] += 1
+            for doc_id in top:
+                for chunk_id in set(self._contains[doc_id].values()):
+                    for relationship in self._outgoing(f"chunk:{chunk_id}"):
+                        target = relationship["endNode"].partition(":")[2]
+                        for other, _ in self._locations.get(target, ()):
+                            if other != doc_id and other in top_set:
+                                key = (f"doc:{doc_id}", f"doc:{other}", relationship["type"])
+                                weights[key] = weights.get(key, 0) + 1
+            counts = list(chunk_counts.values())
+            return {
+                "nodes": [
+                    {
+                        "id": f"doc:{doc_id}",
+                        "label": _document_label(doc_id, self._documents[doc_id]["metadata"]),
+                        "type": "Document",
+                        "properties": {"id": doc_id, "chunk_count": chunk_counts[doc_id], "degree": chunk_counts[doc_id], "collapsed": True}
+                    }
+                    for doc_id in top
+                ],
+                "relationships": [
+                    {"startNode": start, "endNode": end, "type": rel_type, "properties": {"weight": weight}}
+                    for (start, end, rel_type), weight in weights.items()
+                ],
+                "stats": {
+                    "total_nodes": len(self._documents) + len(self._chunks),
+                    "total_relationships": sum(relationship_counts.values()),
+                    "labels": {"Document": len(self._documents), "Chunk": len(self._chunks)},
+                    "relationship_types": relationship_counts,
+                    "chunks_per_document": {
+                        "min": min(counts, default=None),
+                        "max": max(counts, default=None),
+                        "mean": sum(counts) / len(counts) if counts else None,
+                        "median": _percentile_disc(counts, 0.5),
+                        "p95": _percentile_disc(counts, 0.95)
+                    },
+                    "documents_shown": len(top)
+                }
+            }
+
+    def document_neighborhood(self, doc_id: str, limit: int = 500, preview_chars: int = 200) -> Optional[dict]:
+        with self._lock:
+            if doc_id not in self._documents:
+                return None
+            chunk_ids = [chunk_id for _, chunk_id in sorted(self._contains[doc_id].items())][:limit]
+            doc_element_id = f"doc:{doc_id}"
+            nodes = [{
+                "id": doc_element_id,
+                "label": _document_label(doc_id, self._documents[doc_id]["metadata"]),
+                "type": "Document",
+                "properties": {"id": doc_id, "chunk_count": len(chunk_ids)}
+            }]
+            relationships = []
+            for chunk_id in chunk_ids:
+                nodes.append({
+                    "id": f"chunk:{chunk_id}",
+                    "label": "Unnamed",
+                    "type": "Chunk",
+                    "properties": {"id": chunk_id, "content": self._chunks[chunk_id][:preview_chars]}
+                })
+                relationships.append({"startNode": doc_element_id, "endNode": f"chunk:{chunk_id}", "type": "CONTAINS", "properties": {}})
+            for chunk_id in dict.fromkeys(chunk_ids):
+                relationships.extend(self._outgoing(f"chunk:{chunk_id}"))
+            return {"nodes": nodes, "relationships": relationships}
+
+
+class _MemorySession:
+    """Stands in for a session in the health check's `RETURN 1`."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def run(self, query: str, **parameters):
+        return None
+
+
+class AsyncMemoryStore:
+    """The `AsyncNeo4jConnection` methods over a `MemoryStore`."""
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def connect_with_retry(self, max_retries=5, retry_delay=5):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get_session(self):
+        return _MemorySession()
+
+    async def search_similar_chunks(self, embedding: list, limit: int = 5) -> List[dict]:
+        return self.store.search_similar_chunks(embedding, limit)
+
+    async def search_similar_chunks_batch(self, embeddings: List[list], limit: int = 5) -> List[List[dict]]:
+        return self.store.search_similar_chunks_batch(embeddings, limit)
+
+    async def expand_similar_chunks(self, embedding: list, seeds: int, per_seed: int,
+                                    neighbors: int) -> Tuple[List[dict], List[dict]]:
+        return self.store.expand_similar_chunks(embedding, seeds, per_seed, neighbors)
+
+    async def get_chunks_by_ids(self, chunk_ids: List[str], include_embedding: bool = False) -> dict:
+        return self.store.get_chunks_by_ids(chunk_ids, include_embedding)
+
+    async def get_index_status(self, name: str) -> Optional[dict]:
+        return {"state": "ONLINE", "population_percent": 100.0}
+
+
+def install() -> MemoryStore:
+    """Swap the app's Neo4j connections for in-memory stores and skip schema setup.
+
+    Must run before any other app module imports `db` or `async_db`.
+    """
+    from app.core import database
+
+    store = MemoryStore()
+    database.db = store
+    database.async_db = AsyncMemoryStore(store)
+    from app.core import init_db
+
+    init_db.initialize_database = lambda wait_timeout=None: True
+    return store
@@ -0,0 +1,35 @@
+"""Run the API without Neo4j, on the in-memory store from memory_store.py.
+
+    OLLAMA_BASE_URL=http://127.0.0.1:11434 python benchmarks/offline_api.py --port 8001
+
+Point OLLAMA_BASE_URL at benchmarks/fake_ollama.py (or a real Ollama).
+Every other setting comes from the environment as usual. With --neo4j the
+API uses the Neo4j at NEO4J_URI instead, e.g. a throwaway container.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--neo4j", action="store_true", help="Use the Neo4j at NEO4J_URI instead of the in-memory store")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    if not args.neo4j:
+        from memory_store import install
+        install()
+
+    import uvicorn
+    from app.api.main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""Reproducible offline benchmark of ingestion, querying and graph reads.
+
+Starts benchmarks/fake_ollama.py and the API (benchmarks/offline_api.py,
+on the in-memory graph store) as subprocesses, then for every corpus size:
+
+  1. uploads a deterministic synthetic corpus to /documents at
+     --ingest-concurrency and waits for every ingestion job,
+  2. drives /query with each --clients level, reading the compact SSE
+     stream to measure time to first answer token and total latency,
+  3. pages through /graph and fetches /graph/summary and
+     /graph/documents/{id} at each --clients level.
+
+Each corpus size gets a fresh API process. Results (throughput,
+p50/p95/p99 latencies, TTFT and the API's peak RSS) are written as JSON,
+and --baseline prints the change against an earlier run:
+
+    python benchmarks/offline_suite.py --output after.json --baseline before.json
+
+Model latency is fixed by the fake Ollama flags, so differences between
+runs come from the application. App settings can be overridden with
+--set, e.g. --set VECTOR_SEARCH_MODE=local. Pass --neo4j-uri to run
+against a real, empty Neo4j (e.g. a throwaway neo4j:5.17 container)
+instead of the in-memory store.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from query_concurrency import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+SUITE_VERSION = 1
+PERCENTILES = (50, 95, 99)
+
+COMMON_WORDS = (
+    "the of and to in is that for it as with was on be by this are from at or an which have not "
+    "system data process result value model table section figure report method analysis level"
+).split()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_vocabulary(rng: random.Random, size: int) -> list:
+    syllables = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "po", "da", "fe", "gu", "hi", "ja", "bo"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_corpus(documents: int, doc_chars: int, topics: int, seed: int):
+    """Return deterministic (filename, text) documents and questions about their topics.
+
+    Every document is about one of `topics` topics: most of its words come
+    from that topic's vocabulary, so questions using those words retrieve it.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, topics * 40)
+    topic_words = [vocabulary[i * 40:(i + 1) * 40] for i in range(topics)]
+    corpus = []
+    for i in range(documents):
+        words = topic_words[i % topics]
+        sentences, size = [], 0
+        while size < doc_chars:
+            sentence = " ".join(
+                rng.choice(words) if rng.random() < 0.6 else rng.choice(COMMON_WORDS)
+                for _ in range(rng.randint(8, 20))
+            ).capitalize() + "."
+            sentences.append(sentence)
+            size += len(sentence) + 1
+        corpus.append((f"doc-{i:05d}.txt", " ".join(sentences)))
+    questions = [
+        f"What does the documentation say about {' and '.join(rng.sample(topic_words[i % topics], 3))}?"
+        for i in range(max(topics, 50))
+    ]
+    return corpus, questions
+
+
+def summarize(values_ms: list) -> dict:
+    summary = {f"p{p}": percentile(values_ms, p) for p in PERCENTILES}
+    summary["mean"] = statistics.mean(values_ms) if values_ms else None
+    summary["max"] = max(values_ms) if values_ms else None
+    return summary
+
+
+def peak_rss_mb(pid: int):
+    """Peak resident set size of a running process, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Processes:
+    """The fake Ollama and API subprocesses of one scenario."""
+
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.ollama = None
+        self.api = None
+        self.api_url = None
+        self.log_path = None
+
+    def start(self, name: str):
+        args = self.args
+        ollama_port, api_port = free_port(), free_port()
+        self.log_path = os.path.join(self.workdir, f"{name}.log")
+        log = open(self.log_path, "w")
+        self.ollama = subprocess.Popen([
+            sys.executable, os.path.join(BENCHMARKS, "fake_ollama.py"),
+            "--port", str(ollama_port),
+            "--dimensions", str(args.dimensions),
+            "--embed-ms", str(args.embed_ms),
+            "--embed-per-text-ms", str(args.embed_per_text_ms),
+            "--ttft-ms", str(args.ttft_ms),
+            "--token-ms", str(args.token_ms),
+            "--tokens", str(args.tokens)
+        ], stdout=log, stderr=subprocess.STDOUT)
+
+        data = os.path.join(self.workdir, name)
+        env = {
+            **os.environ,
+            "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+            "EMBEDDING_DIMENSIONS": str(args.dimensions),
+            "EMBEDDING_CACHE_DIR": os.path.join(data, "embedding_cache"),
+            "INGEST_UPLOAD_DIR": os.path.join(data, "uploads"),
+            "VECTOR_INDEX_PATH": os.path.join(data, "vector_index"),
+            "RATE_LIMIT_SQLITE_PATH": os.path.join(data, "rate_limit.sqlite"),
+            # One client address sends everything, and repeated questions shouldn't be answered from cache
+            "RATE_LIMIT_ENABLED": "false",
+            "ANSWER_CACHE_ENABLED": "false",
+            # Measure computing the summary, not the cache
+            "GRAPH_SUMMARY_TTL": "0",
+            "PYTHONPATH": ROOT
+        }
+        if args.neo4j_uri:
+            env["NEO4J_URI"] = args.neo4j_uri
+        for setting in args.set:
+            key, _, value = setting.partition("=")
+            env[key] = value
+        command = [sys.executable, os.path.join(BENCHMARKS, "offline_api.py"), "--port", str(api_port)]
+        if args.neo4j_uri:
+            command.append("--neo4j")
+        self.api = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.api_url = f"http://127.0.0.1:{api_port}"
+
+    async def wait_ready(self, timeout: float = 120.0):
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                if self.api.poll() is not None:
+                    with open(self.log_path) as f:
+                        log = "".join(f.readlines()[-20:])
+                    raise RuntimeError(f"API exited with code {self.api.returncode}:\n{log}")
+                try:
+                    async with session.get(f"{self.api_url}/health") as response:
+                        if response.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"API not ready after {timeout:.0f}s")
+
+    def stop(self):
+        for process in (self.api, self.ollama):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+
+async def ingest(url: str, corpus: list, concurrency: int, poll_interval: float = 0.05) -> dict:
+    """Upload every document at `concurrency` and wait for all ingestion jobs."""
+    semaphore = asyncio.Semaphore(concurrency)
+    uploads, completions, jobs, errors = [], [], [], []
+
+    async def upload(session: aiohttp.ClientSession, filename: str, text: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                form = aiohttp.FormData()
+                form.add_field("file", text.encode("utf-8"), filename=filename, content_type="text/plain")
+                async with session.post(f"{url}/documents", data=form) as response:
+                    response.raise_for_status()
+                    job_id = (await response.json())["job_id"]
+                uploads.append((time.perf_counter() - start) * 1000)
+                while True:
+                    async with session.get(f"{url}/documents/jobs/{job_id}") as response:
+                        job = await response.json()
+                    if job["status"] in ("completed", "completed_with_errors", "failed"):
+                        break
+                    await asyncio.sleep(poll_interval)
+                completions.append((time.perf_counter() - start) * 1000)
+                jobs.append(job)
+                if job["status"] != "completed":
+                    errors.append(job.get("error") or job["status"])
+            except Exception as e:
+                errors.append(str(e))
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=600)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[upload(session, filename, text) for filename, text in corpus])
+        elapsed = time.perf_counter() - start
+
+    chunks = sum(job["chunks_written"] for job in jobs)
+    return {
+        "documents": len(corpus),
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "seconds": elapsed,
+        "documents_per_second": len(jobs) / elapsed if elapsed else 0.0,
+        "chunks": chunks,
+        "chunks_per_second": chunks / elapsed if elapsed else 0.0,
+        "upload_ms": summarize(uploads),
+        "job_ms": summarize(completions)
+    }
+
+
+async def run_query(session: aiohttp.ClientSession, url: str, question: str):
+    """Return (time to first byte, time to first answer token, total) in ms for one /query."""
+    start = time.perf_counter()
+    first_byte = first_token = None
+    buffer = ""
+    async with session.post(f"{url}/query", json={"text": question, "format": "compact"}) as response:
+        response.raise_for_status()
+        async for data in response.content.iter_any():
+            now = time.perf_counter()
+            if first_byte is None:
+                first_byte = now
+            if first_token is None:
+                buffer += data.decode("utf-8", errors="replace")
+                if "event: t\n" in buffer or '"chunk"' in buffer:
+                    first_token = now
+    end = time.perf_counter()
+    return (
+        (first_byte - start) * 1000 if first_byte else None,
+        (first_token - start) * 1000 if first_token else None,
+        (end - start) * 1000
+    )
+
+
+async def drive(clients: int, requests_per_client: int, request):
+    """Run `request(session, i)` back to back from `clients` clients; return results, errors and seconds."""
+    results, errors = [], []
+
+    async def client(session: aiohttp.ClientSession, offset: int):
+        for i in range(requests_per_client):
+            try:
+                results.append(await request(session, offset * requests_per_client + i))
+            except Exception as e:
+                errors.append(str(e))
+
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=clients)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session, offset) for offset in range(clients)])
+        elapsed = time.perf_counter() - start
+    return results, errors, elapsed
+
+
+async def query_level(url: str, clients: int, requests_per_client: int, questions: list) -> dict:
+    results, errors, elapsed = await drive(
+        clients, requests_per_client,
+        lambda session, i: run_query(session, url, questions[i % len(questions)])
+    )
+    return {
+        "clients": clients,
+        "requests": len(results),
+        "errors": len(errors),
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "ttfb_ms": summarize([r[0] for r in results if r[0] is not None]),
+        "ttft_ms": summarize([r[1] for r in results if r[1] is not None]),
+        "latency_ms": summarize([r[2] for r in results])
+    }
+
+
+async def timed_get(session: aiohttp.ClientSession, url: str):
+    start = time.perf_counter()
+    async with session.get(url) as response:
+        response.raise_for_status()
+        body = await response.read()
+    return (time.perf_counter() - start) * 1000, len(body)
+
+
+async def graph_walk(url: str, page_size: int) -> dict:
+    """Page through the whole graph with /graph cursors."""
+    pages, cursor, nodes, size = [], None, 0, 0
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=600)) as session:
+        start = time.perf_counter()
+        while True:
+            params = {"limit": page_size, **({"cursor": cursor} if cursor else {})}
+            page_start = time.perf_counter()
+            async with session.get(f"{url}/graph", params=params) as response:
+                response.raise_for_status()
+                body = await response.read()
+            pages.append((time.perf_counter() - page_start) * 1000)
+            page = json.loads(body)
+            nodes += len(page["nodes"])
+            size += len(body)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        elapsed = time.perf_counter() - start
+    return {
+        "page_size": page_size,
+        "pages": len(pages),
+        "nodes": nodes,
+        "bytes": size,
+        "seconds": elapsed,
+        "nodes_per_second": nodes / elapsed if elapsed else 0.0,
+        "page_ms": summarize(pages)
+    }
+
+
+async def graph_level(url: str, clients: int, requests_per_client: int, doc_ids: list) -> dict:
+    level = {"clients": clients}
+    endpoints = {
+        "summary": lambda i: f"{url}/graph/summary",
+        "document": lambda i: f"{url}/graph/documents/{doc_ids[i % len(doc_ids)]}",
+        "page": lambda i: f"{url}/graph?limit=500"
+    }
+    for name, endpoint in endpoints.items():
+        results, errors, elapsed = await drive(
+            clients, requests_per_client, lambda session, i: timed_get(session, endpoint(i))
+        )
+        level[name] = {
+            "requests": len(results),
+            "errors": len(errors),
+            "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+            "latency_ms": summarize([r[0] for r in results]),
+            "bytes_mean": statistics.mean(r[1] for r in results) if results else None
+        }
+    return level
+
+
+async def run_scenario(args, processes: Processes, documents: int) -> dict:
+    corpus, questions = make_corpus(documents, args.doc_chars, args.topics, args.seed)
+    await processes.wait_ready()
+    url = processes.api_url
+    scenario = {"corpus_documents": documents}
+
+    print(f"[{documents} docs] ingesting at concurrency {args.ingest_concurrency}", flush=True)
+    scenario["ingest"] = await ingest(url, corpus, args.ingest_concurrency)
+    print(
+        f"[{documents} docs] ingest: {scenario['ingest']['documents_per_second']:.1f} docs/s, "
+        f"{scenario['ingest']['chunks_per_second']:.0f} chunks/s, errors={scenario['ingest']['errors']}", flush=True
+    )
+
+    scenario["query"] = []
+    for clients in args.clients:
+        level = await query_level(url, clients, args.requests_per_client, questions)
+        scenario["query"].append(level)
+        print(
+            f"[{documents} docs] query clients={clients:<4} rps={level['throughput_rps']:.2f} errors={level['errors']} "
+            f"ttft p50/p99={level['ttft_ms']['p50'] or 0:.0f}/{level['ttft_ms']['p99'] or 0:.0f}ms "
+            f"latency p50/p95/p99={level['latency_ms']['p50'] or 0:.0f}/{level['latency_ms']['p95'] or 0:.0f}/"
+            f"{level['latency_ms']['p99'] or 0:.0f}ms", flush=True
+        )
+
+    scenario["graph_walk"] = await graph_walk(url, args.graph_page_size)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{url}/graph/summary?top_n={documents}") as response:
+            doc_ids = [node["properties"]["id"] for node in (await response.json())["nodes"]]
+    scenario["graph"] = []
+    for clients in args.clients:
+        level = await graph_level(url, clients, args.requests_per_client, doc_ids or ["missing"])
+        scenario["graph"].append(level)
+        print(
+            f"[{documents} docs] graph clients={clients:<4} "
+            + " ".join(f"{name} p50={level[name]['latency_ms']['p50'] or 0:.1f}ms" for name in ("summary", "document", "page")),
+            flush=True
+        )
+
+    scenario["api_peak_rss_mb"] = peak_rss_mb(processes.api.pid)
+    return scenario
+
+
+def compare(result: dict, baseline: dict):
+    """Print the change of the headline numbers against a baseline result."""
+    def rows(run):
+        for scenario in run["scenarios"]:
+            prefix = f"{scenario['corpus_documents']} docs"
+            yield f"{prefix} ingest chunks/s", scenario["ingest"]["chunks_per_second"]
+            for level in scenario["query"]:
+                yield f"{prefix} query c={level['clients']} rps", level["throughput_rps"]
+                yield f"{prefix} query c={level['clients']} ttft p50 ms", level["ttft_ms"]["p50"]
+                yield f"{prefix} query c={level['clients']} latency p99 ms", level["latency_ms"]["p99"]
+            for level in scenario["graph"]:
+                for name in ("summary", "document", "page"):
+                    yield f"{prefix} graph {name} c={level['clients']} p50 ms", level[name]["latency_ms"]["p50"]
+            yield f"{prefix} api peak rss mb", scenario["api_peak_rss_mb"]
+
+    before = dict(rows(baseline))
+    for name, value in rows(result):
+        old = before.get(name)
+        if old is None or value is None:
+            continue
+        change = (value - old) / old * 100 if old else 0.0
+        print(f"{name:<48} {old:>10.1f} -> {value:>10.1f}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[20, 100], help="Documents per scenario")
+    parser.add_argument("--doc-chars", type=int, default=8000, help="Characters per synthetic document")
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ingest-concurrency", type=int, default=4)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests-per-client", type=int, default=10)
+    parser.add_argument("--graph-page-size", type=int, default=1000)
+    parser.add_argument("--dimensions", type=int, default=768, help="Fake embedding dimensions")
+    parser.add_argument("--embed-ms", type=float, default=5.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.5)
+    parser.add_argument("--ttft-ms", type=float, default=100.0)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="Override an API setting")
+    parser.add_argument("--neo4j-uri", help="Use this (empty) Neo4j instead of the in-memory store")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against the JSON of an earlier run")
+    args = parser.parse_args()
+
+    result = {
+        "suite_version": SUITE_VERSION,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "scenarios": []
+    }
+    with tempfile.TemporaryDirectory(prefix="graph-rag-bench-") as workdir:
+        for documents in args.corpus_sizes:
+            processes = Processes(args, workdir)
+            try:
+                processes.start(f"corpus-{documents}")
+                result["scenarios"].append(asyncio.run(run_scenario(args, processes, documents)))
+            finally:
+                processes.stop()
+    # Largest of all children that have exited, including the fake Ollama; a fallback where /proc is missing
+    result["children_peak_rss_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Measure /query latency under N parallel clients.
+
+Run it against a deployment before and after a change and compare the
+percentiles, e.g.:
+
+    python benchmarks/query_concurrency.py --url http://localhost:8001 --clients 1 8 32
+
+Each client sends queries back to back and reads the SSE stream to the
+end. Time to first byte and total latency are reported per concurrency
+level as p50/p95/p99.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+
+DEFAULT_QUESTIONS = [
+    "What is this document about?",
+    "Summarize the main points.",
+    "What are the key requirements?",
+    "Which steps are described in the procedure?"
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_query(session, url, question):
+    start = time.perf_counter()
+    first_byte = None
+    async with session.post(f"{url}/query", json={"text": question}) as response:
+        response.raise_for_status()
+        async for _ in response.content.iter_any():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    return first_byte, time.perf_counter() - start
+
+
+async def client(session, url, questions, requests_per_client, results, errors):
+    for i in range(requests_per_client):
+        try:
+            results.append(await run_query(session, url, questions[i % len(questions)]))
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def run_level(url, clients, requests_per_client, questions):
+    results, errors = [], []
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=clients)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client(session, url, questions, requests_per_client, results, errors)
+            for _ in range(clients)
+        ])
+        elapsed = time.perf_counter() - start
+
+    ttfb = [r[0] * 1000 for r in results if r[0] is not None]
+    total = [r[1] * 1000 for r in results]
+    return {
+        "clients": clients,
+        "requests": len(results),
+        "errors": len(errors),
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "ttfb_ms": {p: percentile(ttfb, p) for p in (50, 95, 99)},
+        "latency_ms": {p: percentile(total, p) for p in (50, 95, 99)},
+        "latency_mean_ms": statistics.mean(total) if total else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests-per-client", type=int, default=10)
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    levels = []
+    for clients in args.clients:
+        level = asyncio.run(run_level(args.url, clients, args.requests_per_client, questions))
+        levels.append(level)
+        print(
+            f"clients={clients:<4} requests={level['requests']:<5} errors={level['errors']:<3} "
+            f"rps={level['throughput_rps']:.2f} "
+            f"ttfb p50/p99={level['ttfb_ms'][50] or 0:.0f}/{level['ttfb_ms'][99] or 0:.0f}ms "
+            f"latency p50/p95/p99={level['latency_ms'][50] or 0:.0f}/{level['latency_ms'][95] or 0:.0f}/{level['latency_ms'][99] or 0:.0f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": args.url, "levels": levels}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()